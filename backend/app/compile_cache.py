@@ -0,0 +1,180 @@
+"""
+编译产物缓存
+按 (语言, 编译器路径, 编译参数, 源代码) 的哈希缓存可执行文件和 Java class 目录，
+重测、同步提交以及重复提交相同代码时可以直接复用，跳过编译。
+
+同一缓存目录可以由多个评测进程共享：命中以目录中是否存在条目为准，
+容量上限按目录的实际占用计算——每次写入后在文件锁下扫描目录，按 mtime 淘汰最久未使用的条目，
+而不是各进程各自维护一份索引（那样总占用会达到上限的进程数倍）。
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from functools import lru_cache
+from threading import Lock
+from typing import List, Tuple
+
+try:
+    import fcntl
+except ImportError:  # 非 POSIX 平台只做进程内互斥
+    fcntl = None
+
+from app.config import get_settings
+
+# 目录中的跨进程锁文件
+LOCK_FILE_NAME = '.lock'
+# 超过该时间的临时目录视为异常退出遗留的半成品（秒）
+STALE_TMP_SECONDS = 3600
+
+
+class CompileCache:
+    """基于内容哈希的磁盘编译缓存（带容量上限，LRU 淘汰）"""
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        """
+        初始化编译缓存
+
+        Args:
+            cache_dir: 缓存目录，每个条目是其中一个以哈希命名的子目录
+            max_bytes: 缓存总大小上限（字节），<= 0 表示禁用缓存
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = Lock()
+        # 最近一次扫描目录得到的条目数和总大小，仅用于统计
+        self._entry_count = 0
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+        if self.enabled:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._enforce_limit()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def make_key(language: str, compiler: str, flags: List[str], code: str) -> str:
+        """计算缓存键：语言、编译器路径、编译参数和源代码共同决定编译产物"""
+        h = hashlib.sha256()
+        for part in (language.lower(), compiler, '\0'.join(flags)):
+            h.update(part.encode('utf-8'))
+            h.update(b'\0')
+        h.update(code.encode('utf-8'))
+        return h.hexdigest()
+
+    def get(self, key: str, dest_dir: str) -> bool:
+        """
+        命中时把缓存条目中的文件复制到 dest_dir
+
+        复制而不是直接引用缓存文件，保证条目被淘汰时不会影响正在运行的评测。
+
+        Returns:
+            是否命中
+        """
+        if not self.enabled:
+            return False
+        entry_dir = os.path.join(self.cache_dir, key)
+        if os.path.isdir(entry_dir):
+            try:
+                for name in os.listdir(entry_dir):
+                    shutil.copy2(os.path.join(entry_dir, name), os.path.join(dest_dir, name))
+                # 更新 mtime，淘汰时按 mtime 判断最近使用
+                os.utime(entry_dir)
+                with self._lock:
+                    self.hits += 1
+                return True
+            except OSError:
+                # 条目可能已被其他进程淘汰，按未命中处理
+                pass
+        with self._lock:
+            self.misses += 1
+        return False
+
+    def put(self, key: str, files: List[str]):
+        """把一次成功编译的产物文件存入缓存"""
+        if not self.enabled:
+            return
+        entry_dir = os.path.join(self.cache_dir, key)
+        tmp_dir = os.path.join(self.cache_dir, f'.tmp-{key}-{uuid.uuid4().hex}')
+        try:
+            os.makedirs(tmp_dir)
+            for path in files:
+                shutil.copy2(path, os.path.join(tmp_dir, os.path.basename(path)))
+            # 先写临时目录再原子重命名，其他线程/进程不会看到写了一半的条目
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # 目标已存在（并发编译了相同代码）或磁盘错误，放弃本次写入
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+
+        self._enforce_limit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': self._entry_count,
+                'size_bytes': self._total_bytes,
+                'max_bytes': self.max_bytes
+            }
+
+    def _enforce_limit(self):
+        """在跨进程文件锁下扫描缓存目录，超出容量时按 mtime 淘汰最久未使用的条目"""
+        with self._lock, open(os.path.join(self.cache_dir, LOCK_FILE_NAME), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            entries = self._scan()
+            total = sum(size for _, _, size in entries)
+            count = len(entries)
+            for _, name, size in entries:
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+                total -= size
+                count -= 1
+            self._entry_count = count
+            self._total_bytes = total
+
+    def _scan(self) -> List[Tuple[float, str, int]]:
+        """
+        扫描缓存目录，顺带清理异常退出遗留的临时目录
+
+        Returns:
+            [(mtime, 条目名, 大小)]，最久未使用的在前
+        """
+        entries = []
+        now = time.time()
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            try:
+                if name.startswith('.tmp-'):
+                    # 其他进程可能正在写入，只清理足够旧的
+                    if now - os.path.getmtime(path) > STALE_TMP_SECONDS:
+                        shutil.rmtree(path, ignore_errors=True)
+                    continue
+                if not os.path.isdir(path):
+                    continue
+                size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+                entries.append((os.path.getmtime(path), name, size))
+            except OSError:
+                # 扫描期间被其他进程淘汰
+                continue
+        entries.sort()
+        return entries
+
+
+@lru_cache()
+def get_compile_cache() -> CompileCache:
+    settings = get_settings()
+    cache_dir = settings.JUDGE_COMPILE_CACHE_DIR or os.path.join(
+        settings.JUDGE_TEMP_DIR or tempfile.gettempdir(), 'codefuse_compile_cache'
+    )
+    return CompileCache(cache_dir, settings.JUDGE_COMPILE_CACHE_MAX_MB * 1024 * 1024)
@@ -34,6 +34,30 @@ class Settings(BaseSettings):
     JUDGE_DEFAULT_TIMEOUT: int              # 默认超时时间(秒)
     JUDGE_DEFAULT_MEMORY_LIMIT: int         # 默认内存限制(MB)
     JUDGE_MAX_WORKERS: int                  # 并发评测线程数
+    JUDGE_CASE_PARALLELISM: int = 1         # 单个提交内并行运行的测试点数(1 表示顺序执行)
+    JUDGE_COMPILE_CACHE_DIR: str = ''       # 编译缓存目录(空表示使用临时目录下的 codefuse_compile_cache)
+    JUDGE_COMPILE_CACHE_MAX_MB: int = 512   # 编译缓存容量上限(MB)，0 表示禁用
+    JUDGE_IO_DIR: str = ''                  # 测试点输入/输出文件目录(空表示优先使用 /dev/shm)
+    JUDGE_TEST_DATA_DIR: str = ''           # 测试数据本地缓存目录(空表示使用临时目录下的 codefuse_test_data)
+    JUDGE_TEST_DATA_CACHE_MAX_MB: int = 2048  # 测试数据本地缓存容量上限(MB)，0 表示不限制
+    JUDGE_TEST_DATA_GC_INTERVAL_SECONDS: int = 3600  # 清除不再被题目引用的测试数据的间隔(秒)，0 表示不自动清除
+    JUDGE_OUTPUT_LIMIT_MB: int = 64         # 单个测试点输出上限(MB)，超出判为输出超限
+    JUDGE_PYTHON_ZYGOTE: bool = False       # Python 测试点是否从预热的解释器 fork 运行(仅 POSIX)
+    JUDGE_JAVA_CDS: bool = True             # Java 是否使用类数据共享(CDS)归档加速 JVM 启动
+    JUDGE_JOB_LEASE_SECONDS: int = 120      # 评测任务心跳超时(秒)，超时的任务重新入队
+    JUDGE_JOB_HEARTBEAT_SECONDS: int = 10   # 评测进程刷新心跳、回收任务的间隔(秒)
+    JUDGE_JOB_MAX_ATTEMPTS: int = 3         # 同一任务最多被领取的次数，超出判为 system_error
+    JUDGE_SHUTDOWN_DRAIN_SECONDS: int = 30  # 关闭时等待进行中评测完成的最长时间(秒)
+    JUDGE_IN_PROCESS: bool = True           # 是否在 API 进程内评测(False 时由 app.judge_daemon 评测)
+    JUDGE_DAEMON_POLL_SECONDS: float = 1.0  # 评测守护进程队列为空时的轮询间隔(秒)
+    JUDGE_PROBLEM_MAX_RUNNING: int = 4      # 同一题目同时评测的任务数上限(所有评测进程合计)，0 表示不限制
+    JUDGE_QUEUE_MAX_PENDING: int = 2000     # 评测队列中未完成任务数上限，超出时提交返回 429，0 表示不限制
+    JUDGE_USER_MAX_IN_FLIGHT: int = 5       # 每个用户未完成的提交数上限，超出时提交返回 429，0 表示不限制
+    JUDGE_EVENTS_POLL_SECONDS: float = 0.5  # 有推送订阅者时读取其他进程评测事件的间隔(秒)
+    JUDGE_EVENTS_RETENTION_SECONDS: int = 600  # 评测事件在数据库中的保留时间(秒)
+    JUDGE_PROGRESS_INTERVAL_SECONDS: float = 1.0  # 评测进度的合并发布间隔(秒)，0 表示不发布进度
+    JUDGE_VERDICT_MEMO: bool = True  # 相同题目配置、语言和代码复用已有评测结果
+    JUDGE_PROBLEM_CACHE_SIZE: int = 64  # 评测进程内缓存解析后测试点的题目数，0 表示禁用
     
     @property
     def DATABASE_URL(self) -> str:
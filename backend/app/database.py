@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.config import get_settings
@@ -108,3 +108,33 @@ def fetch_one(db, query: str, params: Dict[str, Any] = None) -> Optional[Dict[st
         columns = result.keys()
         return dict(zip(columns, row))
     return None
+
+
+def ensure_model_columns():
+    """
+    为已存在的表补齐模型中新增的列
+
+    Base.metadata.create_all 只会创建缺失的表，不会修改已有表结构。启动时调用本函数，
+    把模型里有、数据库里没有的列以可空列（或带 server_default）的形式补上，
+    模型中声明、数据库里还没有的索引（包括新增列上的 index=True 和 __table_args__ 中的 Index）
+    也一并创建，老数据库无需手工执行 ALTER TABLE。
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_columns = {col['name'] for col in inspector.get_columns(table.name)}
+            existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                ddl = f"ALTER TABLE `{table.name}` ADD COLUMN `{column.name}` {column_type} NULL"
+                if column.server_default is not None:
+                    ddl += f" DEFAULT {column.server_default.arg}"
+                conn.execute(text(ddl))
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(conn)
@@ -0,0 +1,252 @@
+"""
+输出比较器
+按行流式比较选手输出与期望输出：忽略行尾空白和空行，遇到第一处不同立即停止，
+并给出第一处不同所在的行号和列号。
+
+期望输出的规范化摘要（sha256 + 长度）在保存测试点时预先计算并存入测试点 JSON 的
+output_digest 字段，通过的提交只需对实际输出做一遍流式哈希，不再逐行比较。
+同时写入 data_hash（输入和期望输出的哈希），用于增量重测判断测试点数据是否变化；
+题目上的 test_data_hash 是整套测试数据（含各测试点分数）的哈希，变化时 test_data_version 加一。
+
+已存入 test_blob 的测试点（见 app.test_data）期望输出以只读 mmap 传入，比较时按行读取，不整体解码为字符串。
+
+题目可以通过 checker_type 选择其他比较方式：exact（完全一致）、token（按单词）、
+float（按单词，数值允许误差）以及 custom（运行题目提供的检查器程序）。
+"""
+import hashlib
+import io
+import math
+import mmap
+from contextlib import contextmanager
+from itertools import zip_longest
+from typing import BinaryIO, Iterable, Iterator, Optional, Tuple, Union
+
+# 期望输出：字符串，或期望输出文件的只读 mmap（见 open_expected_output）
+Expected = Union[str, mmap.mmap]
+
+# 检查器类型
+CHECKER_LINE = 'line'      # 默认：忽略行尾空白和空行后逐行比较
+CHECKER_EXACT = 'exact'    # 逐字节完全一致
+CHECKER_TOKEN = 'token'    # 按空白分隔的单词逐个比较，忽略空白的数量和种类
+CHECKER_FLOAT = 'float'    # 同 token，数值单词允许 epsilon 以内的绝对/相对误差
+CHECKER_CUSTOM = 'custom'  # 题目提供的检查器程序（special judge）
+CHECKER_TYPES = (CHECKER_LINE, CHECKER_EXACT, CHECKER_TOKEN, CHECKER_FLOAT, CHECKER_CUSTOM)
+
+DEFAULT_FLOAT_EPSILON = 1e-6
+
+
+def _normalized_lines(lines: Iterable[bytes]) -> Iterator[Tuple[int, bytes]]:
+    """逐行去除行尾空白并跳过空行，产出 (原始行号, 规范化后的行)"""
+    for lineno, line in enumerate(lines, 1):
+        line = line.rstrip()
+        if line:
+            yield lineno, line
+
+
+def _expected_lines(expected: Expected) -> Iterator[bytes]:
+    """按行（保留换行符）读取期望输出"""
+    if isinstance(expected, mmap.mmap):
+        expected.seek(0)
+        return iter(expected.readline, b'')
+    return iter(io.BytesIO((expected or '').encode('utf-8')))
+
+
+@contextmanager
+def open_expected_output(path: str):
+    """以只读 mmap 打开期望输出文件；空文件无法映射，此时得到空字符串"""
+    with open(path, 'rb') as f:
+        if f.seek(0, io.SEEK_END) == 0:
+            yield ''
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield mapped
+        finally:
+            mapped.close()
+
+
+def expected_output_digest(expected: str) -> dict:
+    """
+    计算期望输出规范化后的摘要
+
+    规范化内容为所有非空行（去除行尾空白）各自加上换行符后依次拼接。
+
+    Returns:
+        {'sha256': 十六进制摘要, 'length': 规范化内容的字节数}
+    """
+    h = hashlib.sha256()
+    length = 0
+    for _, line in _normalized_lines(io.BytesIO((expected or '').encode('utf-8'))):
+        h.update(line)
+        h.update(b'\n')
+        length += len(line) + 1
+    return {'sha256': h.hexdigest(), 'length': length}
+
+
+def test_data_hash(input_data: str, output_data: str) -> str:
+    """测试点数据（输入和期望输出）的哈希，数据不变则评测结果不变"""
+    h = hashlib.sha256()
+    h.update((input_data or '').encode('utf-8'))
+    h.update(b'\0')
+    h.update((output_data or '').encode('utf-8'))
+    return h.hexdigest()
+
+
+def test_case_data_hash(test_case: dict) -> str:
+    """测试点的 data_hash，旧数据没有预先计算时现场计算"""
+    return test_case.get('data_hash') or test_data_hash(test_case.get('input_data', ''), test_case.get('output_data', ''))
+
+
+def test_data_digest(test_cases: list) -> str:
+    """整套测试数据的哈希：按顺序组合各测试点的 data_hash、分数和是否样例
+
+    测试点数据、分数、数量或顺序变化时都会改变（版本号随之加一），
+    评测进程据此判断缓存的测试点是否过期（见 app.problem_cache）。
+    """
+    h = hashlib.sha256()
+    for tc in test_cases or []:
+        if isinstance(tc, dict):
+            h.update(test_case_data_hash(tc).encode('ascii'))
+            h.update(f"\0{tc.get('score', 10)}\0{tc.get('is_sample', 0)}\n".encode('ascii'))
+    return h.hexdigest()
+
+
+def with_output_digests(test_cases: list) -> list:
+    """为每个测试点（dict）写入 output_digest 和 data_hash 字段，返回原列表"""
+    for tc in test_cases:
+        if isinstance(tc, dict):
+            tc['output_digest'] = expected_output_digest(tc.get('output_data', '') or '')
+            tc['data_hash'] = test_data_hash(tc.get('input_data', ''), tc.get('output_data', ''))
+    return test_cases
+
+
+def compare_output_file(actual_path: str, expected: Expected, expected_digest: Optional[dict] = None) -> Tuple[bool, Optional[str]]:
+    """
+    比较输出文件与期望输出
+
+    有预先计算的摘要时先流式计算实际输出的摘要，一致即判定通过；
+    不一致或没有摘要时逐行比较，找到第一处不同后立即返回。
+
+    Args:
+        actual_path: 选手程序的输出文件
+        expected: 期望输出（字符串或期望输出文件的 mmap）
+        expected_digest: expected_output_digest 的结果，可为空
+
+    Returns:
+        (是否匹配, 不匹配时第一处不同的位置描述)
+    """
+    with open(actual_path, 'rb') as actual:
+        if expected_digest and _matches_digest(actual, expected_digest):
+            return True, None
+        actual.seek(0)
+        return _compare_lines(actual, expected)
+
+
+def _matches_digest(actual: BinaryIO, expected_digest: dict) -> bool:
+    """流式计算实际输出的规范化摘要，长度超过期望时提前结束"""
+    expected_length = expected_digest.get('length', 0)
+    h = hashlib.sha256()
+    length = 0
+    for _, line in _normalized_lines(actual):
+        length += len(line) + 1
+        if length > expected_length:
+            return False
+        h.update(line)
+        h.update(b'\n')
+    return length == expected_length and h.hexdigest() == expected_digest.get('sha256')
+
+
+def _compare_lines(actual: BinaryIO, expected: Expected) -> Tuple[bool, Optional[str]]:
+    """逐行比较，返回第一处不同的位置（行号为实际输出中的行号，列号从 1 开始）"""
+    expected_lines = _normalized_lines(_expected_lines(expected))
+    for actual_line, expected_line in zip_longest(_normalized_lines(actual), expected_lines):
+        if actual_line is None:
+            return False, f'输出不完整，缺少期望输出的第 {expected_line[0]} 行'
+        if expected_line is None:
+            return False, f'第 {actual_line[0]} 行起有多余的输出'
+        if actual_line[1] != expected_line[1]:
+            return False, f'第 {actual_line[0]} 行第 {_first_difference(actual_line[1], expected_line[1])} 列与期望输出不同'
+    return True, None
+
+
+def _first_difference(actual: bytes, expected: bytes) -> int:
+    """两行中第一个不同字符的列号（按字符计，从 1 开始）"""
+    actual_text = actual.decode('utf-8', errors='replace')
+    expected_text = expected.decode('utf-8', errors='replace')
+    for col, (a, e) in enumerate(zip(actual_text, expected_text), 1):
+        if a != e:
+            return col
+    return min(len(actual_text), len(expected_text)) + 1
+
+
+def check_output_file(
+    checker_type: Optional[str],
+    actual_path: str,
+    expected: Expected,
+    expected_digest: Optional[dict] = None,
+    epsilon: Optional[float] = None
+) -> Tuple[bool, Optional[str]]:
+    """
+    按内置检查器类型比较输出文件与期望输出（custom 类型由评测引擎运行检查器程序）
+
+    Returns:
+        (是否匹配, 不匹配时第一处不同的位置描述)
+    """
+    if checker_type == CHECKER_EXACT:
+        with open(actual_path, 'rb') as actual:
+            return _compare_exact(actual, expected)
+    if checker_type in (CHECKER_TOKEN, CHECKER_FLOAT):
+        tolerance = None
+        if checker_type == CHECKER_FLOAT:
+            tolerance = epsilon if epsilon is not None else DEFAULT_FLOAT_EPSILON
+        with open(actual_path, 'rb') as actual:
+            return _compare_tokens(actual, expected, tolerance)
+    return compare_output_file(actual_path, expected, expected_digest)
+
+
+def _compare_exact(actual: BinaryIO, expected: Expected) -> Tuple[bool, Optional[str]]:
+    """逐行（保留行尾）比较，任何字节不同都不通过"""
+    expected_lines = _expected_lines(expected)
+    for lineno, (actual_line, expected_line) in enumerate(zip_longest(actual, expected_lines), 1):
+        if actual_line is None:
+            return False, f'输出不完整，缺少期望输出的第 {lineno} 行'
+        if expected_line is None:
+            return False, f'第 {lineno} 行起有多余的输出'
+        if actual_line != expected_line:
+            return False, f'第 {lineno} 行第 {_first_difference(actual_line, expected_line)} 列与期望输出不同'
+    return True, None
+
+
+def _tokens(lines: Iterable[bytes]) -> Iterator[bytes]:
+    for line in lines:
+        yield from line.split()
+
+
+def _compare_tokens(actual: BinaryIO, expected: Expected, tolerance: Optional[float]) -> Tuple[bool, Optional[str]]:
+    """按单词比较；tolerance 不为空时两侧都能解析为数值的单词按误差比较"""
+    expected_tokens = _tokens(_expected_lines(expected))
+    for index, (actual_token, expected_token) in enumerate(zip_longest(_tokens(actual), expected_tokens), 1):
+        if actual_token is None:
+            return False, f'输出不完整，只有 {index - 1} 个单词'
+        if expected_token is None:
+            return False, f'第 {index} 个单词起有多余的输出'
+        if actual_token == expected_token:
+            continue
+        if tolerance is not None and _floats_close(actual_token, expected_token, tolerance):
+            continue
+        return False, f'第 {index} 个单词与期望输出不同'
+    return True, None
+
+
+def _floats_close(actual: bytes, expected: bytes, tolerance: float) -> bool:
+    """绝对误差或相对误差不超过 tolerance 即视为相等"""
+    try:
+        a = float(actual)
+        e = float(expected)
+    except ValueError:
+        return False
+    if math.isnan(a) or math.isnan(e):
+        return math.isnan(a) and math.isnan(e)
+    if math.isinf(a) or math.isinf(e):
+        return a == e
+    return abs(a - e) <= tolerance * max(1.0, abs(e))
@@ -0,0 +1,89 @@
+"""
+评测任务的代价估计
+
+评测调度按估计代价做同一优先级内的短任务优先。估计值（毫秒）：
+
+    编译开销 + 测试点数 × (语言启动开销 + 每个测试点的预计运行时间)
+
+每个测试点的预计运行时间取该题该语言最近已评测提交的平均 exec_time（exec_time 是
+提交中最慢测试点的用时，作为上界使用）；没有历史记录时取 time_limit 的一半。
+题目的测试点数、时间限制和历史用时按 COST_CACHE_SECONDS 缓存在进程内，入队时不必每次读取
+test_cases JSON。
+"""
+import json
+import time
+from threading import Lock
+from typing import Dict, Tuple
+
+from app.database import fetch_one
+
+# 各语言编译一次的大致开销（毫秒），Python 不编译
+COMPILE_COST_MS = {'c': 300, 'cpp': 800, 'java': 1000, 'python': 0}
+# 各语言每启动一次程序的大致开销（毫秒）
+STARTUP_COST_MS = {'c': 2, 'cpp': 2, 'java': 150, 'python': 30}
+DEFAULT_COMPILE_COST_MS = 500
+DEFAULT_STARTUP_COST_MS = 50
+
+# 参与平均的最近提交数
+HISTORY_SIZE = 50
+COST_CACHE_SECONDS = 60
+
+# (problem_id, language) -> (过期时间, 测试点数, 每个测试点的预计运行时间 ms)
+_cost_cache: Dict[Tuple[int, str], Tuple[float, int, int]] = {}
+_cost_cache_lock = Lock()
+
+
+def _problem_profile(db, problem_id: int, language: str) -> Tuple[int, int]:
+    """返回 (测试点数, 每个测试点的预计运行时间 ms)，带进程内缓存"""
+    key = (problem_id, language)
+    now = time.monotonic()
+    with _cost_cache_lock:
+        cached = _cost_cache.get(key)
+    if cached and cached[0] > now:
+        return cached[1], cached[2]
+
+    problem = fetch_one(db, "SELECT time_limit, test_cases FROM problem WHERE problem_id = :problem_id",
+                        {"problem_id": problem_id})
+    if not problem:
+        return 0, 0
+    try:
+        test_count = len(json.loads(problem['test_cases'])) if problem.get('test_cases') else 0
+    except (TypeError, ValueError):
+        test_count = 0
+    time_limit = int(problem.get('time_limit') or 1000)
+
+    history = fetch_one(db, f"""
+        SELECT AVG(exec_time) AS avg_time FROM (
+            SELECT exec_time FROM submission
+            WHERE problem_id = :problem_id AND language = :language
+                AND status NOT IN ('judging', 'compile_error', 'system_error')
+            ORDER BY submission_id DESC
+            LIMIT {HISTORY_SIZE}
+        ) recent
+    """, {"problem_id": problem_id, "language": language})
+    if history and history.get('avg_time') is not None:
+        per_test = min(int(history['avg_time']), time_limit)
+    else:
+        per_test = time_limit // 2
+
+    with _cost_cache_lock:
+        _cost_cache[key] = (now + COST_CACHE_SECONDS, test_count, per_test)
+    return test_count, per_test
+
+
+def estimate_job_cost(db, problem_id: int, language: str) -> int:
+    """
+    估计评测一份提交的代价
+
+    Args:
+        problem_id: 题目 ID
+        language: 提交语言
+
+    Returns:
+        估计的评测耗时（毫秒）
+    """
+    language = (language or '').lower()
+    test_count, per_test = _problem_profile(db, problem_id, language)
+    compile_cost = COMPILE_COST_MS.get(language, DEFAULT_COMPILE_COST_MS)
+    startup_cost = STARTUP_COST_MS.get(language, DEFAULT_STARTUP_COST_MS)
+    return compile_cost + test_count * (startup_cost + per_test)
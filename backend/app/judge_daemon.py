@@ -0,0 +1,67 @@
+"""
+独立评测守护进程
+
+从 judge_job 表领取评测任务并写回评测结果，不依赖 API 进程。可以在多台机器上各运行若干个，
+配合 JUDGE_IN_PROCESS=false 使 API 进程只负责接收提交：
+
+    uv run python -m app.judge_daemon [--workers N] [--poll SECONDS]
+
+- 每个评测线程用 claim_next_job 按优先级领取任务（MySQL 上为 FOR UPDATE SKIP LOCKED），多个守护进程互不阻塞；
+- 维护线程定期为本进程正在评测的任务刷新心跳，并回收心跳超时（其他进程已退出）的任务；
+- 收到 SIGINT/SIGTERM 后不再领取新任务，等待进行中的评测完成（最多 JUDGE_SHUTDOWN_DRAIN_SECONDS 秒），
+  仍未完成的任务放回队列。
+"""
+import argparse
+import signal
+from threading import Event
+
+from app.config import get_settings
+from app.judge_worker import JudgePool
+
+
+class JudgeDaemon:
+    """评测守护进程：在信号控制下运行一个 JudgePool"""
+
+    def __init__(self, workers: int, poll_seconds: float):
+        """
+        Args:
+            workers: 评测线程数
+            poll_seconds: 队列为空时的轮询间隔（秒）
+        """
+        self.pool = JudgePool(workers, poll_seconds)
+        self._stop = Event()
+
+    def run(self):
+        """运行直到收到停止信号"""
+        signal.signal(signal.SIGINT, self._on_signal)
+        signal.signal(signal.SIGTERM, self._on_signal)
+        print(f"[judge_daemon] {self.pool.worker_id} 启动，评测线程数 {self.pool.max_workers}")
+
+        # 启动时回收遗留任务，之后评测线程按优先级领取任务，维护线程负责心跳和回收
+        self.pool.start()
+        while not self._stop.wait(1):
+            pass
+
+        self.pool.shutdown()
+        print(f"[judge_daemon] {self.pool.worker_id} 已退出")
+
+    def stop(self):
+        self._stop.set()
+
+    def _on_signal(self, signum, frame):
+        print(f"[judge_daemon] 收到信号 {signum}，停止领取新任务")
+        self.stop()
+
+
+def main():
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description='CodeFuse 评测守护进程')
+    parser.add_argument('--workers', type=int, default=settings.JUDGE_MAX_WORKERS or 4, help='评测线程数')
+    parser.add_argument('--poll', type=float, default=settings.JUDGE_DAEMON_POLL_SECONDS,
+                        help='队列为空时的轮询间隔（秒）')
+    args = parser.parse_args()
+    JudgeDaemon(max(args.workers, 1), args.poll).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,8 @@
 支持 C/C++, Python, Java 代码的编译和运行
 """
 import os
+import select
+import signal
 import subprocess
 import tempfile
 import time
@@ -11,6 +13,11 @@ import shutil
 from typing import Tuple, Optional
 from pathlib import Path
 from app.config import get_settings
+from app.compile_cache import get_compile_cache
+from app.judge_checker import CHECKER_CUSTOM, check_output_file, open_expected_output
+from app.judge_sandbox import get_sandbox_path
+from app.judge_java import JavaProfile, get_java_profile
+from app.judge_zygote import get_python_zygote
 
 
 class JudgeEngine:
@@ -47,6 +54,19 @@ class JudgeEngine:
         self.default_timeout = self.settings.JUDGE_DEFAULT_TIMEOUT
         self.default_memory_limit = self.settings.JUDGE_DEFAULT_MEMORY_LIMIT
         
+        # 编译产物缓存（进程内共享）
+        self.compile_cache = get_compile_cache()
+        
+        # 运行器（内核统计资源占用），不可用时为 None
+        self.sandbox_path = get_sandbox_path()
+        
+        # Python 预热运行器（JUDGE_PYTHON_ZYGOTE 未开启或不可用时为 None）
+        self.python_zygote = get_python_zygote()
+        
+        # 测试点输入/输出文件目录（优先使用 tmpfs）和单个测试点的输出上限
+        self.io_dir = self._resolve_io_dir()
+        self.output_limit_bytes = self.settings.JUDGE_OUTPUT_LIMIT_MB * 1024 * 1024
+        
     def judge(
         self,
         code: str,
@@ -57,7 +77,10 @@ class JudgeEngine:
         memory_limit: int = None
     ) -> Tuple[str, int, int, Optional[str], str]:
         """
-        评测代码
+        评测代码（单个测试点，一次性完成编译、运行和清理）
+        
+        评测整份提交时请使用 prepare / run_test / cleanup 三个阶段，
+        以便一次编译的产物可以复用于所有测试点。
         
         Args:
             code: 源代码
@@ -71,77 +94,236 @@ class JudgeEngine:
             (status, time_used, memory_used, error_message, actual_output)
             status: accepted, wrong_answer, time_limit_exceeded, memory_limit_exceeded, 
                     runtime_error, compile_error
-            time_used: 运行时间（毫秒）
+            time_used: CPU 时间（毫秒）
             memory_used: 使用内存（KB）
             error_message: 错误信息
             actual_output: 实际输出
         """
+        prepare_status, artifact = self.prepare(code, language)
+        if prepare_status != 'success':
+            # artifact 此时为错误信息
+            return 'compile_error', 0, 0, artifact, ''
+        
+        try:
+            result = self.run_test(
+                language,
+                artifact,
+                input_data,
+                expected_output,
+                time_limit,
+                memory_limit
+            )
+        finally:
+            self.cleanup(artifact)
+        
+        return (
+            result['status'],
+            result['time_used'],
+            result['memory_used'],
+            result['error_message'],
+            result['actual_output']
+        )
+    
+    def prepare(self, code: str, language: str) -> Tuple[str, str]:
+        """
+        准备阶段：为一份提交创建独立工作目录并编译代码（每份提交只需调用一次）
+        
+        Args:
+            code: 源代码
+            language: 编程语言
+            
+        Returns:
+            (status, artifact_or_error_message)
+            status: success, compile_error, error
+            artifact: C/C++ 为可执行文件路径，Python 为源文件路径，Java 为 classpath 目录
+        """
         if language.lower() not in self.SUPPORTED_LANGUAGES:
-            return 'compile_error', 0, 0, f'不支持的语言: {language}', ''
+            return 'compile_error', f'不支持的语言: {language}'
         
+        try:
+            if language.lower() in ['c', 'cpp', 'java']:
+                return self._compile(code, language)
+            
+            # Python 无需编译，只写入一次源文件，所有测试点共用
+            work_dir = tempfile.mkdtemp(dir=self.temp_dir, prefix='judge_')
+            source_file = os.path.join(work_dir, 'main.py')
+            with open(source_file, 'w', encoding='utf-8') as f:
+                f.write(code)
+            return 'success', source_file
+        except Exception as e:
+            return 'error', f'准备评测环境失败: {str(e)}'
+    
+    def run_test(
+        self,
+        language: str,
+        artifact: str,
+        input_data: str,
+        expected_output: str,
+        time_limit: int = None,
+        memory_limit: int = None,
+        input_path: Optional[str] = None,
+        expected_digest: Optional[dict] = None,
+        checker: Optional[dict] = None,
+        expected_path: Optional[str] = None
+    ) -> dict:
+        """
+        运行阶段：使用 prepare 产出的 artifact 运行一个测试点并比较输出
+        
+        Args:
+            language: 编程语言
+            artifact: prepare 返回的产物路径
+            input_data: 输入数据
+            expected_output: 期望输出
+            time_limit: 时间限制（毫秒）
+            memory_limit: 内存限制（MB）
+            input_path: 已写好输入数据的文件，提供时直接作为程序的 stdin，忽略 input_data
+            expected_digest: 期望输出的规范化摘要（见 judge_checker），提供时通过的输出只需一遍哈希
+            checker: 检查器配置 {'type', 'epsilon', 'language', 'artifact'}，为空时按默认的逐行比较；
+                     custom 类型的 language/artifact 为 prepare 编译好的检查器程序
+            expected_path: 期望输出文件，提供时忽略 expected_output：以只读 mmap 比较，custom 检查器直接使用该文件
+            
+        Returns:
+            评测结果字典，包含 status, time_used, wall_time, memory_used, error_message, actual_output, internal_error
+            time_used 为用户态+内核态 CPU 时间（毫秒），wall_time 为墙钟时间（毫秒）
+            internal_error 为 True 表示结果来自评测机自身的异常（仍记为 runtime_error），不能复用
+        """
         time_limit_sec = (time_limit or self.default_timeout * 1000) / 1000
         memory_limit_mb = memory_limit or self.default_memory_limit
         
+        output = ''
+        internal_error = False
+        temp_files = []
         try:
-            # 编译代码（如果需要）
-            if language.lower() in ['c', 'cpp', 'java']:
-                compile_result = self._compile(code, language)
-                if compile_result[0] != 'success':
-                    # compile_result[1] contains an error message
-                    return 'compile_error', 0, 0, compile_result[1], ''
-                executable_path = compile_result[1]
-            else:
-                executable_path = None
-            
-            # 运行代码
-            run_result = self._run(
-                code, 
-                language, 
-                input_data, 
-                executable_path,
+            if input_path is None:
+                input_path = self._new_io_file('judge_in_')
+                temp_files.append(input_path)
+                with open(input_path, 'wb') as f:
+                    f.write((input_data or '').encode('utf-8'))
+            stdout_path = self._new_io_file('judge_out_')
+            temp_files.append(stdout_path)
+            status, time_used, wall_time, memory_used, error_msg = self._run(
+                language,
+                artifact,
                 time_limit_sec,
-                memory_limit_mb
+                memory_limit_mb,
+                input_path,
+                stdout_path
             )
             
-            status, output, time_used, memory_used, error_msg = run_result
-            
-            # 清理临时文件或目录（兼容可执行文件和 per-judge 目录）
-            try:
-                if executable_path:
-                    if os.path.isdir(executable_path):
-                        # Java per-judge 临时目录
-                        shutil.rmtree(executable_path, ignore_errors=True)
+            # 运行成功才比较输出；运行出错时保留 _run 给出的状态和错误信息
+            if status == 'success':
+                checker = checker or {}
+                if checker.get('type') == CHECKER_CUSTOM:
+                    answer_path = expected_path
+                    if answer_path is None:
+                        answer_path = self._new_io_file('judge_ans_')
+                        temp_files.append(answer_path)
+                        with open(answer_path, 'wb') as f:
+                            f.write((expected_output or '').encode('utf-8'))
+                    status, error_msg = self.run_checker(
+                        checker['language'], checker['artifact'], input_path, stdout_path, answer_path
+                    )
+                else:
+                    if expected_path is None:
+                        matched, mismatch = check_output_file(
+                            checker.get('type'), stdout_path, expected_output, expected_digest, checker.get('epsilon')
+                        )
                     else:
-                        # C/C++ 可执行文件或其他单文件产物
-                        if os.path.exists(executable_path):
-                            try:
-                                os.remove(executable_path)
-                            except:
-                                pass
-                        # 删除可能的源文件（基于可执行路径前缀）
-                        source_prefix = executable_path.rsplit('.', 1)[0]
-                        for ext in ['.c', '.cpp', '.java', '.class', '.py']:
-                            try:
-                                if os.path.exists(source_prefix + ext):
-                                    os.remove(source_prefix + ext)
-                            except:
-                                pass
-            except:
-                pass
-            
-            # 如果运行出错，直接返回
-            if status != 'success':
-                return status, time_used, memory_used, error_msg, output
-            
-            # 比较输出
-            if self._compare_output(output, expected_output):
-                return 'accepted', time_used, memory_used, None, output
-            else:
-                # 只返回简单的错误信息，不包含具体的期望输出和实际输出
-                return 'wrong_answer', time_used, memory_used, '实际输出和期望输出不符合', output
-                
+                        with open_expected_output(expected_path) as expected:
+                            matched, mismatch = check_output_file(
+                                checker.get('type'), stdout_path, expected, expected_digest, checker.get('epsilon')
+                            )
+                    if matched:
+                        status, error_msg = 'accepted', None
+                    else:
+                        # 只给出第一处不同的位置，不包含具体的期望输出和实际输出
+                        status, error_msg = 'wrong_answer', f'实际输出和期望输出不符合：{mismatch}'
+            if status in ('accepted', 'wrong_answer', 'runtime_error'):
+                output = self._read_io_file(stdout_path, self.ACTUAL_OUTPUT_PREVIEW_LIMIT).strip()
         except Exception as e:
-            return 'runtime_error', 0, 0, str(e), ''
+            status, output, time_used, wall_time, memory_used, error_msg = 'runtime_error', '', 0, 0, 0, str(e)
+            internal_error = True
+        finally:
+            for path in temp_files:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        
+        return {
+            'status': status,
+            'time_used': time_used,
+            'wall_time': wall_time,
+            'memory_used': memory_used,
+            'error_message': error_msg,
+            'actual_output': output,
+            'internal_error': internal_error
+        }
+    
+    # 检查器程序的资源限制（秒 / MB）
+    CHECKER_TIME_LIMIT = 10
+    CHECKER_MEMORY_LIMIT = 1024
+    
+    def run_checker(
+        self,
+        language: str,
+        artifact: str,
+        input_path: str,
+        output_path: str,
+        answer_path: str
+    ) -> Tuple[str, Optional[str]]:
+        """
+        运行题目提供的检查器程序（special judge）
+        
+        调用约定与 testlib 一致：checker <输入文件> <选手输出文件> <标准答案文件>，
+        返回码 0 表示通过，1（WA）和 2（PE）表示答案错误，其他情况视为检查器自身出错。
+        检查器写到 stdout/stderr 的内容作为评测信息。
+        
+        Returns:
+            (status, message)，status 为 accepted、wrong_answer 或 system_error
+        """
+        run_cmd, error = self._build_run_cmd(language, artifact, self.CHECKER_MEMORY_LIMIT)
+        if error:
+            return 'system_error', f'检查器{error}'
+        run_cwd = artifact if os.path.isdir(artifact) else os.path.dirname(artifact)
+        stdout_path = self._new_io_file('judge_chk_')
+        stderr_path = self._new_io_file('judge_chk_')
+        try:
+            timed_out, _, _, _, returncode, _ = self._execute(
+                run_cmd + [input_path, output_path, answer_path], run_cwd,
+                input_path, stdout_path, stderr_path,
+                self.CHECKER_TIME_LIMIT, self.CHECKER_MEMORY_LIMIT, language
+            )
+            # testlib 把评测信息写到 stderr，其他检查器可能写到 stdout
+            message = (self._read_io_file(stderr_path, self.STDERR_READ_LIMIT).strip()
+                       or self._read_io_file(stdout_path, self.STDERR_READ_LIMIT).strip() or None)
+        finally:
+            for path in (stdout_path, stderr_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        if timed_out:
+            return 'system_error', '检查器运行超时'
+        if returncode == 0:
+            return 'accepted', None
+        if returncode in (1, 2):
+            return 'wrong_answer', message or '检查器判定答案错误'
+        return 'system_error', f'检查器异常退出（返回码 {returncode}）' + (f'：{message}' if message else '')
+    
+    def cleanup(self, artifact: Optional[str]):
+        """
+        清理阶段：删除 prepare 创建的工作目录（所有测试点运行完后调用）
+        """
+        if not artifact:
+            return
+        try:
+            work_dir = artifact if os.path.isdir(artifact) else os.path.dirname(artifact)
+            # 只删除 prepare 创建的 per-submission 目录，避免误删临时根目录
+            if os.path.basename(work_dir).startswith('judge_'):
+                shutil.rmtree(work_dir, ignore_errors=True)
+        except Exception:
+            pass
     
     def _compile(self, code: str, language: str) -> Tuple[str, str]:
         """
@@ -150,35 +332,40 @@ class JudgeEngine:
         Returns:
             (status, executable_path_or_error_message)
         """
-        # 创建临时源文件
-        timestamp = int(time.time() * 1000)
-        
-        compile_cwd = self.temp_dir
+        # 为每份提交创建独立子目录，避免并发时源文件、可执行文件或 Main.class 冲突
+        compile_cwd = tempfile.mkdtemp(dir=self.temp_dir, prefix='judge_')
         if language.lower() == 'c':
-            source_file = os.path.join(self.temp_dir, f'temp_{timestamp}.c')
-            executable = os.path.join(self.temp_dir, f'temp_{timestamp}.exe')
-            compile_cmd = [self.gcc_executable, source_file, '-o', executable, '-O2']
+            source_file = os.path.join(compile_cwd, 'main.c')
+            executable = os.path.join(compile_cwd, 'main.exe')
+            compiler, flags = self.gcc_executable, ['-O2']
+            compile_cmd = [compiler, source_file, '-o', executable] + flags
         elif language.lower() == 'cpp':
-            source_file = os.path.join(self.temp_dir, f'temp_{timestamp}.cpp')
-            executable = os.path.join(self.temp_dir, f'temp_{timestamp}.exe')
-            compile_cmd = [self.gpp_executable, source_file, '-o', executable, '-O2', '-std=c++17']
+            source_file = os.path.join(compile_cwd, 'main.cpp')
+            executable = os.path.join(compile_cwd, 'main.exe')
+            compiler, flags = self.gpp_executable, ['-O2', '-std=c++17']
+            compile_cmd = [compiler, source_file, '-o', executable] + flags
         elif language.lower() == 'java':
-            # 为每次评测创建独立子目录，避免并发时 Main.class 冲突
-            per_judge_dir = tempfile.mkdtemp(dir=self.temp_dir, prefix=f'judge_{timestamp}_')
-            compile_cwd = per_judge_dir
             source_filename = 'Main.java'
-            source_file = os.path.join(per_judge_dir, source_filename)
+            source_file = os.path.join(compile_cwd, source_filename)
             # 使用相对文件名在指定 cwd 中调用 javac，避免路径解析差异
-            compile_cmd = [self.javac_executable, source_filename]
-            executable = per_judge_dir  # 返回目录路径，运行时使用 java -cp <dir> Main
+            compiler, flags = self.javac_executable, []
+            compile_cmd = [compiler, source_filename] + flags
+            executable = compile_cwd  # 返回目录路径，运行时使用 java -cp <dir> Main
         else:
+            shutil.rmtree(compile_cwd, ignore_errors=True)
             return 'compile_error', f'不支持的编译语言: {language}'
         
+        # 命中编译缓存时直接复制产物，跳过编译
+        cache_key = self.compile_cache.make_key(language, compiler, flags, code)
+        if self.compile_cache.get(cache_key, compile_cwd):
+            return 'success', executable
+        
         # 写入源代码
         try:
             with open(source_file, 'w', encoding='utf-8') as f:
                 f.write(code)
         except Exception as e:
+            shutil.rmtree(compile_cwd, ignore_errors=True)
             return 'error', f'写入源文件失败: {str(e)}'
         
         # 编译
@@ -193,15 +380,7 @@ class JudgeEngine:
             
             if result.returncode != 0:
                 error_msg = result.stderr or result.stdout
-                # 清理源文件或临时目录（如果为 java）
-                try:
-                    if language.lower() == 'java' and os.path.isdir(compile_cwd):
-                        shutil.rmtree(compile_cwd, ignore_errors=True)
-                    else:
-                        if os.path.exists(source_file):
-                            os.remove(source_file)
-                except:
-                    pass
+                shutil.rmtree(compile_cwd, ignore_errors=True)
                 # 返回包含 cwd 和命令的详细信息，便于排查 javac 未被正确调用的问题
                 cmd_str = ' '.join(compile_cmd)
                 return 'compile_error', f'编译错误 (cwd={compile_cwd}, cmd="{cmd_str}"):\n{error_msg}'
@@ -209,168 +388,193 @@ class JudgeEngine:
             # 编译成功，但需要额外检查目标文件是否存在（避免极端情况下编译器未产生输出）
             if language.lower() in ['c', 'cpp']:
                 if not os.path.exists(executable):
-                    try:
-                        os.remove(source_file)
-                    except:
-                        pass
+                    shutil.rmtree(compile_cwd, ignore_errors=True)
                     return 'compile_error', '编译后未生成可执行文件'
             elif language.lower() == 'java':
-                # 检查 Main.class 是否存在于 per-judge 目录
+                # 检查 Main.class 是否存在于 per-submission 目录
                 class_file = os.path.join(compile_cwd, 'Main.class')
                 if not os.path.exists(class_file):
-                    try:
-                        if os.path.isdir(compile_cwd):
-                            shutil.rmtree(compile_cwd, ignore_errors=True)
-                        else:
-                            if os.path.exists(source_file):
-                                os.remove(source_file)
-                    except:
-                        pass
+                    shutil.rmtree(compile_cwd, ignore_errors=True)
                     return 'compile_error', f'编译后未生成 class 文件 (cwd={compile_cwd})'
 
+            # 存入编译缓存（C/C++ 为可执行文件，Java 为目录下所有 class 文件）
+            if language.lower() == 'java':
+                artifacts = [os.path.join(compile_cwd, name) for name in os.listdir(compile_cwd) if name.endswith('.class')]
+            else:
+                artifacts = [executable]
+            self.compile_cache.put(cache_key, artifacts)
+
             return 'success', executable
             
         except subprocess.TimeoutExpired:
+            shutil.rmtree(compile_cwd, ignore_errors=True)
             return 'error', '编译超时'
         except Exception as e:
+            shutil.rmtree(compile_cwd, ignore_errors=True)
             return 'error', f'编译异常: {str(e)}'
     
+    def _build_run_cmd(self, language: str, executable_path: Optional[str], memory_limit: int) -> Tuple[Optional[list], Optional[str]]:
+        """
+        根据语言和 prepare 产物构造运行命令
+        
+        Returns:
+            (run_cmd, error_message)，产物缺失时 run_cmd 为 None
+        """
+        if language.lower() == 'python':
+            # Python 直接运行 prepare 写好的源文件
+            if not executable_path or not os.path.exists(executable_path):
+                return None, '运行时错误: 未找到源文件'
+            return [self.python_executable, executable_path], None
+        if language.lower() in ['c', 'cpp']:
+            # 可执行文件应该存在
+            if not executable_path or not os.path.exists(executable_path):
+                return None, '运行时错误: 未找到可执行文件'
+            return [executable_path], None
+        if language.lower() == 'java':
+            # Java 运行需要指定类名，使用 compile 返回的 per-submission 目录作为 classpath
+            # 检查 per-submission 目录和 Main.class
+            if not executable_path or not os.path.isdir(executable_path):
+                return None, '运行时错误: Java 运行目录不存在'
+            class_file = os.path.join(executable_path, 'Main.class')
+            if not os.path.exists(class_file):
+                return None, '运行时错误: 未找到 Main.class，请检查编译是否成功'
+            # JVM 预留的虚拟地址空间远大于实际使用，不能用 RLIMIT_AS 限制，改用 -Xmx 限制堆大小；
+            # 其余启动参数（串行 GC、CDS 归档）见 judge_java.py
+            flags = get_java_profile().jvm_flags(memory_limit)
+            return [self.java_executable] + flags + ['-cp', executable_path, 'Main'], None
+        return None, f'不支持的运行语言: {language}'
+    
+    def _execute(
+        self,
+        run_cmd: list,
+        run_cwd: str,
+        stdin_path: str,
+        stdout_path: str,
+        stderr_path: str,
+        time_limit: float,
+        memory_limit: int,
+        language: str
+    ) -> Tuple[bool, int, int, int, int, bool]:
+        """
+        在资源限制下运行一条命令，stdin/stdout/stderr 均为文件
+        
+        Returns:
+            (timed_out, cpu_time_ms, wall_time_ms, max_memory_kb, returncode, memory_limit_hit)
+            memory_limit_hit 表示运行期间有内存分配因达到限制而失败（见 judge_sandbox.c）
+        """
+        # 墙钟时间上限：给 CPU 时间留出余量，同时避免 sleep/阻塞读的程序无限挂起
+        wall_limit = max(time_limit * 2, time_limit + 1)
+        # 由操作系统强制内存限制，超限的程序会立即分配失败而不是一直运行到超时
+        address_space_limit_kb = 0 if language.lower() == 'java' else memory_limit * 1024
+        if self.python_zygote and language.lower() == 'python' and run_cmd[0] == self.python_executable:
+            try:
+                # 从预热的解释器 fork 运行，省去解释器启动时间
+                return self._run_zygote(
+                    run_cmd[1:], run_cwd, stdin_path, stdout_path, stderr_path,
+                    time_limit, wall_limit, address_space_limit_kb
+                )
+            except (OSError, RuntimeError, ValueError) as e:
+                print(f"[judge_engine] Python zygote 不可用，按普通方式运行: {e}")
+        if self.sandbox_path:
+            # 通过运行器启动：由内核 wait4 统计 CPU 时间和峰值内存
+            return self._run_sandboxed(
+                run_cmd, run_cwd, stdin_path, stdout_path, stderr_path,
+                time_limit, wall_limit, address_space_limit_kb
+            )
+        # 运行器不可用（Windows 或缺少 GCC）时退回到 psutil 轮询
+        return self._run_polling(
+            run_cmd, run_cwd, stdin_path, stdout_path, stderr_path,
+            wall_limit, memory_limit * 1024
+        )
+    
     def _run(
         self,
-        code: str,
         language: str,
-        input_data: str,
         executable_path: Optional[str],
         time_limit: float,
-        memory_limit: int
-    ) -> Tuple[str, str, int, int, Optional[str]]:
+        memory_limit: int,
+        input_path: str,
+        stdout_path: str
+    ) -> Tuple[str, int, int, int, Optional[str]]:
         """
         运行代码
         
+        程序的 stdin/stdout/stderr 都是 io_dir 下的文件，不经过 Python 内存中的管道缓冲；
+        输出达到 JUDGE_OUTPUT_LIMIT_MB 时判为输出超限，评测线程读取的数据量始终有上限。
+        
+        Args:
+            executable_path: prepare 返回的产物（Python 源文件 / 可执行文件 / Java classpath 目录）
+            input_path: 输入文件
+            stdout_path: 程序输出写入的文件，由调用方负责删除
+        
         Returns:
-            (status, output, time_used_ms, memory_used_kb, error_message)
+            (status, cpu_time_ms, wall_time_ms, memory_used_kb, error_message)
+            status 为 success 时程序输出在 stdout_path 中，由调用方比较
         """
         try:
-            # 准备运行命令
-            if language.lower() == 'python':
-                # Python 直接运行
-                timestamp = int(time.time() * 1000)
-                source_file = os.path.join(self.temp_dir, f'temp_{timestamp}.py')
-                with open(source_file, 'w', encoding='utf-8') as f:
-                    f.write(code)
-                run_cmd = [self.python_executable, source_file]
-            elif language.lower() in ['c', 'cpp']:
-                # 可执行文件应该存在
-                if not executable_path or not os.path.exists(executable_path):
-                    return 'runtime_error', '', 0, 0, '运行时错误: 未找到可执行文件'
-                run_cmd = [executable_path]
-            elif language.lower() == 'java':
-                # Java 运行需要指定类名，使用 compile 返回的 per-judge 目录作为 classpath
-                # 检查 per-judge 目录和 Main.class
-                if not executable_path or not os.path.isdir(executable_path):
-                    return 'runtime_error', '', 0, 0, '运行时错误: Java 运行目录不存在'
-                class_file = os.path.join(executable_path, 'Main.class')
-                if not os.path.exists(class_file):
-                    return 'runtime_error', '', 0, 0, '运行时错误: 未找到 Main.class，请检查编译是否成功'
-                run_cmd = [self.java_executable, '-cp', executable_path, 'Main']
-            else:
-                return 'runtime_error', '', 0, 0, f'不支持的运行语言: {language}'
-            
-            # 记录开始时间
-            start_time = time.time()
-            
-            # 运行程序
-            # 运行时也应在对应目录执行（Java 使用 per-judge 目录）
-            run_cwd = self.temp_dir if language.lower() != 'java' else executable_path
-            process = subprocess.Popen(
-                run_cmd,
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                cwd=run_cwd
-            )
-            
-            # 监控内存使用 - 使用线程持续监控
-            max_memory = 0
-            import threading
-            monitoring = {'running': True}
-            
-            def monitor_memory():
-                """在后台线程中持续监控内存使用"""
-                try:
-                    ps_process = psutil.Process(process.pid)
-                    while monitoring['running']:
-                        try:
-                            if ps_process.is_running():
-                                memory_info = ps_process.memory_info()
-                                current_memory = memory_info.rss // 1024  # 转换为 KB
-                                nonlocal max_memory
-                                max_memory = max(max_memory, current_memory)
-                            else:
-                                break
-                        except (psutil.NoSuchProcess, psutil.AccessDenied):
-                            break
-                        time.sleep(0.01)  # 每10ms检查一次
-                except:
-                    pass
-            
-            # 启动内存监控线程
-            monitor_thread = threading.Thread(target=monitor_memory, daemon=True)
-            monitor_thread.start()
+            run_cmd, error = self._build_run_cmd(language, executable_path, memory_limit)
+            if error:
+                return 'runtime_error', 0, 0, 0, error
             
+            # 在 per-submission 工作目录中运行
+            run_cwd = executable_path if os.path.isdir(executable_path) else os.path.dirname(executable_path)
+            stderr_path = self._new_io_file('judge_err_')
             try:
-                # 发送输入并等待结果
-                output, error = process.communicate(
-                    input=input_data,
-                    timeout=time_limit
+                timed_out, cpu_time, wall_time, max_memory, returncode, memory_limit_hit = self._execute(
+                    run_cmd, run_cwd, input_path, stdout_path, stderr_path,
+                    time_limit, memory_limit, language
                 )
-            except subprocess.TimeoutExpired:
-                process.kill()
-                monitoring['running'] = False
-                # 清理临时文件
-                if language.lower() == 'python' and os.path.exists(source_file):
-                    try:
-                        os.remove(source_file)
-                    except:
-                        pass
-                return 'time_limit_exceeded', '', int(time_limit * 1000), max_memory, '运行超时'
+                output_size = os.path.getsize(stdout_path)
+                error = self._read_io_file(stderr_path, self.STDERR_READ_LIMIT)
+                output = ''
+                if returncode != 0:
+                    output = self._read_io_file(stdout_path, self.ACTUAL_OUTPUT_PREVIEW_LIMIT)
             finally:
-                # 停止内存监控
-                monitoring['running'] = False
-                monitor_thread.join(timeout=0.5)
-            
-            # 计算运行时间（毫秒）
-            time_used = int((time.time() - start_time) * 1000)
-            
-            # 清理临时文件
-            if language.lower() == 'python' and os.path.exists(source_file):
                 try:
-                    os.remove(source_file)
-                except:
+                    os.remove(stderr_path)
+                except OSError:
                     pass
             
-            # 检查内存限制
-            if max_memory > memory_limit * 1024:  # memory_limit 是 MB
-                return 'memory_limit_exceeded', '', time_used, max_memory, '内存超限'
+            if language.lower() == 'java':
+                # 扣除 JVM 自身的启动开销，time_used/memory_used 只反映选手程序（wall_time 保留原始值）
+                startup_cpu, startup_memory = self._java_startup_overhead(get_java_profile(), memory_limit)
+                cpu_time = max(cpu_time - startup_cpu, 0)
+                max_memory = max(max_memory - startup_memory, 0)
+            
+            # 以 CPU 时间判定超时，判题机繁忙时结果依然稳定；墙钟超时说明程序在 sleep 或阻塞
+            if timed_out or cpu_time > time_limit * 1000:
+                return 'time_limit_exceeded', cpu_time, wall_time, max_memory, '运行超时'
+            
+            # 输出超限：运行器用 RLIMIT_FSIZE 限制输出文件大小，继续写入的程序会收到 SIGXFSZ
+            if (getattr(signal, 'SIGXFSZ', None) and returncode == -signal.SIGXFSZ) or (
+                self.output_limit_bytes and output_size >= self.output_limit_bytes
+            ):
+                return 'output_limit_exceeded', cpu_time, wall_time, max_memory, '输出超限'
+            
+            # 检查内存限制：峰值超限，或因达到限制分配失败而异常退出
+            if max_memory > memory_limit * 1024 or (  # memory_limit 是 MB
+                returncode != 0 and (
+                    memory_limit_hit or self._is_out_of_memory(error, returncode, max_memory, memory_limit)
+                )
+            ):
+                return 'memory_limit_exceeded', cpu_time, wall_time, max_memory, '内存超限'
             
             # 检查运行时错误
-            if process.returncode != 0:
+            if returncode != 0:
                 # 若 stderr/错误信息存在，返回更详细的错误信息，并把 stdout 也作为实际输出返回
                 err_msg = error or ''
-                out = output.strip() if output else ''
+                out = output.strip()
                 # 包含返回码/信号信息，帮助诊断 segmentation fault（通常没有 stderr）
-                rc = process.returncode
+                rc = returncode
                 detailed = f'运行时错误:'
                 if err_msg:
                     detailed += f"\n{err_msg}"
                 # 添加返回码信息
                 try:
-                    import signal as _signal
                     if rc < 0:
                         sig = -rc
                         try:
-                            sig_name = _signal.Signals(sig).name
+                            sig_name = signal.Signals(sig).name
                         except Exception:
                             sig_name = str(sig)
                         detailed += f"\n进程被信号终止: {sig} ({sig_name})"
@@ -381,31 +585,299 @@ class JudgeEngine:
 
                 if out:
                     detailed += f"\nstdout:\n{out}"
-                return 'runtime_error', out, time_used, max_memory, detailed
+                return 'runtime_error', cpu_time, wall_time, max_memory, detailed
             
-            return 'success', output.strip(), time_used, max_memory, None
+            return 'success', cpu_time, wall_time, max_memory, None
             
         except Exception as e:
-            return 'runtime_error', '', 0, 0, f'运行异常: {str(e)}'
+            # 评测机自身的故障（而非选手程序的错误），交给 run_test 标记为 internal_error
+            raise RuntimeError(f'运行异常: {str(e)}') from e
     
-    def _compare_output(self, actual: str, expected: str) -> bool:
+    # 标定 JVM 启动开销时运行空程序的次数（取最小值，排除偶发抖动）
+    JAVA_STARTUP_SAMPLES = 3
+    
+    def _java_startup_overhead(self, profile: JavaProfile, memory_limit: int) -> Tuple[int, int]:
         """
-        比较输出结果
-        忽略行尾空白和文件尾换行
+        返回 JVM 启动本身的 (CPU 时间 ms, 峰值内存 KB)
+        
+        首次调用时用相同的启动参数多次运行空程序，取最小值缓存在 profile 中；
+        无法标定（没有探针或运行失败）时为 0，即不扣除。
+        """
+        with profile.lock:
+            if profile.startup_cpu_ms is None:
+                samples = []
+                if profile.probe_classpath:
+                    run_cmd = [self.java_executable] + profile.jvm_flags(memory_limit) + [
+                        '-cp', profile.probe_classpath, 'Main'
+                    ]
+                    for _ in range(self.JAVA_STARTUP_SAMPLES):
+                        io_paths = [self._new_io_file(prefix) for prefix in ('java_in_', 'java_out_', 'java_err_')]
+                        try:
+                            timed_out, cpu_time, _, max_memory, returncode, _ = self._execute(
+                                run_cmd, profile.probe_classpath, *io_paths, 10, memory_limit, 'java'
+                            )
+                        except Exception:
+                            break
+                        finally:
+                            for path in io_paths:
+                                try:
+                                    os.remove(path)
+                                except OSError:
+                                    pass
+                        if timed_out or returncode != 0:
+                            break
+                        samples.append((cpu_time, max_memory))
+                profile.startup_cpu_ms = min(s[0] for s in samples) if samples else 0
+                profile.startup_memory_kb = min(s[1] for s in samples) if samples else 0
+            return profile.startup_cpu_ms, profile.startup_memory_kb
+    
+    def _run_sandboxed(
+        self,
+        run_cmd: list,
+        run_cwd: str,
+        stdin_path: str,
+        stdout_path: str,
+        stderr_path: str,
+        time_limit: float,
+        wall_limit: float,
+        memory_limit_kb: int
+    ) -> Tuple[bool, int, int, int, int, bool]:
+        """
+        通过运行器启动程序，读取内核统计的资源占用
+        
+        不再为每个测试点启动内存轮询线程：峰值内存取 ru_maxrss，不会漏掉短暂峰值；
+        CPU 时间取 ru_utime + ru_stime，墙钟时间单独统计。
         
-        Args:
-            actual: 实际输出
-            expected: 期望输出
-            
         Returns:
-            是否匹配
+            (timed_out, cpu_time_ms, wall_time_ms, max_memory_kb, returncode, memory_limit_hit)
+            returncode 为负数时表示被对应信号终止
         """
-        # 分行并去除每行尾部空白
-        actual_lines = [line.rstrip() for line in actual.splitlines()]
-        expected_lines = [line.rstrip() for line in expected.splitlines()]
+        result_read, result_write = os.pipe()
+        try:
+            with open(stdin_path, 'rb') as stdin, open(stdout_path, 'wb') as stdout, \
+                    open(stderr_path, 'wb') as stderr:
+                process = subprocess.Popen(
+                    [
+                        self.sandbox_path,
+                        str(result_write),
+                        str(int(time_limit * 1000)),
+                        str(int(wall_limit * 1000)),
+                        str(memory_limit_kb),
+                        str(self.output_limit_bytes)
+                    ] + run_cmd,
+                    stdin=stdin,
+                    stdout=stdout,
+                    stderr=stderr,
+                    cwd=run_cwd,
+                    pass_fds=(result_write,),
+                    # 独立进程组，异常时可以连同选手程序的子进程一起清理
+                    start_new_session=True
+                )
+        except Exception:
+            os.close(result_read)
+            raise
+        finally:
+            os.close(result_write)
         
-        # 去除空行
-        actual_lines = [line for line in actual_lines if line]
-        expected_lines = [line for line in expected_lines if line]
+        try:
+            result = self._read_runner_result(result_read, wall_limit)
+        finally:
+            try:
+                # 清理残留进程（例如选手程序 fork 出的后台进程）
+                os.killpg(process.pid, signal.SIGKILL)
+            except OSError:
+                pass
+            process.wait()
+        return self._parse_runner_result(result, wall_limit)
+    
+    def _run_zygote(
+        self,
+        argv: list,
+        run_cwd: str,
+        stdin_path: str,
+        stdout_path: str,
+        stderr_path: str,
+        time_limit: float,
+        wall_limit: float,
+        memory_limit_kb: int
+    ) -> Tuple[bool, int, int, int, int, bool]:
+        """
+        通过 Python zygote 运行选手程序，资源限制和结果格式与运行器相同
         
-        return actual_lines == expected_lines
+        Returns:
+            (timed_out, cpu_time_ms, wall_time_ms, max_memory_kb, returncode, memory_limit_hit)
+            memory_limit_hit 恒为 False，Python 分配失败由 stderr 中的 MemoryError 识别
+        """
+        result_read, result_write = os.pipe()
+        try:
+            with open(stdin_path, 'rb') as stdin, open(stdout_path, 'wb') as stdout, \
+                    open(stderr_path, 'wb') as stderr:
+                pid = self.python_zygote.spawn(
+                    argv,
+                    run_cwd,
+                    [stdin.fileno(), stdout.fileno(), stderr.fileno(), result_write],
+                    int(time_limit * 1000),
+                    int(wall_limit * 1000),
+                    memory_limit_kb,
+                    self.output_limit_bytes
+                )
+        except Exception:
+            os.close(result_read)
+            raise
+        finally:
+            os.close(result_write)
+        
+        result = self._read_runner_result(result_read, wall_limit)
+        if len(result.split()) != 6:
+            # 监控进程没有给出结果，清理整个进程组（正常结束时监控进程会自行清理）
+            try:
+                os.killpg(pid, signal.SIGKILL)
+            except OSError:
+                pass
+        return self._parse_runner_result(result, wall_limit)
+    
+    def _read_runner_result(self, result_read: int, wall_limit: float) -> bytes:
+        """读取结果管道直到 EOF 并关闭；运行器自己会在 wall_limit 时杀掉程序，这里再留 1 秒余量兜底"""
+        deadline = time.monotonic() + wall_limit + 1
+        chunks = []
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                ready, _, _ = select.select([result_read], [], [], remaining)
+                if not ready:
+                    break
+                data = os.read(result_read, 4096)
+                if not data:
+                    break
+                chunks.append(data)
+        finally:
+            os.close(result_read)
+        return b''.join(chunks)
+    
+    def _parse_runner_result(self, result: bytes, wall_limit: float) -> Tuple[bool, int, int, int, int, bool]:
+        """解析运行器写入的结果行（Python 预热运行器不报告 memory_limit_hit，只有前 6 项）"""
+        fields = result.split()
+        if len(fields) not in (6, 7):
+            # 运行器没有给出结果（被兜底超时杀掉），按超时处理
+            return True, int(wall_limit * 1000), int(wall_limit * 1000), 0, -signal.SIGKILL, False
+        exit_code, term_signal, cpu_us, wall_us, max_memory, wall_timed_out = (int(f) for f in fields[:6])
+        memory_limit_hit = len(fields) == 7 and int(fields[6]) != 0
+        returncode = -term_signal if term_signal else exit_code
+        return bool(wall_timed_out), cpu_us // 1000, wall_us // 1000, max_memory, returncode, memory_limit_hit
+    
+    def _run_polling(
+        self,
+        run_cmd: list,
+        run_cwd: str,
+        stdin_path: str,
+        stdout_path: str,
+        stderr_path: str,
+        wall_limit: float,
+        memory_limit_kb: int
+    ) -> Tuple[bool, int, int, int, int, bool]:
+        """
+        运行器不可用时的退路：后台线程轮询 psutil 统计内存和 CPU 时间
+        采样到内存超限或输出文件超过上限时立即结束进程
+        
+        Returns:
+            (timed_out, cpu_time_ms, wall_time_ms, max_memory_kb, returncode, memory_limit_hit)
+        """
+        import threading
+        start = time.monotonic()
+        with open(stdin_path, 'rb') as stdin, open(stdout_path, 'wb') as stdout, \
+                open(stderr_path, 'wb') as stderr:
+            process = subprocess.Popen(
+                run_cmd,
+                stdin=stdin,
+                stdout=stdout,
+                stderr=stderr,
+                cwd=run_cwd
+            )
+        max_memory = 0
+        cpu_time = 0
+        monitoring = {'running': True}
+        
+        def monitor_memory():
+            """在后台线程中持续监控内存使用、CPU 时间和输出大小"""
+            nonlocal max_memory, cpu_time
+            try:
+                ps_process = psutil.Process(process.pid)
+                while monitoring['running'] and ps_process.is_running():
+                    max_memory = max(max_memory, ps_process.memory_info().rss // 1024)  # 转换为 KB
+                    if max_memory > memory_limit_kb:
+                        process.kill()
+                        break
+                    if self.output_limit_bytes and os.path.getsize(stdout_path) >= self.output_limit_bytes:
+                        process.kill()
+                        break
+                    times = ps_process.cpu_times()
+                    cpu_time = int((times.user + times.system) * 1000)
+                    time.sleep(0.01)  # 每10ms检查一次
+            except Exception:
+                pass
+        
+        monitor_thread = threading.Thread(target=monitor_memory, daemon=True)
+        monitor_thread.start()
+        timed_out = False
+        try:
+            process.wait(timeout=wall_limit)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+            timed_out = True
+        finally:
+            monitoring['running'] = False
+            monitor_thread.join(timeout=0.5)
+        wall_time = int((time.monotonic() - start) * 1000)
+        # 轮询可能错过极短的运行，CPU 时间以最后一次采样为准且不超过墙钟时间
+        return timed_out, min(cpu_time, wall_time), wall_time, max_memory, process.returncode, max_memory > memory_limit_kb
+    
+    # stderr 只读取开头部分用于错误信息
+    STDERR_READ_LIMIT = 64 * 1024
+    # 评测结果中保存的实际输出只截取开头部分，完整输出由比较器直接从文件流式读取
+    ACTUAL_OUTPUT_PREVIEW_LIMIT = 64 * 1024
+    
+    def _resolve_io_dir(self) -> str:
+        """测试点 I/O 文件目录：显式配置优先，其次 /dev/shm（tmpfs），最后退回临时目录"""
+        if self.settings.JUDGE_IO_DIR:
+            os.makedirs(self.settings.JUDGE_IO_DIR, exist_ok=True)
+            return self.settings.JUDGE_IO_DIR
+        if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+            return '/dev/shm'
+        return self.temp_dir
+    
+    def _new_io_file(self, prefix: str) -> str:
+        """在 io_dir 中创建一个空文件并返回路径"""
+        fd, path = tempfile.mkstemp(dir=self.io_dir, prefix=prefix)
+        os.close(fd)
+        return path
+    
+    def _read_io_file(self, path: str, limit: int) -> str:
+        """读取 I/O 文件的前 limit 字节（limit <= 0 表示全部读取）"""
+        with open(path, 'rb') as f:
+            data = f.read(limit if limit > 0 else -1)
+        return data.decode('utf-8', errors='replace')
+    
+    # 内存分配失败时各语言运行时输出的特征信息
+    OUT_OF_MEMORY_MARKERS = (
+        'MemoryError',
+        'std::bad_alloc',
+        'java.lang.OutOfMemoryError',
+        'Cannot allocate memory',
+        'out of memory',
+    )
+    
+    def _is_out_of_memory(self, error: str, returncode: int, max_memory: int, memory_limit: int) -> bool:
+        """
+        判断异常退出是否由内存限制导致
+        
+        RLIMIT_AS 下内存分配会直接失败：Python 抛出 MemoryError，C++ 抛出 std::bad_alloc 后 abort，
+        C 程序通常在使用 NULL 指针时段错误或自行退出。前两者可以从 stderr 识别；
+        C 程序的情况由运行器报告的 memory_limit_hit 判定（见 _run），运行器不可用时
+        只要峰值内存已接近限制，也按内存超限处理。
+        """
+        if any(marker in error for marker in self.OUT_OF_MEMORY_MARKERS):
+            return True
+        return returncode != 0 and max_memory >= memory_limit * 1024 * 0.9
@@ -0,0 +1,331 @@
+"""
+评测结果推送
+
+评测完成时 run_submission_judge 调用 publish_judge_event 发布事件，订阅者通过 SSE
+（GET /api/submissions/events）实时收到结果，不必反复轮询提交详情。
+
+频道：
+    submission:<id>   单个提交
+    user:<id>         某用户的所有提交
+    contest:<id>      某比赛的所有提交
+
+事件同时写入 judge_event 表：评测可能发生在其他 API 进程或独立评测守护进程中，
+每个 API 进程在有订阅者时由一个后台线程按 JUDGE_EVENTS_POLL_SECONDS 读取新事件并分发
+（所有订阅者共用这一条查询），本进程发布的事件则直接分发、不经过数据库。
+超过 JUDGE_EVENTS_RETENTION_SECONDS 的事件由评测进程的维护线程定期清理（prune_events），与是否有订阅者无关。
+
+评测过程中的进度（已完成/总测试点数、当前最差结果）由 JudgeProgress 在内存中累积，
+每 JUDGE_PROGRESS_INTERVAL_SECONDS 最多合并发布一次 progress 事件，而不是每个测试点写一次数据库；
+各进程的 EventHub 保留每个评测中提交的最新进度，供 GET /api/submissions/{id}/progress 查询。
+"""
+import asyncio
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from functools import lru_cache
+from threading import Event, Lock, Thread
+from typing import Dict, Iterable, List, Optional, Set
+
+from app.config import get_settings
+from app.database import SessionLocal, execute_insert, execute_query, execute_update, fetch_one
+
+# 清理过期事件的间隔（秒）
+PRUNE_INTERVAL_SECONDS = 60
+# 每次读取的最大事件数
+TAIL_BATCH_SIZE = 500
+# 每次重新检查已读位置之前的事件 id 数：自增 id 在多个进程间可能乱序提交，
+# 较小的 id 晚于较大的 id 可见时，在这个窗口内补发
+TAIL_RESCAN_WINDOW = 1000
+
+
+def event_channels(event: dict) -> List[str]:
+    """事件投递到的频道"""
+    channels = [f"submission:{event['submission_id']}"]
+    if event.get('user_id') is not None:
+        channels.append(f"user:{event['user_id']}")
+    if event.get('contest_id') is not None:
+        channels.append(f"contest:{event['contest_id']}")
+    return channels
+
+
+class Subscription:
+    """一个 SSE 连接的订阅：事件放入所在事件循环的 asyncio.Queue"""
+
+    def __init__(self, channels: Iterable[str], loop: asyncio.AbstractEventLoop):
+        self.channels = set(channels)
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    def deliver(self, event: dict):
+        """线程安全地投递事件（可从评测线程调用）"""
+        try:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+        except RuntimeError:
+            # 事件循环已关闭，连接即将被清理
+            pass
+
+
+class EventHub:
+    """进程内的事件分发中心"""
+
+    def __init__(self):
+        settings = get_settings()
+        self.poll_seconds = settings.JUDGE_EVENTS_POLL_SECONDS
+        # 标记本进程写入的事件，读取数据库时跳过（已直接分发过）
+        self.origin = f'{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._lock = Lock()
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._tail_thread = None
+        self._wakeup = Event()
+        self._last_event_id = None
+        # 重扫窗口内已分发过的事件 id
+        self._seen_event_ids: Set[int] = set()
+        # 评测中提交的最新进度：submission_id -> progress 事件，出结果后移除
+        self._progress: Dict[int, dict] = {}
+
+    def subscribe(self, channels: Iterable[str], loop: asyncio.AbstractEventLoop) -> Subscription:
+        subscription = Subscription(channels, loop)
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscribers.setdefault(channel, set()).add(subscription)
+            if self._tail_thread is None or not self._tail_thread.is_alive():
+                self._tail_thread = Thread(target=self._tail_loop, name='judge-events', daemon=True)
+                self._tail_thread.start()
+        self._wakeup.set()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+    def has_subscribers(self) -> bool:
+        with self._lock:
+            return bool(self._subscribers)
+
+    def get_progress(self, submission_id: int) -> Optional[dict]:
+        """本进程已知的提交最新进度"""
+        with self._lock:
+            return self._progress.get(submission_id)
+
+    def dispatch(self, event: dict):
+        """把事件分发给本进程中订阅了相关频道的连接"""
+        with self._lock:
+            if event.get('type') == 'progress':
+                self._progress[event['submission_id']] = event
+            elif event.get('type') == 'verdict':
+                self._progress.pop(event['submission_id'], None)
+            targets = set()
+            for channel in event_channels(event):
+                targets.update(self._subscribers.get(channel, ()))
+        for subscription in targets:
+            subscription.deliver(event)
+
+    def _tail_loop(self):
+        """有订阅者时定期读取其他进程写入的事件；没有订阅者时休眠等待"""
+        while True:
+            if not self.has_subscribers():
+                self._wakeup.wait()
+                self._wakeup.clear()
+                # 空闲期间的事件没有订阅者，从最新位置开始读取
+                self._last_event_id = None
+                continue
+            db = SessionLocal()
+            try:
+                if self._last_event_id is None:
+                    row = fetch_one(db, "SELECT MAX(event_id) AS last_id FROM judge_event")
+                    self._last_event_id = int(row['last_id'] or 0) if row else 0
+                    # 窗口内已有的事件视为已读
+                    self._seen_event_ids = {int(row['event_id']) for row in execute_query(db, """
+                        SELECT event_id FROM judge_event WHERE event_id > :low AND event_id <= :last_id
+                    """, {"low": self._last_event_id - TAIL_RESCAN_WINDOW, "last_id": self._last_event_id})}
+                if self._read_new_events(db):
+                    continue
+            except Exception as e:
+                print(f"[judge_events] 读取评测事件失败: {e}")
+            finally:
+                db.close()
+            time.sleep(self.poll_seconds)
+
+    def _read_new_events(self, db) -> bool:
+        """
+        读取并分发未分发过的事件（包括重扫窗口内晚提交的事件）
+
+        Returns:
+            是否读满一批（还有更多事件待读取）
+        """
+        # 窗口内最多 TAIL_RESCAN_WINDOW 行，多取这么多保证每次至少能读到一批新事件
+        limit = TAIL_RESCAN_WINDOW + TAIL_BATCH_SIZE
+        ids = [int(row['event_id']) for row in execute_query(db, f"""
+            SELECT event_id FROM judge_event
+            WHERE event_id > :low
+            ORDER BY event_id
+            LIMIT {limit}
+        """, {"low": self._last_event_id - TAIL_RESCAN_WINDOW})]
+        unseen = [event_id for event_id in ids if event_id not in self._seen_event_ids]
+        if unseen:
+            placeholders = ', '.join(f':id{i}' for i in range(len(unseen)))
+            rows = execute_query(db, f"""
+                SELECT event_id, payload, origin FROM judge_event
+                WHERE event_id IN ({placeholders})
+                ORDER BY event_id
+            """, {f'id{i}': event_id for i, event_id in enumerate(unseen)})
+            for row in rows:
+                self._seen_event_ids.add(int(row['event_id']))
+                if row['origin'] == self.origin:
+                    continue
+                payload = row['payload']
+                self.dispatch(json.loads(payload) if isinstance(payload, str) else payload)
+        if ids:
+            self._last_event_id = max(self._last_event_id, ids[-1])
+        low = self._last_event_id - TAIL_RESCAN_WINDOW
+        self._seen_event_ids = {event_id for event_id in self._seen_event_ids if event_id > low}
+        return len(ids) == limit
+
+
+def prune_events(db) -> int:
+    """
+    删除超过 JUDGE_EVENTS_RETENTION_SECONDS 的事件，由 JudgePool 的维护线程每 PRUNE_INTERVAL_SECONDS 调用一次
+
+    Returns:
+        删除的事件数
+    """
+    retention_seconds = get_settings().JUDGE_EVENTS_RETENTION_SECONDS
+    return execute_update(db, "DELETE FROM judge_event WHERE created_at < :cutoff", {
+        "cutoff": datetime.utcnow() - timedelta(seconds=retention_seconds)
+    })
+
+
+@lru_cache()
+def get_event_hub() -> EventHub:
+    """返回进程内共享的事件分发中心"""
+    return EventHub()
+
+
+def _build_event(db, event_type: str, submission: dict, payload: dict) -> dict:
+    """补全事件的提交、用户和比赛信息"""
+    submission_id = submission['submission_id']
+    user = fetch_one(db, "SELECT user_id FROM user_submission WHERE submission_id = :submission_id LIMIT 1",
+                     {"submission_id": submission_id})
+    return dict(payload, type=event_type, submission_id=submission_id,
+                user_id=user['user_id'] if user else None, contest_id=submission.get('contest_id'))
+
+
+def _persist_event(db, event: dict):
+    """写入 judge_event 表供其他进程的订阅者读取"""
+    execute_insert(db, """
+        INSERT INTO judge_event (submission_id, event_type, payload, origin, created_at)
+        VALUES (:submission_id, :event_type, :payload, :origin, :created_at)
+    """, {
+        "submission_id": event['submission_id'],
+        "event_type": event['type'],
+        "payload": json.dumps(event),
+        "origin": get_event_hub().origin,
+        "created_at": datetime.utcnow()
+    })
+
+
+def publish_judge_event(db, event_type: str, submission: dict, payload: dict, persist: bool = True):
+    """
+    发布一条评测事件
+
+    Args:
+        db: 数据库会话
+        event_type: 事件类型（verdict、progress）
+        submission: 提交记录，需包含 submission_id，可包含 contest_id
+        payload: 事件内容
+        persist: 是否写入 judge_event 表供其他进程的订阅者读取
+    """
+    event = _build_event(db, event_type, submission, payload)
+    if persist:
+        _persist_event(db, event)
+    get_event_hub().dispatch(event)
+
+
+def publish_verdict(db, submission: dict, status: str, exec_time: int, exec_memory: int, score: Optional[int] = None):
+    """评测完成后发布最终结果，发布失败不影响评测"""
+    try:
+        publish_judge_event(db, 'verdict', submission, {
+            'status': status,
+            'exec_time': exec_time,
+            'exec_memory': exec_memory,
+            'score': score
+        })
+    except Exception as e:
+        print(f"[judge_events] 发布提交 {submission.get('submission_id')} 的评测结果失败: {e}")
+
+
+class JudgeProgress:
+    """
+    一次评测的进度缓冲
+
+    测试点可能在多个线程中并行完成，update 只更新内存中的计数；距上次发布超过
+    JUDGE_PROGRESS_INTERVAL_SECONDS 时才合并发布一条 progress 事件（写库时使用独立的会话）。
+    最终结果由 publish_verdict 发布，不需要再补发最后一次进度。
+    """
+
+    def __init__(self, db, submission: dict, total: int, reused: Optional[Dict[int, Optional[str]]] = None):
+        """
+        Args:
+            db: 数据库会话（仅在构造时用于读取提交所属用户）
+            submission: 提交记录
+            total: 测试点总数（包括复用结果的测试点）
+            reused: 增量重测时复用结果的测试点：编号 -> 结果状态，计为已完成
+        """
+        self.interval = get_settings().JUDGE_PROGRESS_INTERVAL_SECONDS
+        self.total = total
+        self.completed = 0
+        # 编号最小的未通过测试点及其结果，与最终判定一致
+        self.worst_index = None
+        self.worst_status = 'accepted'
+        for index, status in (reused or {}).items():
+            self._record(index, status)
+        self._lock = Lock()
+        self._last_publish = time.monotonic()
+        try:
+            self._event = _build_event(db, 'progress', submission, {'status': 'judging'})
+        except Exception as e:
+            print(f"[judge_events] 初始化提交 {submission.get('submission_id')} 的评测进度失败: {e}")
+            self._event = None
+
+    def update(self, index: int, status: Optional[str]):
+        """
+        记录一个测试点的结果
+
+        Args:
+            index: 测试点编号
+            status: 测试点结果，None 表示未运行（ACM 模式下被跳过）
+        """
+        if self._event is None or self.interval <= 0:
+            return
+        with self._lock:
+            self._record(index, status)
+            now = time.monotonic()
+            if now - self._last_publish < self.interval or self.completed >= self.total:
+                return
+            self._last_publish = now
+            event = dict(self._event, completed=self.completed, total=self.total, worst_status=self.worst_status)
+        self._publish(event)
+
+    def _record(self, index: int, status: Optional[str]):
+        """计入一个已完成的测试点（调用方需持有锁，构造时除外）"""
+        self.completed += 1
+        if status not in (None, 'accepted', 'skipped') and (self.worst_index is None or index < self.worst_index):
+            self.worst_index = index
+            self.worst_status = status
+
+    def _publish(self, event: dict):
+        get_event_hub().dispatch(event)
+        db = SessionLocal()
+        try:
+            _persist_event(db, event)
+        except Exception as e:
+            print(f"[judge_events] 发布提交 {event['submission_id']} 的评测进度失败: {e}")
+        finally:
+            db.close()
@@ -0,0 +1,207 @@
+"""
+Java 运行配置
+
+评测 Java 时 JVM 启动往往比选手算法本身更耗时，这里为评测准备统一的启动配置：
+- 类数据共享（CDS）归档：用一个覆盖常用输入输出和集合类的预热程序记录加载的 JDK 类，
+  生成共享归档，之后每次启动直接映射归档，省去类加载和校验；
+- 启动参数：串行 GC（单核评测下停顿最少、不占额外 GC 线程）、关闭 perf 数据文件，
+  堆上限取题目的 memory_limit；
+- 空程序探针：编译一个什么都不做的 Main，评测引擎用它标定 JVM 自身的启动开销。
+
+归档和探针按 JDK 版本缓存在临时目录中，生成失败时仅使用启动参数，不影响评测。
+"""
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import uuid
+from functools import lru_cache
+from threading import Lock
+from typing import List, Optional
+
+from app.config import get_settings
+
+# 预热程序：尽量覆盖选手常用的 JDK 类，使它们进入共享归档
+WARMUP_SOURCE = r'''
+import java.io.*;
+import java.math.*;
+import java.util.*;
+import java.util.stream.*;
+
+public class Warmup {
+    public static void main(String[] args) throws IOException {
+        BufferedReader br = new BufferedReader(new InputStreamReader(System.in));
+        StringTokenizer st = new StringTokenizer(br.readLine());
+        int n = Integer.parseInt(st.nextToken());
+        long m = Long.parseLong(st.nextToken());
+        double d = Double.parseDouble(br.readLine().trim());
+        Scanner sc = new Scanner(br);
+        String word = sc.next();
+
+        List<Integer> list = new ArrayList<>();
+        LinkedList<Integer> linked = new LinkedList<>();
+        ArrayDeque<Integer> deque = new ArrayDeque<>();
+        PriorityQueue<Long> pq = new PriorityQueue<>(Comparator.reverseOrder());
+        Map<String, Integer> map = new HashMap<>();
+        TreeMap<Integer, Integer> tree = new TreeMap<>();
+        Set<Integer> set = new HashSet<>();
+        TreeSet<Integer> sorted = new TreeSet<>();
+        for (int i = 0; i < n; i++) {
+            list.add(i);
+            linked.add(i);
+            deque.push(i);
+            pq.add(m * i);
+            map.merge(word + i % 3, 1, Integer::sum);
+            tree.put(i, i * i);
+            set.add(i);
+            sorted.add(-i);
+        }
+        int[] arr = new int[n];
+        long[][] grid = new long[n][n];
+        Arrays.fill(arr, 1);
+        Arrays.sort(arr);
+        Collections.sort(list, (a, b) -> b - a);
+        int sum = list.stream().mapToInt(Integer::intValue).sum();
+        String joined = IntStream.range(0, n).mapToObj(String::valueOf).collect(Collectors.joining(" "));
+        BigInteger big = BigInteger.valueOf(m).pow(3).mod(BigInteger.TEN);
+        BigDecimal dec = new BigDecimal(d).setScale(3, RoundingMode.HALF_UP);
+
+        StringBuilder sb = new StringBuilder();
+        sb.append(sum).append(' ').append(joined).append('\n');
+        sb.append(String.format("%.6f %d %s%n", Math.sqrt(d), Math.abs(m), dec));
+        PrintWriter out = new PrintWriter(new BufferedWriter(new OutputStreamWriter(System.out)));
+        out.println(sb);
+        out.printf("%s %d %d %d%n", big, pq.peek(), tree.firstKey(), grid.length + deque.size() + map.size());
+        System.out.println(set.size() + sorted.first() + linked.size());
+        out.flush();
+    }
+}
+'''
+
+WARMUP_INPUT = b'5 7\n3.5\nword\n'
+
+# 空程序：用于标定 JVM 启动本身的 CPU 时间和内存
+PROBE_SOURCE = 'public class Main { public static void main(String[] args) { } }\n'
+
+# 修改生成方式时递增，使旧的缓存目录失效
+PROFILE_VERSION = '1'
+
+
+class JavaProfile:
+    """评测使用的 JVM 启动配置"""
+
+    def __init__(self, archive_path: Optional[str] = None, probe_classpath: Optional[str] = None):
+        """
+        Args:
+            archive_path: CDS 归档路径，为空表示不使用归档
+            probe_classpath: 空程序 Main.class 所在目录，为空表示无法标定启动开销
+        """
+        self.archive_path = archive_path
+        self.probe_classpath = probe_classpath
+        # 由评测引擎首次运行 Java 时标定：JVM 启动本身的 CPU 时间（毫秒）和峰值内存（KB）
+        self.startup_cpu_ms = None
+        self.startup_memory_kb = None
+        self.lock = Lock()
+
+    def jvm_flags(self, memory_limit: int) -> List[str]:
+        """
+        运行选手程序时的 JVM 参数
+
+        Args:
+            memory_limit: 内存限制（MB），作为堆上限（JVM 预留的虚拟地址空间远大于实际使用，不能用 RLIMIT_AS）
+        """
+        flags = ['-XX:+UseSerialGC', '-XX:-UsePerfData', f'-Xmx{memory_limit}m']
+        if self.archive_path:
+            # auto：归档与当前 JVM 不匹配时静默退回正常类加载
+            flags += ['-Xshare:auto', f'-XX:SharedArchiveFile={self.archive_path}']
+        return flags
+
+
+def _run(cmd: List[str], cwd: str, stdin: bytes = b'') -> bool:
+    try:
+        result = subprocess.run(cmd, cwd=cwd, input=stdin, capture_output=True, timeout=120)
+        return result.returncode == 0
+    except (OSError, subprocess.SubprocessError):
+        return False
+
+
+def _build_profile(profile_dir: str, java: str, javac: str):
+    """在 profile_dir 中编译预热程序和探针，并生成 CDS 归档（任何一步失败都只是缺少对应文件）"""
+    warmup_dir = os.path.join(profile_dir, 'warmup')
+    probe_dir = os.path.join(profile_dir, 'probe')
+    os.makedirs(warmup_dir)
+    os.makedirs(probe_dir)
+    with open(os.path.join(warmup_dir, 'Warmup.java'), 'w', encoding='utf-8') as f:
+        f.write(WARMUP_SOURCE)
+    with open(os.path.join(probe_dir, 'Main.java'), 'w', encoding='utf-8') as f:
+        f.write(PROBE_SOURCE)
+
+    _run([javac, 'Main.java'], probe_dir)
+    if not _run([javac, 'Warmup.java'], warmup_dir):
+        return
+
+    # 记录预热程序加载的类，只保留 JDK 自身的类（选手的类每次都不同）
+    class_list = os.path.join(profile_dir, 'classes.lst')
+    if not _run([java, '-Xshare:off', '-XX:+UseSerialGC', f'-XX:DumpLoadedClassList={class_list}',
+                 '-cp', warmup_dir, 'Warmup'], warmup_dir, WARMUP_INPUT):
+        return
+    with open(class_list, encoding='utf-8', errors='replace') as f:
+        classes = [line for line in f if not line.startswith('Warmup')]
+    with open(class_list, 'w', encoding='utf-8') as f:
+        f.writelines(classes)
+
+    archive_path = os.path.join(profile_dir, 'judge.jsa')
+    if not _run([java, '-Xshare:dump', '-XX:+UseSerialGC', f'-XX:SharedClassListFile={class_list}',
+                 f'-XX:SharedArchiveFile={archive_path}'], profile_dir):
+        return
+    # 确认归档可以被当前 JVM 加载，否则删除归档
+    if not _run([java, '-Xshare:on', '-XX:+UseSerialGC', f'-XX:SharedArchiveFile={archive_path}', '-version'], profile_dir):
+        try:
+            os.remove(archive_path)
+        except OSError:
+            pass
+
+
+def _load_profile(profile_dir: str) -> JavaProfile:
+    archive_path = os.path.join(profile_dir, 'judge.jsa')
+    probe_classpath = os.path.join(profile_dir, 'probe')
+    return JavaProfile(
+        archive_path if os.path.exists(archive_path) else None,
+        probe_classpath if os.path.exists(os.path.join(probe_classpath, 'Main.class')) else None
+    )
+
+
+@lru_cache()
+def get_java_profile() -> JavaProfile:
+    """返回进程内共享的 Java 运行配置，首次调用时按需生成 CDS 归档"""
+    settings = get_settings()
+    java, javac = settings.JAVA_EXECUTABLE, settings.JAVAC_EXECUTABLE
+    if not settings.JUDGE_JAVA_CDS:
+        return JavaProfile()
+    try:
+        version = subprocess.run([java, '-version'], capture_output=True, timeout=30)
+    except (OSError, subprocess.SubprocessError):
+        # 未安装 Java，运行时会按普通方式报错
+        return JavaProfile()
+
+    # 同一 JDK 的归档可以在进程间、重启后复用
+    digest = hashlib.sha256(
+        '\0'.join([PROFILE_VERSION, java, javac]).encode('utf-8') + version.stdout + version.stderr
+    ).hexdigest()[:16]
+    base_dir = settings.JUDGE_TEMP_DIR or tempfile.gettempdir()
+    profile_dir = os.path.join(base_dir, f'codefuse_java_{digest}')
+    if os.path.isdir(profile_dir):
+        return _load_profile(profile_dir)
+
+    # 先在临时目录中生成再原子重命名，避免并发进程看到生成了一半的目录
+    tmp_dir = f'{profile_dir}.{uuid.uuid4().hex}.tmp'
+    try:
+        _build_profile(tmp_dir, java, javac)
+        os.rename(tmp_dir, profile_dir)
+    except OSError:
+        # 其他进程已经生成完毕
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not os.path.isdir(profile_dir):
+            return JavaProfile()
+    return _load_profile(profile_dir)
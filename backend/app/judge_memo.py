@@ -0,0 +1,115 @@
+"""
+评测结果复用
+
+同一题目、同一份测试数据和评测配置下，相同语言、逐字节相同的代码评测结果是确定的
+（用时会有少量波动）。评测完成后把结果记入 verdict_memo 表，之后再次评测相同的
+（题目, 评测配置哈希, 语言, 代码哈希）时直接复用，不再编译和运行：
+
+- 学生反复提交同一份代码；
+- rejudge_bulk 重测代码和测试数据都没有变化的提交。
+
+评测配置哈希覆盖测试数据（题目的 test_data_hash，旧题目没有时为整个 test_cases）、各测试点分数
+以及时间/内存限制、检查器和评测模式，任何一项变化都会使旧结果失效。
+写入新结果时清理该题目测试数据或配置已变化的旧结果（problem_hash 不同）；只是评测模式不同的结果保留，
+同一题目同时用于 ACM 比赛和 OI 练习时两边的结果互不清除。
+system_error 不记录。
+重测时可以指定 force 跳过复用、强制重新运行。
+"""
+import hashlib
+import json
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy.exc import IntegrityError
+
+from app.database import execute_update, fetch_one
+
+# 不记录的评测结果（与代码无关的故障）
+UNCACHEABLE_STATUSES = ('judging', 'system_error')
+
+
+def problem_config_hash(problem: dict) -> str:
+    """题目测试数据及评测配置（不含评测模式）的哈希，变化时该题目的旧结果全部失效"""
+    h = hashlib.sha256()
+    test_cases = problem.get('test_cases') or ''
+    if problem.get('test_data_hash'):
+        # 测试数据已有整体哈希，不必对全部测试数据再做一次哈希，只需补上分数
+        if isinstance(test_cases, str):
+            test_cases = json.loads(test_cases) if test_cases else []
+        h.update(problem['test_data_hash'].encode('ascii'))
+        h.update(json.dumps([tc.get('score', 10) for tc in test_cases]).encode('utf-8'))
+    else:
+        if not isinstance(test_cases, str):
+            test_cases = json.dumps(test_cases, sort_keys=True)
+        h.update(test_cases.encode('utf-8'))
+    for key in ('time_limit', 'memory_limit', 'checker_type', 'checker_epsilon', 'checker_language', 'checker_code'):
+        h.update(b'\0' + str(problem.get(key)).encode('utf-8'))
+    return h.hexdigest()
+
+
+def judge_config_hash(problem: dict, judge_mode: str, problem_hash: Optional[str] = None) -> str:
+    """题目测试数据及评测配置（含评测模式）的哈希"""
+    problem_hash = problem_hash or problem_config_hash(problem)
+    return hashlib.sha256(f'{problem_hash}\0{judge_mode}'.encode('utf-8')).hexdigest()
+
+
+def code_hash(code: str) -> str:
+    return hashlib.sha256((code or '').encode('utf-8')).hexdigest()
+
+
+def lookup_verdict(db, problem: dict, judge_mode: str, language: str, code: str) -> Optional[dict]:
+    """
+    查找可复用的评测结果
+
+    Returns:
+        {'status', 'exec_time', 'exec_memory', 'score', 'judge_results'}，没有时返回 None
+    """
+    return fetch_one(db, """
+        SELECT status, exec_time, exec_memory, score, judge_results FROM verdict_memo
+        WHERE problem_id = :problem_id AND config_hash = :config_hash
+            AND language = :language AND code_hash = :code_hash
+    """, {
+        "problem_id": problem['problem_id'],
+        "config_hash": judge_config_hash(problem, judge_mode),
+        "language": (language or '').lower(),
+        "code_hash": code_hash(code)
+    })
+
+
+def store_verdict(db, problem: dict, judge_mode: str, language: str, code: str, status: str,
+                  exec_time: int, exec_memory: int, score: int, judge_results: Optional[str]):
+    """记录一次评测结果，并清理该题目在旧测试数据或配置下的结果（保留其他评测模式的结果）"""
+    if status in UNCACHEABLE_STATUSES:
+        return
+    problem_hash = problem_config_hash(problem)
+    config_hash = judge_config_hash(problem, judge_mode, problem_hash)
+    try:
+        execute_update(db, """
+            INSERT INTO verdict_memo (
+                problem_id, problem_hash, config_hash, language, code_hash, status, exec_time, exec_memory, score,
+                judge_results, created_at
+            ) VALUES (
+                :problem_id, :problem_hash, :config_hash, :language, :code_hash, :status, :exec_time, :exec_memory, :score, :judge_results, :now
+            )
+        """, {
+            "problem_id": problem['problem_id'],
+            "problem_hash": problem_hash,
+            "config_hash": config_hash,
+            "language": (language or '').lower(),
+            "code_hash": code_hash(code),
+            "status": status,
+            "exec_time": exec_time,
+            "exec_memory": exec_memory,
+            "score": score,
+            "judge_results": judge_results,
+            "now": datetime.utcnow()
+        })
+    except IntegrityError:
+        # 相同代码被并发评测，已有记录
+        db.rollback()
+        return
+    # problem_hash 为空的是加入该列之前的记录，无法判断是否过期，一并清理
+    execute_update(db, """
+        DELETE FROM verdict_memo
+        WHERE problem_id = :problem_id AND (problem_hash IS NULL OR problem_hash <> :problem_hash)
+    """, {"problem_id": problem['problem_id'], "problem_hash": problem_hash})
@@ -1,15 +1,277 @@
-from typing import Optional, Tuple
+from typing import Callable, Optional, Tuple, List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from threading import BoundedSemaphore, Lock
 import json
+import os
 import time
 from datetime import datetime
 
-from app.database import SessionLocal, execute_update, fetch_one
+from app.config import get_settings
+from app.database import SessionLocal, execute_query, execute_update, fetch_one
+from app.compile_cache import CompileCache
+from app.judge_checker import CHECKER_CUSTOM, CHECKER_LINE, CHECKER_TYPES, test_case_data_hash
 from app.judge_engine import JudgeEngine
+from app.judge_events import JudgeProgress, publish_verdict
+from app.judge_memo import lookup_verdict, store_verdict
+from app.problem_cache import get_problem_cache
+from app.test_data import test_case_files
 
 
-def run_submission_judge(submission_id: int, db=None):
+@lru_cache()
+def _get_run_slots() -> BoundedSemaphore:
+    """全局运行槽位：同时运行的测试点进程总数不超过 JUDGE_MAX_WORKERS。
+
+    无论测试点是顺序还是并行执行，每次运行都要先占用一个槽位，因此开启单提交内并行
+    不会让整机的评测进程数超过全局预算。
+    """
+    settings = get_settings()
+    max_workers = getattr(settings, 'JUDGE_MAX_WORKERS', None) or 4
+    return BoundedSemaphore(max_workers)
+
+
+# 已编译的 custom 检查器：内容哈希 -> prepare 产物。检查器只编译一次，供所有提交复用
+_checker_artifacts: Dict[str, str] = {}
+# 每个检查器一把编译锁：同一检查器只编译一次，不同检查器的编译互不阻塞
+_checker_compile_locks: Dict[str, Lock] = {}
+_checker_lock = Lock()
+
+
+def _get_custom_checker(judge_engine: JudgeEngine, language: str, code: str) -> Tuple[str, str]:
+    """
+    获取（必要时编译）custom 检查器
+
+    已编译的检查器直接返回，不加锁；编译只持有该检查器自己的锁，
+    全局锁只保护字典的读写，不会因为一个检查器编译而阻塞其他题目的评测。
+
+    Returns:
+        (status, artifact_or_error_message)，与 JudgeEngine.prepare 相同
+    """
+    key = CompileCache.make_key(language, 'checker', [], code)
+    artifact = _checker_artifacts.get(key)
+    if artifact and os.path.exists(artifact):
+        return 'success', artifact
+    with _checker_lock:
+        compile_lock = _checker_compile_locks.setdefault(key, Lock())
+    with compile_lock:
+        # 等锁期间其他线程可能已经编译好
+        artifact = _checker_artifacts.get(key)
+        if artifact and os.path.exists(artifact):
+            return 'success', artifact
+        status, artifact = judge_engine.prepare(code, language)
+        if status == 'success':
+            with _checker_lock:
+                _checker_artifacts[key] = artifact
+        return status, artifact
+
+
+def _prepare_checker(judge_engine: JudgeEngine, problem: dict) -> dict:
+    """根据题目配置构造传给 run_test 的检查器配置；custom 检查器编译失败时抛出异常"""
+    checker_type = (problem.get('checker_type') or CHECKER_LINE).lower()
+    if checker_type not in CHECKER_TYPES:
+        checker_type = CHECKER_LINE
+    checker = {'type': checker_type, 'epsilon': problem.get('checker_epsilon')}
+    if checker_type == CHECKER_CUSTOM:
+        language = (problem.get('checker_language') or 'cpp').lower()
+        status, artifact = _get_custom_checker(judge_engine, language, problem.get('checker_code') or '')
+        if status != 'success':
+            raise RuntimeError(f'检查器编译失败: {artifact}')
+        checker.update(language=language, artifact=artifact)
+    return checker
+
+
+JUDGE_MODE_OI = 'oi'
+JUDGE_MODE_ACM = 'acm'
+
+
+def _resolve_judge_mode(db, submission: dict, problem: dict) -> str:
+    """确定本次评测的模式：比赛设置优先，其次题目设置，默认 OI（全部测试点计分）"""
+    mode = None
+    if submission.get('contest_id'):
+        contest = fetch_one(db, "SELECT judge_mode FROM contest WHERE contest_id = :contest_id",
+                            {"contest_id": submission['contest_id']})
+        if contest:
+            mode = contest.get('judge_mode')
+    mode = (mode or problem.get('judge_mode') or JUDGE_MODE_OI).lower()
+    return JUDGE_MODE_ACM if mode == JUDGE_MODE_ACM else JUDGE_MODE_OI
+
+
+def _run_test_cases(judge_engine: JudgeEngine, language: str, artifact: str, test_cases: List[dict], problem: dict,
+                    stop_on_failure: bool = False, checker: Optional[dict] = None,
+                    on_result: Optional[Callable[[int, Optional[str]], None]] = None,
+                    test_files: Optional[List[Tuple[Optional[str], Optional[str]]]] = None) -> List[Optional[dict]]:
+    """使用已准备好的产物运行全部测试点，返回与 test_cases 顺序一致的结果列表。
+
+    JUDGE_CASE_PARALLELISM > 1 时，测试点会分发到一个单提交内的有界线程池并行运行。
+    stop_on_failure 为 True（ACM 模式）时，首个未通过测试点之后的测试点不再运行，
+    对应位置返回 None。并行时编号更小的测试点仍会全部运行，保证判定结果与顺序评测一致。
+    on_result 在每个测试点完成（或被跳过）后以 (编号, 结果状态或 None) 调用，用于上报进度。
+    test_files 为各测试点的 (输入文件, 期望输出文件)（见 app.test_data.test_case_files），
+    文件为 None 的测试点使用 JSON 中内联的数据。
+    """
+    run_slots = _get_run_slots()
+    # 已知未通过的最小测试点编号，编号更大的测试点无需再运行
+    first_failure = [len(test_cases)]
+    failure_lock = Lock()
+
+    def run_one(index: int) -> Optional[dict]:
+        result = _run_one(index)
+        if on_result is not None:
+            on_result(index, result['status'] if result else None)
+        return result
+
+    def _run_one(index: int) -> Optional[dict]:
+        if stop_on_failure and index > first_failure[0]:
+            return None
+        test_case = test_cases[index]
+        input_path, expected_path = test_files[index] if test_files else (None, None)
+        with run_slots:
+            # 等待槽位期间可能已有其他测试点失败
+            if stop_on_failure and index > first_failure[0]:
+                return None
+            result = judge_engine.run_test(
+                language,
+                artifact,
+                input_data=test_case.get('input_data', ''),
+                expected_output=test_case.get('output_data', ''),
+                time_limit=problem.get('time_limit'),
+                memory_limit=problem.get('memory_limit'),
+                input_path=input_path,
+                expected_digest=test_case.get('output_digest'),
+                checker=checker,
+                expected_path=expected_path
+            )
+        if result['status'] != 'accepted':
+            with failure_lock:
+                first_failure[0] = min(first_failure[0], index)
+        return result
+
+    parallelism = min(get_settings().JUDGE_CASE_PARALLELISM, len(test_cases))
+    if parallelism <= 1:
+        results = [run_one(i) for i in range(len(test_cases))]
+    else:
+        with ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix='judge-cases') as pool:
+            # map 保持输入顺序，结果仍按 test_case_index 排列
+            results = list(pool.map(run_one, range(len(test_cases))))
+
+    if stop_on_failure:
+        # 并行时失败点之后可能已有测试点跑完，统一记为跳过，结果与顺序评测一致
+        results = [None if i > first_failure[0] else r for i, r in enumerate(results)]
+    return results
+
+
+# 不能在增量重测中复用的测试点结果（与测试点数据无关或未实际运行）
+NON_REUSABLE_STATUSES = ('skipped', 'compile_error', 'system_error')
+
+
+def _memoizable(prepare_status: str, run_results: List[Optional[dict]], time_limit: Optional[int]) -> bool:
+    """评测结果是否只由代码和测试数据决定，可以记入 verdict_memo
+
+    编译阶段的环境故障（超时、异常）、评测机内部异常、检查器故障以及只按墙钟时间判定的超时
+    （CPU 时间未超限，与判题机负载有关）都可能在重新评测时得到不同结果，不记录。
+    """
+    if prepare_status == 'error':
+        return False
+    for result in run_results:
+        if result is None:
+            continue
+        if result.get('internal_error') or result['status'] == 'system_error':
+            return False
+        if result['status'] == 'time_limit_exceeded' and time_limit and result['time_used'] <= time_limit:
+            return False
+    return True
+
+
+def _reusable_results(submission: dict, test_cases: List[dict]) -> Dict[int, dict]:
+    """
+    增量重测：找出上次评测中数据未变化的测试点结果
+
+    上次的结果按测试点数据哈希（data_hash，旧结果由其中保存的输入和期望输出计算）匹配到
+    当前测试点，因此测试点的增删和重新排序都不影响匹配。分数按当前测试点重新计算。
+
+    Returns:
+        当前测试点编号 -> 可直接使用的运行结果（与 JudgeEngine.run_test 的返回格式相同）
+    """
+    previous = submission.get('judge_results')
+    if isinstance(previous, str):
+        try:
+            previous = json.loads(previous)
+        except ValueError:
+            previous = None
+    by_hash = {}
+    for result in previous or []:
+        if not isinstance(result, dict) or result.get('status') in NON_REUSABLE_STATUSES:
+            continue
+        if result.get('test_case_index', -1) < 0:
+            continue
+        data_hash = result.get('data_hash') or test_case_data_hash({
+            'input_data': result.get('input_data', ''),
+            'output_data': result.get('expected_output', '')
+        })
+        by_hash.setdefault(data_hash, result)
+
+    reusable = {}
+    for idx, test_case in enumerate(test_cases):
+        result = by_hash.get(test_case_data_hash(test_case))
+        if result is not None:
+            reusable[idx] = {
+                'status': result['status'],
+                'time_used': result.get('time_used', 0),
+                'wall_time': result.get('wall_time', 0),
+                'memory_used': result.get('memory_used', 0),
+                'error_message': result.get('error_message'),
+                'actual_output': result.get('actual_output', '')
+            }
+    return reusable
+
+
+def save_verdict(db, submission: dict, status: str, exec_time: int, exec_memory: int, score: int,
+                 judge_results: Optional[str] = None, test_data_version: Optional[int] = None):
+    """
+    写回评测结果并发布结果事件
+
+    通过 sync_with 同步创建的提交（sync_source_id 指向本提交且仍在评测中）不单独评测，
+    在同一条 UPDATE 中一并写入相同的结果。提交上同时记录评测所依据的测试数据版本。
+
+    Args:
+        db: 数据库会话
+        submission: 被评测的提交记录
+        status: 最终状态
+        exec_time: 最大用时（毫秒）
+        exec_memory: 最大内存（KB）
+        score: 总分
+        judge_results: 各测试点结果（JSON 字符串）
+        test_data_version: 评测时题目的测试数据版本
+    """
+    submission_id = submission['submission_id']
+    synced = execute_query(db, """
+        SELECT submission_id FROM submission WHERE sync_source_id = :submission_id AND status = 'judging'
+    """, {"submission_id": submission_id})
+    target_ids = [submission_id] + [row['submission_id'] for row in synced]
+    placeholders = ', '.join(f':id{i}' for i in range(len(target_ids)))
+    params = {f'id{i}': sid for i, sid in enumerate(target_ids)}
+    params.update(status=status, exec_time=exec_time, exec_memory=exec_memory, score=score,
+                  judge_results=judge_results, test_data_version=test_data_version)
+    execute_update(db, f"""
+        UPDATE submission
+        SET status = :status, exec_time = :exec_time, exec_memory = :exec_memory,
+            judge_results = :judge_results, score = :score, test_data_version = :test_data_version
+        WHERE submission_id IN ({placeholders})
+    """, params)
+    for sid in target_ids:
+        publish_verdict(db, dict(submission, submission_id=sid), status, exec_time, exec_memory, score)
+
+
+def run_submission_judge(submission_id: int, db=None, force: bool = False, incremental: bool = False):
     """Run judge for a submission. If db is None, creates its own SessionLocal and closes it.
 
+    A stored verdict for the same (problem config, language, code) is reused unless ``force``
+    is set or JUDGE_VERDICT_MEMO is disabled.
+
+    With ``incremental`` the submission's previous ``judge_results`` are kept for test cases
+    whose data did not change and only added/changed test cases are run (see
+    ``_reusable_results``); nothing is compiled if no test case needs to run.
+
     This function contains the core logic previously inside `judge_submission` so it can be
     executed either synchronously (with a provided db session) or asynchronously in a worker
     thread (where it will create its own db session).
@@ -26,31 +288,32 @@ def run_submission_judge(submission_id: int, db=None):
         if not submission:
             raise ValueError("提交记录不存在")
 
-        # 获取题目信息
-        prob_sql = "SELECT * FROM problem WHERE problem_id = :problem_id"
-        problem = fetch_one(db, prob_sql, {"problem_id": submission['problem_id']})
+        # 获取题目配置和解析后的测试点（测试数据版本未变时使用进程内缓存）
+        problem = get_problem_cache().get_problem(db, submission['problem_id'])
         if not problem:
             raise ValueError("题目不存在")
 
-        # 获取测试点
-        test_cases = json.loads(problem['test_cases']) if problem.get('test_cases') else []
+        # 测试数据版本在写回结果时记录在提交上
+        test_cases = problem['test_cases']
+        test_data_version = problem.get('test_data_version')
 
         if not test_cases:
-            update_sql = """
-                UPDATE submission 
-                SET status = :status, exec_time = :exec_time, exec_memory = :exec_memory
-                WHERE submission_id = :submission_id
-            """
-            execute_update(db, update_sql, {
-                "status": 'accepted',
-                "exec_time": 0,
-                "exec_memory": 0,
-                "submission_id": submission_id
-            })
+            save_verdict(db, submission, 'accepted', 0, 0, 0, test_data_version=test_data_version)
             return
 
         # 初始化评测引擎
         judge_engine = JudgeEngine()
+        language = submission['language']
+        judge_mode = _resolve_judge_mode(db, submission, problem)
+
+        # 相同代码在相同评测配置下已有结果时直接复用，不再编译运行
+        memo_enabled = get_settings().JUDGE_VERDICT_MEMO
+        if memo_enabled and not force:
+            memo = lookup_verdict(db, problem, judge_mode, language, submission['code'])
+            if memo:
+                save_verdict(db, submission, memo['status'], memo['exec_time'], memo['exec_memory'],
+                             memo['score'] or 0, memo['judge_results'], test_data_version)
+                return
 
         total_score = 0
         max_time = 0
@@ -58,16 +321,71 @@ def run_submission_judge(submission_id: int, db=None):
         final_status = 'accepted'
         judge_results_list = []
 
+        stop_on_failure = judge_mode == JUDGE_MODE_ACM
+        reusable = _reusable_results(submission, test_cases) if incremental else {}
+        pending = [i for i in range(len(test_cases)) if i not in reusable]
+        if stop_on_failure and pending:
+            # ACM 模式下已知未通过的测试点之后无需运行
+            known_failures = [i for i, r in reusable.items() if r['status'] != 'accepted']
+            if known_failures:
+                pending = [i for i in pending if i < min(known_failures)]
+
+        # 每份提交只编译一次，所有测试点复用同一份产物；增量重测无需运行任何测试点时不编译
+        if pending:
+            prepare_status, artifact = judge_engine.prepare(submission['code'], language)
+        else:
+            prepare_status, artifact = 'reused', None
+
         try:
-            for idx, test_case in enumerate(test_cases):
-                status_result, time_used, memory_used, error_msg, actual_output = judge_engine.judge(
-                    code=submission['code'],
-                    language=submission['language'],
-                    input_data=test_case.get('input_data', ''),
-                    expected_output=test_case.get('output_data', ''),
-                    time_limit=problem.get('time_limit'),
-                    memory_limit=problem.get('memory_limit')
-                )
+            if prepare_status == 'success':
+                checker = _prepare_checker(judge_engine, problem)
+                pending_cases = [test_cases[i] for i in pending]
+                # 测试数据文件在运行前准备好（本地没有缓存时从数据库取出），运行时直接作为 stdin 和期望输出
+                test_files = [test_case_files(db, tc) for tc in pending_cases]
+                # 进度按题目的测试点总数计算，增量重测复用的结果计为已完成；回调中的编号换算回测试点编号
+                progress = JudgeProgress(db, submission, len(test_cases),
+                                         reused={i: r['status'] for i, r in reusable.items()})
+                pending_results = _run_test_cases(judge_engine, language, artifact, pending_cases, problem,
+                                                  stop_on_failure=stop_on_failure, checker=checker,
+                                                  on_result=lambda i, status: progress.update(pending[i], status),
+                                                  test_files=test_files)
+                run_results = [reusable.get(i) for i in range(len(test_cases))]
+                for idx, result in zip(pending, pending_results):
+                    run_results[idx] = result
+            elif prepare_status == 'reused':
+                run_results = [reusable.get(i) for i in range(len(test_cases))]
+            else:
+                # 编译失败时 artifact 为错误信息，每个测试点都记为 compile_error
+                run_results = [{
+                    'status': 'compile_error',
+                    'time_used': 0,
+                    'wall_time': 0,
+                    'memory_used': 0,
+                    'error_message': artifact,
+                    'actual_output': ''
+                } for _ in test_cases]
+
+            if stop_on_failure and prepare_status in ('success', 'reused'):
+                # 合并复用结果后，首个未通过测试点之后的测试点统一记为跳过
+                first_failure = next((i for i, r in enumerate(run_results) if r and r['status'] != 'accepted'),
+                                     len(run_results))
+                run_results = [None if i > first_failure else r for i, r in enumerate(run_results)]
+
+            # 按 test_case_index 顺序汇总结果
+            for idx, (test_case, run_result) in enumerate(zip(test_cases, run_results)):
+                if run_result is None:
+                    # ACM 模式下首个未通过测试点之后的测试点未运行
+                    run_result = {
+                        'status': 'skipped',
+                        'time_used': 0,
+                        'wall_time': 0,
+                        'memory_used': 0,
+                        'error_message': None,
+                        'actual_output': ''
+                    }
+                status_result = run_result['status']
+                time_used = run_result['time_used']
+                memory_used = run_result['memory_used']
 
                 score = test_case.get('score', 10) if status_result == 'accepted' else 0
                 total_score += score
@@ -78,32 +396,30 @@ def run_submission_judge(submission_id: int, db=None):
                     "test_case_index": idx,
                     "status": status_result,
                     "time_used": time_used,
+                    "wall_time": run_result['wall_time'],
                     "memory_used": memory_used,
                     "score": score,
-                    "error_message": error_msg,
+                    "data_hash": test_case_data_hash(test_case),
+                    "error_message": run_result['error_message'],
+                    # 测试数据已存入 test_blob 时只记录哈希，查看详情时再取出
                     "input_data": test_case.get('input_data', ''),
                     "expected_output": test_case.get('output_data', ''),
-                    "actual_output": actual_output
+                    "input_hash": test_case.get('input_hash'),
+                    "output_hash": test_case.get('output_hash'),
+                    "actual_output": run_result['actual_output']
                 }
                 judge_results_list.append(judge_result)
 
-                if status_result != 'accepted' and final_status == 'accepted':
+                if status_result not in ('accepted', 'skipped') and final_status == 'accepted':
                     final_status = status_result
 
-            # 所有测试点完成后写回数据库
+            # 所有测试点完成后写回数据库（同步提交一并写入）
             judge_results_json = json.dumps(judge_results_list)
-            update_sql = """
-                UPDATE submission 
-                SET status = :status, exec_time = :exec_time, exec_memory = :exec_memory, judge_results = :judge_results
-                WHERE submission_id = :submission_id
-            """
-            execute_update(db, update_sql, {
-                "status": final_status,
-                "exec_time": max_time,
-                "exec_memory": max_memory,
-                "judge_results": judge_results_json,
-                "submission_id": submission_id
-            })
+            save_verdict(db, submission, final_status, max_time, max_memory, total_score, judge_results_json,
+                         test_data_version)
+            if memo_enabled and _memoizable(prepare_status, run_results, problem.get('time_limit')):
+                store_verdict(db, problem, judge_mode, language, submission['code'], final_status,
+                              max_time, max_memory, total_score, judge_results_json)
         except Exception as e:
             # 若出现未捕获异常，确保不会把提交一直留在 judging 状态，记录为 system_error
             try:
@@ -118,21 +434,15 @@ def run_submission_judge(submission_id: int, db=None):
                     "expected_output": "",
                     "actual_output": ""
                 }]
-                execute_update(db, """
-                    UPDATE submission 
-                    SET status = :status, exec_time = :exec_time, exec_memory = :exec_memory, judge_results = :judge_results
-                    WHERE submission_id = :submission_id
-                """, {
-                    "status": 'system_error',
-                    "exec_time": max_time,
-                    "exec_memory": max_memory,
-                    "judge_results": json.dumps(error_result),
-                    "submission_id": submission_id
-                })
+                save_verdict(db, submission, 'system_error', max_time, max_memory, 0, json.dumps(error_result),
+                             test_data_version)
             except Exception:
                 pass
             # 不抛出异常以免线程池日志混乱；已将状态更新到 DB
             return
+        finally:
+            if prepare_status == 'success':
+                judge_engine.cleanup(artifact)
 
     finally:
         if created_session:
@@ -0,0 +1,240 @@
+/*
+ * CodeFuse 评测运行器
+ *
+ * 由 app/judge_sandbox.py 在首次使用时用 GCC 编译。评测引擎通过本程序启动选手程序：
+ * 本程序 fork 出子进程，设置资源限制后 exec 选手程序，再用 wait4 回收并把内核统计的
+ * 资源占用写到结果描述符。
+ *
+ * 之所以不直接在 Python 中 wait4：exec 时内核会把 exec 之前地址空间的峰值 RSS 计入
+ * ru_maxrss，直接从评测进程 fork 出来的程序都会带上整个 Python 进程的内存。本程序体积
+ * 很小，从这里 fork 出来的子进程的 ru_maxrss 才是选手程序自身的峰值内存。
+ *
+ * 用法:
+ *   judge_sandbox <result_fd> <cpu_ms> <wall_ms> <memory_kb> <output_bytes> <program> [args...]
+ *   限制参数为 0 表示不限制。
+ *
+ * 结果（写入 result_fd，一行）:
+ *   <exit_code> <term_signal> <cpu_us> <wall_us> <max_rss_kb> <wall_timed_out> <memory_limit_hit>
+ *   进程被信号终止时 exit_code 为 -1。
+ *
+ * 内存限制由 RLIMIT_AS 强制，超限的分配直接失败，峰值 RSS 不会接近限制（例如一次 malloc 300MB
+ * 失败后使用 NULL 指针段错误）。为了把这类异常退出判为内存超限，限制内存时运行器用 ptrace 附加
+ * 子进程，并通过 seccomp 只在 mmap/mremap（glibc 的 malloc 在 brk 失败后也会退回 mmap）时停下，
+ * 系统调用返回 ENOMEM 即记 memory_limit_hit = 1。其余系统调用不受影响。
+ * 不支持的架构或无法 ptrace（容器禁止等）时不跟踪，memory_limit_hit 恒为 0。
+ */
+#define _GNU_SOURCE
+#include <errno.h>
+#include <signal.h>
+#include <stddef.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/resource.h>
+#include <sys/time.h>
+#include <sys/types.h>
+#include <sys/wait.h>
+#include <time.h>
+#include <unistd.h>
+
+#if defined(__linux__) && (defined(__x86_64__) || defined(__aarch64__)) \
+    && defined(__GLIBC__) && (__GLIBC__ > 2 || (__GLIBC__ == 2 && __GLIBC_MINOR__ >= 31))
+#define TRACE_MEMORY 1
+#include <linux/audit.h>
+#include <linux/filter.h>
+#include <linux/seccomp.h>
+#include <sys/prctl.h>
+#include <sys/ptrace.h>
+#include <sys/syscall.h>
+#if defined(__x86_64__)
+#define TRACE_ARCH AUDIT_ARCH_X86_64
+#else
+#define TRACE_ARCH AUDIT_ARCH_AARCH64
+#endif
+#else
+#define TRACE_MEMORY 0
+#endif
+
+static volatile pid_t child = -1;
+static volatile sig_atomic_t wall_timed_out = 0;
+
+static void on_alarm(int sig)
+{
+    (void)sig;
+    wall_timed_out = 1;
+    if (child > 0)
+        kill(child, SIGKILL);
+}
+
+static void set_limit(int resource, rlim_t value)
+{
+    struct rlimit rl;
+    rl.rlim_cur = value;
+    rl.rlim_max = value;
+    setrlimit(resource, &rl);
+}
+
+#if TRACE_MEMORY
+/* 只让 mmap/mremap 停下交给运行器检查返回值，其他系统调用直接放行 */
+static void install_memory_filter(void)
+{
+    struct sock_filter filter[] = {
+        BPF_STMT(BPF_LD | BPF_W | BPF_ABS, offsetof(struct seccomp_data, arch)),
+        BPF_JUMP(BPF_JMP | BPF_JEQ | BPF_K, TRACE_ARCH, 1, 0),
+        BPF_STMT(BPF_RET | BPF_K, SECCOMP_RET_ALLOW),
+        BPF_STMT(BPF_LD | BPF_W | BPF_ABS, offsetof(struct seccomp_data, nr)),
+        BPF_JUMP(BPF_JMP | BPF_JEQ | BPF_K, __NR_mmap, 2, 0),
+        BPF_JUMP(BPF_JMP | BPF_JEQ | BPF_K, __NR_mremap, 1, 0),
+        BPF_STMT(BPF_RET | BPF_K, SECCOMP_RET_ALLOW),
+        BPF_STMT(BPF_RET | BPF_K, SECCOMP_RET_TRACE),
+    };
+    struct sock_fprog prog;
+    prog.len = (unsigned short)(sizeof(filter) / sizeof(filter[0]));
+    prog.filter = filter;
+    if (prctl(PR_SET_NO_NEW_PRIVS, 1, 0, 0, 0) == 0)
+        prctl(PR_SET_SECCOMP, SECCOMP_MODE_FILTER, &prog);
+}
+
+/*
+ * 处理一次 ptrace 停止并让该线程继续运行；mmap/mremap 返回 ENOMEM 时返回 1
+ * seccomp 停止在系统调用入口，用 PTRACE_SYSCALL 再停在出口读取返回值
+ */
+static int resume_traced(pid_t pid, int status)
+{
+    int sig = WSTOPSIG(status);
+    int event = status >> 16;
+    int hit = 0;
+    if (event == PTRACE_EVENT_SECCOMP) {
+        ptrace(PTRACE_SYSCALL, pid, 0, 0);
+        return 0;
+    }
+    if (sig == (SIGTRAP | 0x80)) {
+        struct __ptrace_syscall_info info;
+        if (ptrace(PTRACE_GET_SYSCALL_INFO, pid, (void *)sizeof(info), &info) > 0
+            && info.op == PTRACE_SYSCALL_INFO_EXIT && info.exit.is_error && info.exit.rval == -ENOMEM)
+            hit = 1;
+        ptrace(PTRACE_CONT, pid, 0, 0);
+        return hit;
+    }
+    /* 事件停止（新线程、exec、组停止）直接继续；信号停止把信号原样交给程序 */
+    ptrace(PTRACE_CONT, pid, 0, event ? 0 : sig);
+    return 0;
+}
+#endif
+
+static long long elapsed_us(const struct timespec *start, const struct timespec *end)
+{
+    return (long long)(end->tv_sec - start->tv_sec) * 1000000LL + (end->tv_nsec - start->tv_nsec) / 1000;
+}
+
+int main(int argc, char **argv)
+{
+    if (argc < 7) {
+        fprintf(stderr, "usage: %s <result_fd> <cpu_ms> <wall_ms> <memory_kb> <output_bytes> <program> [args...]\n", argv[0]);
+        return 2;
+    }
+    int result_fd = atoi(argv[1]);
+    long long cpu_ms = atoll(argv[2]);
+    long long wall_ms = atoll(argv[3]);
+    long long memory_kb = atoll(argv[4]);
+    long long output_bytes = atoll(argv[5]);
+
+    struct timespec start, end;
+    clock_gettime(CLOCK_MONOTONIC, &start);
+
+    /* 子进程等父进程附加完成后再 exec：父进程写入 1 表示已附加（需要安装 seccomp 过滤器），0 表示不跟踪 */
+    int sync_pipe[2] = {-1, -1};
+    int tracing = TRACE_MEMORY && memory_kb > 0 && pipe(sync_pipe) == 0;
+
+    child = fork();
+    if (child < 0) {
+        perror("fork");
+        return 2;
+    }
+    if (child == 0) {
+        close(result_fd);
+#if TRACE_MEMORY
+        if (tracing) {
+            char attached = 0;
+            close(sync_pipe[1]);
+            while (read(sync_pipe[0], &attached, 1) < 0 && errno == EINTR)
+                ;
+            close(sync_pipe[0]);
+            if (attached)
+                install_memory_filter();
+        }
+#endif
+        /* CPU 时间按整秒向上取整再多给 1 秒，精确判定由调用方根据 cpu_us 完成 */
+        if (cpu_ms > 0)
+            set_limit(RLIMIT_CPU, (rlim_t)((cpu_ms + 999) / 1000 + 1));
+        if (memory_kb > 0)
+            set_limit(RLIMIT_AS, (rlim_t)memory_kb * 1024);
+        if (output_bytes > 0)
+            set_limit(RLIMIT_FSIZE, (rlim_t)output_bytes);
+        execvp(argv[6], argv + 6);
+        perror("execvp");
+        _exit(127);
+    }
+
+#if TRACE_MEMORY
+    if (tracing) {
+        /* 过滤器会被线程和子进程继承，它们也必须被跟踪，否则 mmap 会因为没有跟踪者而失败 */
+        long options = PTRACE_O_TRACESYSGOOD | PTRACE_O_TRACESECCOMP | PTRACE_O_TRACECLONE
+                     | PTRACE_O_TRACEFORK | PTRACE_O_TRACEVFORK | PTRACE_O_TRACEEXEC | PTRACE_O_EXITKILL;
+        char attached = ptrace(PTRACE_SEIZE, child, 0, options) == 0;
+        close(sync_pipe[0]);
+        if (write(sync_pipe[1], &attached, 1) != 1)
+            attached = 0;
+        close(sync_pipe[1]);
+        tracing = attached;
+    }
+#endif
+
+    struct sigaction sa;
+    memset(&sa, 0, sizeof(sa));
+    sa.sa_handler = on_alarm;
+    sigaction(SIGALRM, &sa, NULL);
+    if (wall_ms > 0) {
+        struct itimerval timer;
+        memset(&timer, 0, sizeof(timer));
+        timer.it_value.tv_sec = wall_ms / 1000;
+        timer.it_value.tv_usec = (wall_ms % 1000) * 1000;
+        setitimer(ITIMER_REAL, &timer, NULL);
+    }
+
+    int status;
+    int memory_limit_hit = 0;
+    struct rusage usage;
+    for (;;) {
+        /* 跟踪时子进程的各个线程也会报告停止和退出，只有主线程（child）退出才结束 */
+        pid_t pid = wait4(tracing ? -1 : child, &status, __WALL, &usage);
+        if (pid < 0) {
+            if (errno == EINTR)
+                continue;
+            perror("wait4");
+            return 2;
+        }
+        if (pid == child && (WIFEXITED(status) || WIFSIGNALED(status)))
+            break;
+#if TRACE_MEMORY
+        if (WIFSTOPPED(status))
+            memory_limit_hit |= resume_traced(pid, status);
+#endif
+    }
+    clock_gettime(CLOCK_MONOTONIC, &end);
+
+    long long cpu_us = (long long)(usage.ru_utime.tv_sec + usage.ru_stime.tv_sec) * 1000000LL
+                     + usage.ru_utime.tv_usec + usage.ru_stime.tv_usec;
+#ifdef __APPLE__
+    long long max_rss_kb = usage.ru_maxrss / 1024; /* macOS 以字节为单位 */
+#else
+    long long max_rss_kb = usage.ru_maxrss;
+#endif
+    int exit_code = WIFEXITED(status) ? WEXITSTATUS(status) : -1;
+    int term_signal = WIFSIGNALED(status) ? WTERMSIG(status) : 0;
+
+    dprintf(result_fd, "%d %d %lld %lld %lld %d %d\n",
+            exit_code, term_signal, cpu_us, elapsed_us(&start, &end), max_rss_kb, (int)wall_timed_out,
+            memory_limit_hit);
+    return 0;
+}
@@ -1,54 +1,614 @@
-from concurrent.futures import ThreadPoolExecutor
+"""Judge worker pool backed by the ``judge_job`` table.
+
+Every submission waiting for a verdict has a row in ``judge_job``. The in-process thread
+pool is only a cache of that queue: a worker must *claim* the row (queued -> running)
+before judging, keeps it alive with a heartbeat while judging, and deletes it once the
+verdict is written. Because the queue lives in the database:
+
+- jobs queued when the API process dies are picked up again at the next startup;
+- jobs whose worker died mid-judge stop heartbeating and are re-queued once their
+  lease (JUDGE_JOB_LEASE_SECONDS) expires; after JUDGE_JOB_MAX_ATTEMPTS claims the
+  submission is marked system_error instead of retrying forever;
+- submissions left in ``judging`` without any job row (e.g. crashed between creating
+  the submission and scheduling it) get a job at startup;
+- on graceful shutdown queued jobs stay in the table, running ones are drained for up
+  to JUDGE_SHUTDOWN_DRAIN_SECONDS and anything still unfinished is released.
+
+Jobs are claimed by priority class (live contest > practice > rejudge). Within a class
+jobs are served round-robin across users: each job records how many jobs its user
+already had outstanding when it was enqueued (``fair_seq``), and lower values go first,
+so one user flooding the queue only delays their own submissions. Among jobs of the
+same round the cheapest estimated job goes first (shortest-expected-job-first, see
+app.judge_cost), and at most JUDGE_PROBLEM_MAX_RUNNING jobs of one problem run at once
+across all judging processes, so a heavy problem cannot occupy the whole fleet (checked
+under a row lock on MySQL/PostgreSQL; a soft cap on databases without row locks).
+"""
+import json
+import os
+import socket
+import uuid
+import time
+from concurrent.futures import Future
+from datetime import datetime, timedelta
 from functools import lru_cache
-from threading import Lock
+from threading import Condition, Event, Lock, Thread
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
 from app.config import get_settings
-from app.judge_runner import run_submission_judge
+from app.database import SessionLocal, execute_query, execute_update, fetch_one
+from app.judge_cost import estimate_job_cost
+from app.judge_events import PRUNE_INTERVAL_SECONDS, prune_events
+from app.judge_runner import run_submission_judge, save_verdict
+from app.compile_cache import get_compile_cache
+from app.problem_cache import get_problem_cache
+from app.test_data import collect_garbage
 
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
 
-class _JudgePoolManager:
-    def __init__(self, max_workers: int):
-        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+# priority classes, claimed in ascending order
+PRIORITY_CONTEST = 0   # submission to a contest that is currently running
+PRIORITY_PRACTICE = 1
+PRIORITY_REJUDGE = 2
+PRIORITY_NAMES = {PRIORITY_CONTEST: 'contest', PRIORITY_PRACTICE: 'practice', PRIORITY_REJUDGE: 'rejudge'}
+
+# bounds of the Retry-After hint returned when a submission is rejected (seconds)
+ADMISSION_MIN_RETRY_SECONDS = 1
+ADMISSION_MAX_RETRY_SECONDS = 300
+
+# candidates tried by one claim_next_job call when the per-problem cap fills up concurrently
+CLAIM_ATTEMPTS = 3
+
+
+def new_worker_id() -> str:
+    """Identify a judging process across hosts: ``host:pid:random``."""
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+def job_priority(contest_live: bool, rejudge: bool = False) -> int:
+    """Priority class of a submission: rejudge, contest (inside the contest window) or practice."""
+    if rejudge:
+        return PRIORITY_REJUDGE
+    return PRIORITY_CONTEST if contest_live else PRIORITY_PRACTICE
+
+
+def enqueue_job(db, submission_id: int, rejudge: bool = False, force: bool = False,
+                incremental: bool = False) -> bool:
+    """Insert a queued job for the submission unless it already has one.
+
+    ``force`` makes the worker re-run the program even if a stored verdict could be reused;
+    ``incremental`` only re-runs test cases whose data changed since the last judge.
+
+    Returns True if a new job row was created.
+    """
+    existing = fetch_one(db, "SELECT job_id FROM judge_job WHERE submission_id = :submission_id",
+                         {"submission_id": submission_id})
+    if existing:
+        return False
+    submission = fetch_one(db, """
+        SELECT s.problem_id, s.language, us.user_id,
+            CASE WHEN c.start_time <= :now AND c.end_time >= :now THEN 1 ELSE 0 END AS contest_live
+        FROM submission s
+        LEFT JOIN contest c ON c.contest_id = s.contest_id
+        LEFT JOIN user_submission us ON us.submission_id = s.submission_id
+        WHERE s.submission_id = :submission_id
+    """, {
+        # contest windows are stored and checked in local time (see routers/contests.py)
+        "submission_id": submission_id, "now": datetime.now()
+    }) or {}
+    priority = job_priority(bool(submission.get('contest_live')), rejudge)
+    fair_seq = 0
+    if submission.get('user_id') is not None:
+        fair_seq = fetch_one(db, """
+            SELECT COUNT(*) AS cnt FROM judge_job WHERE user_id = :user_id AND priority = :priority
+        """, {"user_id": submission['user_id'], "priority": priority})['cnt']
+    estimated_cost = 0
+    if submission.get('problem_id') is not None:
+        estimated_cost = estimate_job_cost(db, submission['problem_id'], submission.get('language'))
+    try:
+        execute_update(db, """
+            INSERT INTO judge_job (
+                submission_id, problem_id, user_id, priority, fair_seq, estimated_cost_ms, status, attempts,
+                force_rerun, incremental, enqueued_at
+            ) VALUES (
+                :submission_id, :problem_id, :user_id, :priority, :fair_seq, :estimated_cost_ms, :status, 0,
+                :force_rerun, :incremental, :now
+            )
+        """, {
+            "submission_id": submission_id,
+            "problem_id": submission.get('problem_id'),
+            "user_id": submission.get('user_id'),
+            "priority": priority,
+            "fair_seq": fair_seq,
+            "estimated_cost_ms": estimated_cost,
+            "status": JOB_QUEUED,
+            "force_rerun": force,
+            "incremental": incremental,
+            "now": datetime.utcnow()
+        })
+    except IntegrityError:
+        # another request/process enqueued it concurrently (submission_id is unique)
+        db.rollback()
+        return False
+    return True
+
+
+def claim_job(db, submission_id: int, worker_id: str) -> bool:
+    """Atomically move the submission's job from queued to running for this worker."""
+    now = datetime.utcnow()
+    return execute_update(db, """
+        UPDATE judge_job
+        SET status = :running, worker_id = :worker_id, started_at = :now, heartbeat_at = :now,
+            attempts = attempts + 1
+        WHERE submission_id = :submission_id AND status = :queued
+    """, {
+        "running": JOB_RUNNING, "queued": JOB_QUEUED, "worker_id": worker_id,
+        "now": now, "submission_id": submission_id
+    }) == 1
+
+
+def _saturated_problems(db, problem_max_running: int) -> List[int]:
+    """Problems that already have ``problem_max_running`` jobs running anywhere."""
+    if problem_max_running <= 0:
+        return []
+    rows = execute_query(db, """
+        SELECT problem_id FROM judge_job
+        WHERE status = :running AND problem_id IS NOT NULL
+        GROUP BY problem_id
+        HAVING COUNT(*) >= :cap
+    """, {"running": JOB_RUNNING, "cap": problem_max_running})
+    return [int(row['problem_id']) for row in rows]
+
+
+def _problem_has_room(db, problem_id: int, problem_max_running: int) -> bool:
+    """Re-check the per-problem cap inside the claiming transaction (MySQL/PostgreSQL only).
+
+    The problem row is locked first, so claims of the same problem are serialized while
+    claims of other problems proceed in parallel. The running jobs are then counted without
+    locking job rows (queued rows may be held by other claimers through SKIP LOCKED, and
+    waiting on them while holding the problem lock would deadlock). On MySQL the count is a
+    shared-lock read over the (problem_id, status) index, which sees jobs committed by the
+    previous holder of the problem lock; PostgreSQL's READ COMMITTED count already does.
+    """
+    fetch_one(db, "SELECT problem_id FROM problem WHERE problem_id = :problem_id FOR UPDATE",
+              {"problem_id": problem_id})
+    share_clause = " LOCK IN SHARE MODE" if db.get_bind().dialect.name == 'mysql' else ""
+    row = fetch_one(db, f"""
+        SELECT COUNT(*) AS running FROM judge_job
+        WHERE problem_id = :problem_id AND status = :running{share_clause}
+    """, {"problem_id": problem_id, "running": JOB_RUNNING})
+    return int(row['running'] or 0) < problem_max_running
+
+
+def claim_next_job(db, worker_id: str, problem_max_running: int = 0) -> Optional[dict]:
+    """Claim the next queued job for this worker (None if idle).
+
+    Order: priority class, then fair_seq (round-robin across users), then estimated cost
+    (shortest job first), then queue order. Jobs of problems that already have
+    ``problem_max_running`` running jobs are skipped (0 disables the cap).
+
+    On MySQL/PostgreSQL the candidate row is locked with ``FOR UPDATE SKIP LOCKED`` so
+    concurrent workers on any host each take a different job without waiting on each
+    other; elsewhere the conditional UPDATE in claim_job still guarantees exclusivity.
+    The per-problem cap is re-checked under the problem's row lock before claiming, so it
+    is exact across processes there; without row locks (SQLite) it is a soft cap.
+
+    Returns:
+        {'submission_id', 'priority', 'user_id', 'problem_id', 'force_rerun', 'incremental'} of the claimed job
+    """
+    lock_clause = " FOR UPDATE SKIP LOCKED" if db.get_bind().dialect.name in ('mysql', 'postgresql') else ""
+    try:
+        for _ in range(CLAIM_ATTEMPTS):
+            saturated = _saturated_problems(db, problem_max_running)
+            # ids are integers read from the database, safe to inline
+            cap_clause = f" AND j.problem_id NOT IN ({', '.join(str(pid) for pid in saturated)})" if saturated else ""
+            row = fetch_one(db, f"""
+                SELECT j.submission_id, j.priority, j.user_id, j.problem_id, j.force_rerun, j.incremental FROM judge_job j
+                WHERE j.status = :queued{cap_clause}
+                ORDER BY COALESCE(j.priority, {PRIORITY_PRACTICE}), COALESCE(j.fair_seq, 0),
+                    COALESCE(j.estimated_cost_ms, 0), j.job_id
+                LIMIT 1{lock_clause}
+            """, {"queued": JOB_QUEUED})
+            if not row:
+                db.rollback()
+                return None
+            if (problem_max_running > 0 and row['problem_id'] is not None and lock_clause
+                    and not _problem_has_room(db, row['problem_id'], problem_max_running)):
+                # another worker filled the problem meanwhile; pick again with a fresh view
+                db.rollback()
+                continue
+            # commits and releases the row locks
+            if claim_job(db, row['submission_id'], worker_id):
+                if row['priority'] is None:
+                    row['priority'] = PRIORITY_PRACTICE
+                return row
+            return None
+        return None
+    except Exception:
+        db.rollback()
+        raise
+
+
+def finish_job(db, submission_id: int, worker_id: str):
+    """Remove a job once its verdict has been written."""
+    execute_update(db, "DELETE FROM judge_job WHERE submission_id = :submission_id AND worker_id = :worker_id",
+                   {"submission_id": submission_id, "worker_id": worker_id})
+
+
+def heartbeat_jobs(db, worker_id: str):
+    """Extend the lease of every job this worker is running."""
+    execute_update(db, """
+        UPDATE judge_job SET heartbeat_at = :now
+        WHERE worker_id = :worker_id AND status = :running
+    """, {"now": datetime.utcnow(), "worker_id": worker_id, "running": JOB_RUNNING})
+
+
+def release_jobs(db, worker_id: str) -> int:
+    """Put this worker's unfinished jobs back in the queue (used on shutdown)."""
+    return execute_update(db, """
+        UPDATE judge_job SET status = :queued, worker_id = NULL
+        WHERE worker_id = :worker_id AND status = :running
+    """, {"queued": JOB_QUEUED, "worker_id": worker_id, "running": JOB_RUNNING})
+
+
+def recover_jobs(db, lease_seconds: int, max_attempts: int, include_orphans: bool = True) -> Dict[str, int]:
+    """Re-queue jobs whose worker stopped heartbeating and create jobs for orphaned submissions.
+
+    Orphan detection (``judging`` submissions without a job) is only done at process start:
+    synchronous rejudges inside a request also pass through ``judging`` without a job.
+    Synced copies (``sync_source_id``) whose source is still judging are skipped; they
+    receive the source's verdict.
+
+    Returns counts: {'requeued', 'failed', 'orphaned'}.
+    """
+    counts = {'requeued': 0, 'failed': 0, 'orphaned': 0}
+    expired_before = datetime.utcnow() - timedelta(seconds=lease_seconds)
+    expired = execute_query(db, """
+        SELECT submission_id, attempts, worker_id FROM judge_job
+        WHERE status = :running AND (heartbeat_at IS NULL OR heartbeat_at < :expired_before)
+    """, {"running": JOB_RUNNING, "expired_before": expired_before})
+    for job in expired:
+        params = {"submission_id": job['submission_id'], "worker_id": job['worker_id']}
+        if job['attempts'] >= max_attempts:
+            # the submission keeps killing its worker; stop retrying and report it
+            error_result = [{
+                "test_case_index": -1,
+                "status": "system_error",
+                "time_used": 0,
+                "memory_used": 0,
+                "score": 0,
+                "error_message": f"评测进程连续 {job['attempts']} 次异常退出，已停止重试",
+                "input_data": "",
+                "expected_output": "",
+                "actual_output": ""
+            }]
+            submission = fetch_one(db, "SELECT submission_id, contest_id FROM submission WHERE submission_id = :submission_id",
+                                   {"submission_id": job['submission_id']})
+            if submission:
+                save_verdict(db, submission, 'system_error', 0, 0, 0, json.dumps(error_result))
+            execute_update(db, "DELETE FROM judge_job WHERE submission_id = :submission_id AND worker_id = :worker_id",
+                           params)
+            counts['failed'] += 1
+        else:
+            counts['requeued'] += execute_update(db, """
+                UPDATE judge_job SET status = :queued, worker_id = NULL
+                WHERE submission_id = :submission_id AND worker_id = :worker_id AND status = :running
+            """, dict(params, queued=JOB_QUEUED, running=JOB_RUNNING))
+
+    if not include_orphans:
+        return counts
+    orphaned = execute_query(db, """
+        SELECT s.submission_id FROM submission s
+        LEFT JOIN judge_job j ON j.submission_id = s.submission_id
+        WHERE s.status = :judging AND j.job_id IS NULL
+            AND NOT EXISTS (
+                SELECT 1 FROM submission src
+                WHERE src.submission_id = s.sync_source_id AND src.status = :judging
+            )
+    """, {"judging": 'judging'})
+    for row in orphaned:
+        if enqueue_job(db, row['submission_id']):
+            counts['orphaned'] += 1
+    return counts
+
+
+def queue_depths(db) -> dict:
+    """Queued/running job counts and queued estimated cost (ms) per priority class across all judging processes."""
+    rows = execute_query(db, """
+        SELECT COALESCE(priority, :practice) AS priority, status, COUNT(*) AS cnt,
+            SUM(COALESCE(estimated_cost_ms, 0)) AS cost
+        FROM judge_job GROUP BY COALESCE(priority, :practice), status
+    """, {"practice": PRIORITY_PRACTICE})
+    depths = {
+        'queued': {name: 0 for name in PRIORITY_NAMES.values()},
+        'running_total': {name: 0 for name in PRIORITY_NAMES.values()},
+        'queued_cost_ms': {name: 0 for name in PRIORITY_NAMES.values()},
+    }
+    for row in rows:
+        key = 'queued' if row['status'] == JOB_QUEUED else 'running_total'
+        name = PRIORITY_NAMES.get(row['priority'], str(row['priority']))
+        depths[key][name] = depths[key].get(name, 0) + int(row['cnt'])
+        if row['status'] == JOB_QUEUED:
+            depths['queued_cost_ms'][name] = depths['queued_cost_ms'].get(name, 0) + int(row['cost'] or 0)
+    depths['pending'] = sum(depths['queued'].values())
+    return depths
+
+
+def check_admission(db, user_id: int, count: int = 1) -> Optional[Tuple[str, int]]:
+    """Decide whether ``count`` new submissions from ``user_id`` may enter the judge queue.
+
+    Limits: JUDGE_QUEUE_MAX_PENDING outstanding jobs in total and JUDGE_USER_MAX_IN_FLIGHT
+    outstanding jobs per user (0 disables either). Uses a single aggregate query. Rejudge
+    jobs run behind every new submission, so they count toward neither limit nor the
+    queued cost; a large rejudge_bulk never blocks students from submitting.
+
+    Returns:
+        None if admitted, otherwise (reason message, retry-after seconds). The retry-after
+        hint is the queued estimated cost divided by the number of jobs currently running
+        (the fleet's effective parallelism).
+    """
+    settings = get_settings()
+    max_pending = settings.JUDGE_QUEUE_MAX_PENDING
+    user_max = settings.JUDGE_USER_MAX_IN_FLIGHT
+    if max_pending <= 0 and user_max <= 0:
+        return None
+    row = fetch_one(db, """
+        SELECT SUM(CASE WHEN is_rejudge = 0 THEN 1 ELSE 0 END) AS total,
+            SUM(CASE WHEN is_rejudge = 0 AND user_id = :user_id THEN 1 ELSE 0 END) AS user_jobs,
+            SUM(CASE WHEN status = :running THEN 1 ELSE 0 END) AS running,
+            SUM(CASE WHEN is_rejudge = 0 AND status = :queued THEN COALESCE(estimated_cost_ms, 0) ELSE 0 END)
+                AS queued_cost
+        FROM (
+            SELECT user_id, status, estimated_cost_ms,
+                CASE WHEN COALESCE(priority, :practice) = :rejudge THEN 1 ELSE 0 END AS is_rejudge
+            FROM judge_job
+        ) jobs
+    """, {"user_id": user_id, "running": JOB_RUNNING, "queued": JOB_QUEUED,
+          "practice": PRIORITY_PRACTICE, "rejudge": PRIORITY_REJUDGE})
+    total = int(row['total'] or 0)
+    user_jobs = int(row['user_jobs'] or 0)
+
+    if max_pending > 0 and total + count > max_pending:
+        message = f"评测队列繁忙（{total} 个提交等待评测），请稍后再提交"
+    elif user_max > 0 and user_jobs + count > user_max:
+        message = f"你还有 {user_jobs} 个提交正在评测，请等待评测完成后再提交"
+    else:
+        return None
+    parallelism = max(int(row['running'] or 0), 1)
+    retry_after = int(row['queued_cost'] or 0) // 1000 // parallelism
+    return message, min(max(retry_after, ADMISSION_MIN_RETRY_SECONDS), ADMISSION_MAX_RETRY_SECONDS)
+
+
+class JudgePool:
+    """Judge threads that claim jobs from ``judge_job`` in priority order.
+
+    Used inside the API process (JUDGE_IN_PROCESS) and by app.judge_daemon. Threads poll
+    the table when idle; ``notify`` wakes one up immediately after a local enqueue.
+    """
+
+    def __init__(self, max_workers: int, poll_seconds: Optional[float] = None):
+        settings = get_settings()
         self.max_workers = max_workers
+        self.poll_seconds = poll_seconds if poll_seconds is not None else settings.JUDGE_DAEMON_POLL_SECONDS
+        self.worker_id = new_worker_id()
+        self.lease_seconds = settings.JUDGE_JOB_LEASE_SECONDS
+        self.heartbeat_seconds = settings.JUDGE_JOB_HEARTBEAT_SECONDS
+        self.max_attempts = settings.JUDGE_JOB_MAX_ATTEMPTS
+        self.problem_max_running = settings.JUDGE_PROBLEM_MAX_RUNNING
         self._lock = Lock()
-        self._pending_futures = set()
-        self._running_count = 0
+        self._wakeup = Condition(self._lock)
+        # submission_id -> Future handed out by submit(), resolved when this process judges it
+        # (or with None once the maintenance thread sees the job finished elsewhere)
+        self._futures: Dict[int, Future] = {}
+        self._running: Dict[int, int] = {}  # submission_id -> priority
+        self._threads: List[Thread] = []
+        self._stop_event = Event()        # stop claiming new jobs
+        self._maintenance_stop = Event()  # stop heartbeating (after draining)
+        self._maintenance_thread = None
+        self._last_event_prune = 0.0
+        self.test_data_gc_seconds = settings.JUDGE_TEST_DATA_GC_INTERVAL_SECONDS
+        self._last_test_data_gc = time.monotonic()
 
-    def submit(self, submission_id: int):
-        """Submit a tracked task. Returns a Future."""
-        def wrapper(sub_id):
-            # Mark as running
-            with self._lock:
-                self._running_count += 1
+    def future_for(self, submission_id: int) -> Future:
+        with self._lock:
+            return self._futures.setdefault(submission_id, Future())
+
+    def notify(self):
+        with self._wakeup:
+            self._wakeup.notify()
+
+    def start(self):
+        """Recover jobs left behind by previous processes and start the judge and maintenance threads."""
+        with self._lock:
+            if self._threads or self._stop_event.is_set():
+                return
+            for i in range(self.max_workers):
+                thread = Thread(target=self._worker_loop, name=f'judge-worker-{i}', daemon=True)
+                self._threads.append(thread)
+        self._maintain_once(include_orphans=True)
+        for thread in self._threads:
+            thread.start()
+        self._maintenance_thread = Thread(target=self._maintenance_loop, name='judge-maintenance', daemon=True)
+        self._maintenance_thread.start()
+
+    def _worker_loop(self):
+        while not self._stop_event.is_set():
+            db = SessionLocal()
             try:
-                return run_submission_judge(sub_id)
+                job = claim_next_job(db, self.worker_id, self.problem_max_running)
+                if job is None:
+                    with self._wakeup:
+                        self._wakeup.wait(self.poll_seconds)
+                    continue
+                self._run_job(db, job)
+            except Exception as e:
+                # e.g. database temporarily unavailable: retry later
+                print(f"[judge_worker] claiming job failed: {e}")
+                self._stop_event.wait(self.poll_seconds)
             finally:
-                with self._lock:
-                    self._running_count -= 1
+                db.close()
+
+    def _run_job(self, db, job: dict):
+        submission_id = job['submission_id']
+        with self._lock:
+            self._running[submission_id] = job['priority']
+        result, error = None, None
+        try:
+            result = run_submission_judge(submission_id, force=bool(job.get('force_rerun')),
+                                          incremental=bool(job.get('incremental')))
+        except Exception as e:
+            error = e
+            print(f"[judge_worker] judging submission {submission_id} failed: {e}")
+        finally:
+            finish_job(db, submission_id, self.worker_id)
+            with self._lock:
+                self._running.pop(submission_id, None)
+                future = self._futures.pop(submission_id, None)
+            if future is not None:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+    def _maintenance_loop(self):
+        while not self._maintenance_stop.wait(self.heartbeat_seconds):
+            self._maintain_once(include_orphans=False)
+
+    def _maintain_once(self, include_orphans: bool):
+        """Heartbeat our running jobs, recover expired (and, at startup, orphaned) ones, prune old judge
+        events and, every JUDGE_TEST_DATA_GC_INTERVAL_SECONDS, delete test blobs no problem references.
 
-        future = self.executor.submit(wrapper, submission_id)
+        Events are pruned here rather than by the SSE tail thread so that the table stays
+        bounded even when no process has subscribers.
+        """
+        db = SessionLocal()
+        try:
+            heartbeat_jobs(db, self.worker_id)
+            counts = recover_jobs(db, self.lease_seconds, self.max_attempts, include_orphans)
+            if any(counts.values()):
+                print(f"[judge_worker] recovered jobs: {counts}")
+            self._expire_futures(db)
+            if time.monotonic() - self._last_event_prune > PRUNE_INTERVAL_SECONDS:
+                self._last_event_prune = time.monotonic()
+                prune_events(db)
+            if self.test_data_gc_seconds > 0 and time.monotonic() - self._last_test_data_gc > self.test_data_gc_seconds:
+                self._last_test_data_gc = time.monotonic()
+                removed = collect_garbage(db)
+                if removed:
+                    print(f"[judge_worker] deleted {removed} unreferenced test blobs")
+        except Exception as e:
+            print(f"[judge_worker] maintenance failed: {e}")
+        finally:
+            db.close()
 
+    def _expire_futures(self, db):
+        """Resolve (with None) futures whose job no longer exists because another process judged it.
+
+        Only futures of jobs not running here are checked; a job judged locally pops its own
+        future in _run_job, so popping again here is harmless.
+        """
+        with self._lock:
+            pending = [submission_id for submission_id in self._futures if submission_id not in self._running]
+        if not pending:
+            return
+        placeholders = ', '.join(f':id{i}' for i in range(len(pending)))
+        rows = execute_query(db, f"SELECT submission_id FROM judge_job WHERE submission_id IN ({placeholders})",
+                             {f'id{i}': submission_id for i, submission_id in enumerate(pending)})
+        outstanding = {int(row['submission_id']) for row in rows}
+        finished = []
         with self._lock:
-            self._pending_futures.add(future)
+            for submission_id in pending:
+                if submission_id not in outstanding and submission_id not in self._running:
+                    future = self._futures.pop(submission_id, None)
+                    if future is not None:
+                        finished.append(future)
+        for future in finished:
+            future.set_result(None)
 
-        # remove from pending when done
-        def _on_done(f):
-            with self._lock:
-                try:
-                    self._pending_futures.discard(f)
-                except Exception:
-                    pass
-        future.add_done_callback(_on_done)
-        return future
+    def shutdown(self, timeout: Optional[float] = None):
+        """Stop claiming work, let running jobs finish for up to ``timeout`` seconds, release the rest.
+
+        Jobs that have not been claimed yet simply stay queued in the table.
+        """
+        if timeout is None:
+            timeout = get_settings().JUDGE_SHUTDOWN_DRAIN_SECONDS
+        self._stop_event.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            if thread.is_alive():
+                thread.join(max(deadline - time.monotonic(), 0))
+        self._maintenance_stop.set()
+        if any(thread.is_alive() for thread in self._threads):
+            db = SessionLocal()
+            try:
+                released = release_jobs(db, self.worker_id)
+                print(f"[judge_worker] released {released} unfinished jobs on shutdown")
+            finally:
+                db.close()
 
     def get_stats(self):
         with self._lock:
-            pending = sum(1 for f in self._pending_futures if not f.done())
-            running = int(self._running_count)
-            return {
-                'max_workers': self.max_workers,
-                'pending': pending,
-                'running': running
-            }
+            running = len(self._running)
+            running_by_class = {name: 0 for name in PRIORITY_NAMES.values()}
+            for priority in self._running.values():
+                running_by_class[PRIORITY_NAMES.get(priority, str(priority))] += 1
+        return {
+            'max_workers': self.max_workers,
+            'running': running,
+            'running_by_class': running_by_class,
+            'worker_id': self.worker_id
+        }
+
+
+class _JudgePoolManager:
+    """Front door used by the API: persists jobs and, with JUDGE_IN_PROCESS, judges them locally."""
+
+    def __init__(self, max_workers: int):
+        settings = get_settings()
+        self.max_workers = max_workers
+        self.in_process = settings.JUDGE_IN_PROCESS
+        self.pool = JudgePool(max_workers) if self.in_process else None
+
+    def submit(self, submission_id: int, rejudge: bool = False, force: bool = False, incremental: bool = False):
+        """Persist a job for the submission. Returns a Future resolved when it is judged here
+        (with None if another process judges it first)."""
+        db = SessionLocal()
+        try:
+            enqueue_job(db, submission_id, rejudge=rejudge, force=force, incremental=incremental)
+        finally:
+            db.close()
+        if self.pool is None:
+            # judged by app.judge_daemon processes; nothing to wait for here
+            future = Future()
+            future.set_result(None)
+            return future
+        future = self.pool.future_for(submission_id)
+        self.pool.start()
+        self.pool.notify()
+        return future
+
+    def start(self):
+        if self.pool is not None:
+            self.pool.start()
+
+    def shutdown(self, timeout: Optional[float] = None):
+        if self.pool is not None:
+            self.pool.shutdown(timeout)
+
+    def get_stats(self):
+        stats = {'in_process': self.in_process, 'max_workers': self.max_workers, 'running': 0}
+        if self.pool is not None:
+            stats.update(self.pool.get_stats())
+        db = SessionLocal()
+        try:
+            stats.update(queue_depths(db))
+        finally:
+            db.close()
+        return stats
 
 
 @lru_cache()
@@ -58,15 +618,30 @@ def _get_manager():
     return _JudgePoolManager(max_workers)
 
 
-def submit_submission_judge(submission_id: int):
-    """Submit a submission judge task to the global thread pool.
+def submit_submission_judge(submission_id: int, rejudge: bool = False, force: bool = False,
+                            incremental: bool = False):
+    """Submit a submission judge task to the durable queue.
 
-    Returns a concurrent.futures.Future.
+    ``rejudge`` puts it in the lowest priority class; ``force`` skips verdict reuse;
+    ``incremental`` keeps results of unchanged test cases. Returns a concurrent.futures.Future.
     """
     mgr = _get_manager()
-    return mgr.submit(submission_id)
+    return mgr.submit(submission_id, rejudge=rejudge, force=force, incremental=incremental)
+
+
+def start():
+    """Recover outstanding jobs from the database and start heartbeating (call at app startup)."""
+    _get_manager().start()
+
+
+def shutdown(timeout: Optional[float] = None):
+    """Drain in-flight judging and release unfinished jobs (call at app shutdown)."""
+    _get_manager().shutdown(timeout)
 
 
 def get_stats():
     mgr = _get_manager()
-    return mgr.get_stats()
+    stats = mgr.get_stats()
+    stats['compile_cache'] = get_compile_cache().stats()
+    stats['problem_cache'] = get_problem_cache().stats()
+    return stats
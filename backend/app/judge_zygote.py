@@ -0,0 +1,140 @@
+"""
+Python 预热运行器（zygote）的启动与调用
+
+开启 JUDGE_PYTHON_ZYGOTE 后，评测引擎不再为每个 Python 测试点启动新的解释器，
+而是请求常驻的 zygote 进程（judge_zygote_server.py）从已初始化好的解释器 fork 出选手程序。
+zygote 异常退出时会在下次调用时自动重启；非 POSIX 平台或启动失败时返回 None，评测引擎按原方式运行。
+"""
+import atexit
+import json
+import os
+import socket
+import subprocess
+import tempfile
+import time
+import uuid
+from functools import lru_cache
+from pathlib import Path
+from threading import Lock
+from typing import List, Optional
+
+from app.config import get_settings
+
+ZYGOTE_SERVER = Path(__file__).with_name('judge_zygote_server.py')
+
+
+class PythonZygote:
+    """常驻 zygote 进程的客户端"""
+
+    # 等待 zygote 启动完成（创建套接字）的最长时间（秒）
+    START_TIMEOUT = 10
+
+    def __init__(self, python_executable: str, socket_dir: str):
+        """
+        Args:
+            python_executable: 运行选手代码的 Python 解释器
+            socket_dir: Unix 域套接字所在目录
+        """
+        self.python_executable = python_executable
+        self.socket_path = os.path.join(socket_dir, f'codefuse_zygote_{os.getpid()}_{uuid.uuid4().hex[:8]}.sock')
+        self._process = None
+        self._lock = Lock()
+
+    def start(self):
+        """启动（或重启）zygote 进程，等到套接字就绪后返回"""
+        with self._lock:
+            self._start()
+
+    def _ensure_running(self, restart: bool = False):
+        """zygote 不存在、已退出或要求重启时（重新）启动"""
+        with self._lock:
+            if restart or self._process is None or self._process.poll() is not None:
+                self._start()
+
+    def _start(self):
+        """调用方需持有锁"""
+        self._stop()
+        self._process = subprocess.Popen(
+            [self.python_executable, str(ZYGOTE_SERVER), self.socket_path],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True
+        )
+        deadline = time.monotonic() + self.START_TIMEOUT
+        while not os.path.exists(self.socket_path):
+            if self._process.poll() is not None or time.monotonic() > deadline:
+                self._stop()
+                raise RuntimeError('Python zygote 启动失败')
+            time.sleep(0.01)
+
+    def spawn(self, argv: List[str], cwd: str, fds: List[int], cpu_ms: int, wall_ms: int,
+              memory_kb: int, output_bytes: int) -> int:
+        """
+        请求 zygote 运行一次选手程序
+
+        Args:
+            argv: 脚本路径及参数
+            cwd: 运行目录
+            fds: [stdin, stdout, stderr, 结果管道写端]
+            cpu_ms / wall_ms / memory_kb / output_bytes: 与 judge_sandbox.c 含义相同，0 表示不限制
+
+        Returns:
+            监控进程的 pid（同时也是其进程组 id）
+        """
+        request = json.dumps({
+            'argv': argv,
+            'cwd': cwd,
+            'cpu_ms': cpu_ms,
+            'wall_ms': wall_ms,
+            'memory_kb': memory_kb,
+            'output_bytes': output_bytes
+        }).encode('utf-8')
+        self._ensure_running()
+        try:
+            return self._request(request, fds)
+        except (OSError, ValueError):
+            # zygote 已不可用（例如被意外结束），重启后再试一次
+            self._ensure_running(restart=True)
+            return self._request(request, fds)
+
+    def _request(self, request: bytes, fds: List[int]) -> int:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(5)
+            sock.connect(self.socket_path)
+            socket.send_fds(sock, [request], fds)
+            return int(sock.recv(64))
+
+    def close(self):
+        with self._lock:
+            self._stop()
+
+    def _stop(self):
+        """结束 zygote 进程并删除套接字（调用方需持有锁）"""
+        if self._process is not None:
+            try:
+                self._process.kill()
+                self._process.wait(timeout=5)
+            except Exception:
+                pass
+            self._process = None
+        try:
+            os.remove(self.socket_path)
+        except OSError:
+            pass
+
+
+@lru_cache()
+def get_python_zygote() -> Optional[PythonZygote]:
+    """返回进程内共享的 zygote；未开启或不可用时返回 None"""
+    settings = get_settings()
+    if not settings.JUDGE_PYTHON_ZYGOTE or os.name != 'posix' or not hasattr(socket, 'send_fds'):
+        return None
+    zygote = PythonZygote(settings.PYTHON_EXECUTABLE, settings.JUDGE_TEMP_DIR or tempfile.gettempdir())
+    try:
+        zygote.start()
+    except Exception as e:
+        print(f"[judge_zygote] 启动 Python zygote 失败，按普通方式运行: {e}")
+        return None
+    atexit.register(zygote.close)
+    return zygote
@@ -0,0 +1,186 @@
+"""
+Python 预热运行器（zygote）服务端
+
+由 app/judge_zygote.py 用 PYTHON_EXECUTABLE 启动，只依赖标准库（选手使用的解释器不一定装有后端依赖）。
+启动后预先导入常用标准库模块，然后在 Unix 域套接字上等待评测请求。每个请求携带
+stdin/stdout/stderr/结果管道四个文件描述符（SCM_RIGHTS）和运行参数：
+
+    zygote --fork--> 监控进程（新会话）--fork--> 选手程序
+
+选手程序从已初始化好的解释器 fork 出来，省去解释器启动和常用模块导入的时间；
+监控进程设置墙钟定时器并用 wait4 回收选手程序，结果写入结果管道，格式与 judge_sandbox.c 相同：
+    <exit_code> <term_signal> <cpu_us> <wall_us> <max_rss_kb> <wall_timed_out>
+
+用法:
+    python judge_zygote_server.py <socket_path>
+"""
+import builtins
+import json
+import os
+import resource
+import signal
+import socket
+import sys
+import time
+import traceback
+
+# 预先导入的常用标准库模块（算法题常用）
+PRELOAD_MODULES = (
+    'array', 'bisect', 'collections', 'copy', 'datetime', 'decimal', 'fractions', 'functools',
+    'heapq', 'itertools', 'math', 'operator', 'random', 're', 'statistics', 'string', 'typing',
+)
+
+
+def main(socket_path: str):
+    for name in PRELOAD_MODULES:
+        try:
+            __import__(name)
+        except ImportError:
+            pass
+
+    # 监控进程退出后由内核自动回收，zygote 不需要 wait
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    # 先绑定到临时路径，listen 之后再改名：客户端看到套接字文件时一定可以连接
+    tmp_path = f'{socket_path}.{os.getpid()}'
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(tmp_path)
+    os.chmod(tmp_path, 0o600)
+    server.listen(64)
+    os.replace(tmp_path, socket_path)
+
+    # 后端进程意外退出时 zygote 随之退出，不留下孤儿进程
+    parent_pid = os.getppid()
+    server.settimeout(1)
+    while os.getppid() == parent_pid:
+        try:
+            conn, _ = server.accept()
+        except socket.timeout:
+            continue
+        conn.settimeout(None)
+        try:
+            handle(server, conn)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            conn.close()
+
+
+def handle(server: socket.socket, conn: socket.socket):
+    """接收一个评测请求，fork 出监控进程后把其 pid 回复给评测引擎"""
+    message, fds, _, _ = socket.recv_fds(conn, 65536, 4)
+    try:
+        if len(fds) != 4:
+            return
+        request = json.loads(message)
+        pid = os.fork()
+        if pid == 0:
+            try:
+                server.close()
+                conn.close()
+                monitor(request, *fds)
+            finally:
+                os._exit(2)
+        conn.sendall(f'{pid}\n'.encode())
+    finally:
+        for fd in fds:
+            os.close(fd)
+
+
+def monitor(request: dict, stdin_fd: int, stdout_fd: int, stderr_fd: int, result_fd: int):
+    """监控进程：启动选手程序，按墙钟时间限制杀掉超时程序，并把 wait4 的统计写入结果管道"""
+    # 独立会话，评测引擎可以用 killpg 清理整个进程组
+    os.setsid()
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    start = time.monotonic()
+    child = os.fork()
+    if child == 0:
+        try:
+            os.close(result_fd)
+            run_program(request, stdin_fd, stdout_fd, stderr_fd)
+        finally:
+            os._exit(2)
+
+    timed_out = False
+
+    def on_alarm(signum, frame):
+        nonlocal timed_out
+        timed_out = True
+        os.kill(child, signal.SIGKILL)
+
+    signal.signal(signal.SIGALRM, on_alarm)
+    if request.get('wall_ms'):
+        signal.setitimer(signal.ITIMER_REAL, request['wall_ms'] / 1000)
+    _, status, usage = os.wait4(child, 0)
+    wall_us = int((time.monotonic() - start) * 1000000)
+
+    cpu_us = int((usage.ru_utime + usage.ru_stime) * 1000000)
+    max_rss_kb = usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss
+    exit_code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -1
+    term_signal = os.WTERMSIG(status) if os.WIFSIGNALED(status) else 0
+    os.write(result_fd, f'{exit_code} {term_signal} {cpu_us} {wall_us} {max_rss_kb} {int(timed_out)}\n'.encode())
+    # 连同选手程序遗留的后台进程一起结束（包括监控进程自身）
+    os.killpg(0, signal.SIGKILL)
+
+
+def run_program(request: dict, stdin_fd: int, stdout_fd: int, stderr_fd: int):
+    """在 fork 出的子进程中设置资源限制并以 __main__ 身份执行选手代码，不会返回"""
+    for target, fd in ((0, stdin_fd), (1, stdout_fd), (2, stderr_fd)):
+        os.dup2(fd, target)
+    for fd in (stdin_fd, stdout_fd, stderr_fd):
+        if fd > 2:
+            os.close(fd)
+    os.chdir(request['cwd'])
+
+    # 与 judge_sandbox.c 相同的资源限制
+    cpu_ms = request.get('cpu_ms') or 0
+    if cpu_ms > 0:
+        seconds = (cpu_ms + 999) // 1000 + 1
+        resource.setrlimit(resource.RLIMIT_CPU, (seconds, seconds))
+    if request.get('memory_kb'):
+        limit = request['memory_kb'] * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    if request.get('output_bytes'):
+        limit = request['output_bytes']
+        resource.setrlimit(resource.RLIMIT_FSIZE, (limit, limit))
+    signal.signal(signal.SIGALRM, signal.SIG_DFL)
+
+    # 每次运行重新打开标准流，并重新播种 random，避免各次运行共享 zygote 中的状态
+    sys.stdin = open(0, 'r', encoding='utf-8', closefd=False)
+    sys.stdout = open(1, 'w', encoding='utf-8', closefd=False)
+    sys.stderr = open(2, 'w', encoding='utf-8', errors='backslashreplace', closefd=False)
+    if 'random' in sys.modules:
+        sys.modules['random'].seed()
+    argv = request['argv']
+    script = argv[0]
+    sys.argv = list(argv)
+    sys.path[0] = os.path.dirname(os.path.abspath(script))
+
+    exit_code = 0
+    try:
+        with open(script, 'rb') as f:
+            code = compile(f.read(), script, 'exec')
+        namespace = {'__name__': '__main__', '__file__': script, '__builtins__': builtins}
+        exec(code, namespace)
+    except SystemExit as e:
+        if e.code is None:
+            exit_code = 0
+        elif isinstance(e.code, int):
+            exit_code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            exit_code = 1
+    except BaseException:
+        # 跳过 zygote 自身的栈帧，与直接运行解释器时的报错格式一致
+        etype, value, tb = sys.exc_info()
+        traceback.print_exception(etype, value, tb.tb_next)
+        exit_code = 1
+    for stream in (sys.stdout, sys.stderr):
+        try:
+            stream.flush()
+        except Exception:
+            exit_code = exit_code or 1
+    os._exit(exit_code & 0xFF)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1])
@@ -2,15 +2,18 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
-from app.database import engine, Base
+from app.database import engine, Base, ensure_model_columns
 from app.routers import users, problems, submissions, contests, activity_logs, messages, friendships, test_cases_json
 from app.config import get_settings
+from app import judge_worker
 from datetime import datetime
 
 settings = get_settings()
 
 # 创建数据库表
 Base.metadata.create_all(bind=engine)
+# 为已有表补齐新增列
+ensure_model_columns()
 
 # 创建FastAPI应用
 app = FastAPI(
@@ -47,6 +50,18 @@ app.include_router(test_cases_json.router)
 app.mount("/api/uploads", StaticFiles(directory="uploads"), name="uploads")
 
 
+@app.on_event("startup")
+def start_judge_worker():
+    """恢复上次退出时遗留的评测任务"""
+    judge_worker.start()
+
+
+@app.on_event("shutdown")
+def stop_judge_worker():
+    """等待进行中的评测完成，未完成的任务放回队列"""
+    judge_worker.shutdown()
+
+
 
 
 
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Text, DateTime, Enum as SQLEnum, ForeignKey, JSON, Boolean
+from sqlalchemy import Column, Integer, String, Text, DateTime, Enum as SQLEnum, ForeignKey, JSON, Boolean, Float, LargeBinary, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from app.database import Base
 
@@ -45,6 +45,13 @@ class Problem(Base):
     creator_id = Column(Integer, ForeignKey('user.user_id'), nullable=False)
     test_cases = Column(JSON, nullable=True)  # 测试用例（JSON数组）
     visible = Column(Boolean, nullable=False, default=True)  # 是否对普通用户可见（id<10000为保留题，默认不可见）
+    judge_mode = Column(String(20), nullable=True)  # 评测模式：'oi' 全部测试点计分，'acm' 首个未通过测试点后停止；为空时按 'oi'
+    checker_type = Column(String(20), nullable=True)  # 输出检查方式：line/exact/token/float/custom，为空时按 line
+    checker_epsilon = Column(Float, nullable=True)  # float 检查方式允许的绝对/相对误差，为空时为 1e-6
+    checker_language = Column(String(50), nullable=True)  # custom 检查器的语言
+    checker_code = Column(Text, nullable=True)  # custom 检查器源代码（testlib 约定：checker <in> <out> <ans>）
+    test_data_version = Column(Integer, nullable=True)  # 测试数据版本，测试点数据或分数变化时加一
+    test_data_hash = Column(String(64), nullable=True)  # 整套测试数据的哈希（各测试点 data_hash、分数和是否样例按顺序组合）
     
     # 关系
     creator = relationship("User", back_populates="created_problems", foreign_keys=[creator_id])
@@ -66,6 +73,7 @@ class Contest(Base):
     end_time = Column(DateTime, nullable=False)
     creator_id = Column(Integer, ForeignKey('user.user_id'), nullable=False)
     problems_published = Column(Boolean, default=False, nullable=False)  # 题目是否已发布到公开题库
+    judge_mode = Column(String(20), nullable=True)  # 比赛评测模式，设置后覆盖比赛内题目的 judge_mode
     
     # 关系
     creator = relationship("User", back_populates="created_contests", foreign_keys=[creator_id])
@@ -104,6 +112,9 @@ class Submission(Base):
     exec_memory = Column(Integer, nullable=False)  # KB
     submitted_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     judge_results = Column(JSON, nullable=True)  # 评测结果（JSON数组），每个测试点一个结果对象
+    score = Column(Integer, nullable=True)  # 总分，评测完成时与 judge_results 一起写入
+    sync_source_id = Column(Integer, nullable=True, index=True)  # 通过 sync_with 同步创建时指向发起者的提交，随其评测结果一起写入
+    test_data_version = Column(Integer, nullable=True)  # 评测时题目的测试数据版本
     
     # 关系
     problem = relationship("Problem", back_populates="submissions")
@@ -111,6 +122,75 @@ class Submission(Base):
     problem_submissions = relationship("ProblemSubmission", back_populates="submission", cascade="all, delete-orphan")
 
 
+class JudgeJob(Base):
+    """评测任务表（持久化的评测队列，每个待评测的提交一行，评测完成后删除）"""
+    __tablename__ = "judge_job"
+    
+    job_id = Column(Integer, primary_key=True, autoincrement=True)
+    submission_id = Column(Integer, ForeignKey('submission.submission_id', ondelete='CASCADE'), nullable=False, unique=True)
+    problem_id = Column(Integer, nullable=True, index=True)  # 用于限制同一题目同时评测的任务数
+    user_id = Column(Integer, nullable=True, index=True)  # 提交者，用于按用户公平调度
+    priority = Column(Integer, nullable=True)  # 优先级类别：0 进行中的比赛，1 练习，2 重测（越小越先评测）
+    fair_seq = Column(Integer, nullable=True)  # 入队时该用户已有的未完成任务数，同类别内按它轮流评测各用户
+    estimated_cost_ms = Column(Integer, nullable=True)  # 估计评测耗时（毫秒），同一轮内短任务优先
+    status = Column(String(20), nullable=False, default='queued', index=True)  # 'queued', 'running'
+    attempts = Column(Integer, nullable=False, default=0)  # 已被领取的次数
+    force_rerun = Column(Boolean, nullable=True)  # 重测时不复用已有评测结果，强制重新运行
+    incremental = Column(Boolean, nullable=True)  # 增量重测：只运行数据有变化的测试点
+    worker_id = Column(String(100), nullable=True)  # 正在评测该任务的进程
+    enqueued_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)  # 评测进程定期刷新，超时未刷新视为进程已退出
+
+    __table_args__ = (
+        # 领取任务时统计某题目正在评测的任务数
+        Index('ix_judge_job_problem_status', 'problem_id', 'status'),
+    )
+
+
+class VerdictMemo(Base):
+    """评测结果复用表：相同题目评测配置、语言和代码的评测结果"""
+    __tablename__ = "verdict_memo"
+    __table_args__ = (
+        UniqueConstraint('problem_id', 'config_hash', 'language', 'code_hash', name='uq_verdict_memo_key'),
+    )
+
+    memo_id = Column(Integer, primary_key=True, autoincrement=True)
+    problem_id = Column(Integer, nullable=False, index=True)
+    problem_hash = Column(String(64), nullable=True)  # 测试点、时间/内存限制和检查器的哈希（不含评测模式），用于清理过期结果
+    config_hash = Column(String(64), nullable=False)  # 测试点、时间/内存限制、检查器和评测模式的哈希
+    language = Column(String(50), nullable=False)
+    code_hash = Column(String(64), nullable=False)  # 代码的 SHA-256
+    status = Column(String(50), nullable=False)
+    exec_time = Column(Integer, nullable=False)
+    exec_memory = Column(Integer, nullable=False)
+    score = Column(Integer, nullable=True)
+    judge_results = Column(Text, nullable=True)  # 各测试点结果（JSON）
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class TestBlob(Base):
+    """测试数据表：测试点的输入和期望输出按内容寻址存放，相同内容只存一份"""
+    __tablename__ = "test_blob"
+
+    blob_hash = Column(String(64), primary_key=True)  # 内容的 SHA-256
+    data = Column(LargeBinary(length=2 ** 32 - 1), nullable=False)  # MySQL 下为 LONGBLOB
+    size = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class JudgeEvent(Base):
+    """评测事件表（评测结果推送的跨进程通道，定期清理）"""
+    __tablename__ = "judge_event"
+    
+    event_id = Column(Integer, primary_key=True, autoincrement=True)
+    submission_id = Column(Integer, nullable=False, index=True)
+    event_type = Column(String(20), nullable=False)  # 'verdict' / 'progress'
+    payload = Column(Text, nullable=False)  # 事件内容（JSON）
+    origin = Column(String(100), nullable=True)  # 发布事件的进程
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+
 # 联系表
 
 class ContestProblem(Base):
@@ -0,0 +1,111 @@
+"""
+评测题目缓存
+评测进程内按题目缓存解析后的测试点（LRU 淘汰），条目以 (test_data_version, test_data_hash) 标识。
+比赛中大量提交集中在少数题目上，每次评测只需按主键读取题目的几个标量字段（时间/内存限制、
+检查器、评测模式和测试数据版本），不再读取并 json.loads 整个 test_cases。
+
+测试点数据或分数变化时版本和哈希随之变化，旧条目自然失效，对其他评测进程同样有效；
+限制和检查器每次评测都从数据库读取，修改后立即生效。
+本进程内更新或删除题目时同时清除对应条目。
+"""
+import json
+from collections import OrderedDict
+from functools import lru_cache
+from threading import Lock
+from typing import List, Optional
+
+from app.config import get_settings
+from app.database import fetch_one
+from app.judge_checker import with_output_digests
+from app.test_data import is_external
+
+# 每次评测读取的题目字段（不含 test_cases、题面等大字段）
+PROBLEM_CONFIG_SQL = """
+    SELECT problem_id, time_limit, memory_limit, judge_mode, checker_type, checker_epsilon,
+        checker_language, checker_code, test_data_version, test_data_hash
+    FROM problem WHERE problem_id = :problem_id
+"""
+
+
+class ProblemCache:
+    """题目测试点的进程内 LRU 缓存；缓存的测试点列表由所有评测线程共享，只读"""
+
+    def __init__(self, max_entries: int):
+        """
+        初始化题目缓存
+
+        Args:
+            max_entries: 最多缓存的题目数，<= 0 表示禁用缓存
+        """
+        self.max_entries = max_entries
+        self._lock = Lock()
+        # problem_id -> ((test_data_version, test_data_hash), 测试点列表)，最久未使用的在前
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get_problem(self, db, problem_id: int) -> Optional[dict]:
+        """
+        读取评测所需的题目配置和测试点
+
+        Returns:
+            PROBLEM_CONFIG_SQL 中的字段加上解析后的 test_cases（列表，不要修改）；题目不存在时为 None
+        """
+        problem = fetch_one(db, PROBLEM_CONFIG_SQL, {"problem_id": problem_id})
+        if not problem:
+            return None
+        version = (problem.get('test_data_version'), problem.get('test_data_hash'))
+        with self._lock:
+            entry = self._entries.get(problem_id)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(problem_id)
+                self.hits += 1
+                return dict(problem, test_cases=entry[1])
+            self.misses += 1
+
+        # 测试点与其版本在同一次查询中读取，保证缓存条目的版本和内容一致
+        row = fetch_one(db, "SELECT test_cases, test_data_version, test_data_hash FROM problem WHERE problem_id = :problem_id",
+                        {"problem_id": problem_id})
+        if not row:
+            return None
+        test_cases = self._parse(row.get('test_cases'))
+        if self.enabled:
+            with self._lock:
+                self._entries[problem_id] = ((row.get('test_data_version'), row.get('test_data_hash')), test_cases)
+                self._entries.move_to_end(problem_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return dict(problem, test_data_version=row.get('test_data_version'),
+                    test_data_hash=row.get('test_data_hash'), test_cases=test_cases)
+
+    def invalidate(self, problem_id: int):
+        with self._lock:
+            self._entries.pop(problem_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries
+            }
+
+    @staticmethod
+    def _parse(raw) -> List[dict]:
+        """解析测试点；旧数据缺少期望输出摘要时在这里补算一次，之后的评测都可以走摘要比较"""
+        test_cases = json.loads(raw) if isinstance(raw, str) and raw else (raw or [])
+        for tc in test_cases:
+            if isinstance(tc, dict) and not is_external(tc) and not (tc.get('output_digest') and tc.get('data_hash')):
+                with_output_digests([tc])
+        return test_cases
+
+
+@lru_cache()
+def get_problem_cache() -> ProblemCache:
+    return ProblemCache(get_settings().JUDGE_PROBLEM_CACHE_SIZE)
@@ -63,11 +63,15 @@ def auto_publish_contest_problems(contest_dict: dict, db: Session):
                 INSERT INTO problem (
                     title, description, input_format, output_format,
                     sample_input, sample_output, time_limit, memory_limit,
-                    difficulty, tags, creator_id, test_cases, visible
+                    difficulty, tags, creator_id, test_cases, visible, judge_mode,
+                    checker_type, checker_epsilon, checker_language, checker_code,
+                    test_data_version, test_data_hash
                 ) VALUES (
                     :title, :description, :input_format, :output_format,
                     :sample_input, :sample_output, :time_limit, :memory_limit,
-                    :difficulty, :tags, :creator_id, :test_cases, :visible
+                    :difficulty, :tags, :creator_id, :test_cases, :visible, :judge_mode,
+                    :checker_type, :checker_epsilon, :checker_language, :checker_code,
+                    :test_data_version, :test_data_hash
                 )
             """
             new_id = execute_insert(db, insert_prob_sql, {
@@ -83,7 +87,14 @@ def auto_publish_contest_problems(contest_dict: dict, db: Session):
                 "tags": new_tags,
                 "creator_id": problem['creator_id'],
                 "test_cases": problem['test_cases'],
-                "visible": True
+                "visible": True,
+                "judge_mode": problem.get('judge_mode'),
+                "checker_type": problem.get('checker_type'),
+                "checker_epsilon": problem.get('checker_epsilon'),
+                "checker_language": problem.get('checker_language'),
+                "checker_code": problem.get('checker_code'),
+                "test_data_version": problem.get('test_data_version'),
+                "test_data_hash": problem.get('test_data_hash')
             })
             
             # 更新所有相关提交记录的 problem_id
@@ -308,15 +319,16 @@ def create_contest(
 ):
     """创建比赛（管理员）"""
     insert_sql = """
-        INSERT INTO contest (title, description, start_time, end_time, creator_id)
-        VALUES (:title, :description, :start_time, :end_time, :creator_id)
+        INSERT INTO contest (title, description, start_time, end_time, creator_id, judge_mode)
+        VALUES (:title, :description, :start_time, :end_time, :creator_id, :judge_mode)
     """
     contest_id = execute_insert(db, insert_sql, {
         "title": contest.title,
         "description": contest.description,
         "start_time": contest.start_time,
         "end_time": contest.end_time,
-        "creator_id": creator_id
+        "creator_id": creator_id,
+        "judge_mode": contest.judge_mode
     })
     
     # 记录活动日志
@@ -905,11 +917,15 @@ def publish_invisible_problems(
                 INSERT INTO problem (
                     title, description, input_format, output_format,
                     sample_input, sample_output, time_limit, memory_limit,
-                    difficulty, tags, creator_id, test_cases, visible
+                    difficulty, tags, creator_id, test_cases, visible, judge_mode,
+                    checker_type, checker_epsilon, checker_language, checker_code,
+                    test_data_version, test_data_hash
                 ) VALUES (
                     :title, :description, :input_format, :output_format,
                     :sample_input, :sample_output, :time_limit, :memory_limit,
-                    :difficulty, :tags, :creator_id, :test_cases, :visible
+                    :difficulty, :tags, :creator_id, :test_cases, :visible, :judge_mode,
+                    :checker_type, :checker_epsilon, :checker_language, :checker_code,
+                    :test_data_version, :test_data_hash
                 )
             """
             new_id = execute_insert(db, insert_prob_sql, {
@@ -925,7 +941,14 @@ def publish_invisible_problems(
                 "tags": new_tags,
                 "creator_id": problem['creator_id'],
                 "test_cases": problem['test_cases'],
-                "visible": True
+                "visible": True,
+                "judge_mode": problem.get('judge_mode'),
+                "checker_type": problem.get('checker_type'),
+                "checker_epsilon": problem.get('checker_epsilon'),
+                "checker_language": problem.get('checker_language'),
+                "checker_code": problem.get('checker_code'),
+                "test_data_version": problem.get('test_data_version'),
+                "test_data_hash": problem.get('test_data_hash')
             })
             
             # 更新所有相关提交记录的 problem_id，并将比赛提交转为题库提交
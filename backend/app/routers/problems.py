@@ -6,6 +6,9 @@ import json
 
 from app.database import get_db, execute_query, execute_insert, execute_update, fetch_one
 from app.schemas import ProblemCreate, ProblemResponse, ProblemUpdate
+from app.judge_checker import test_data_digest, with_output_digests
+from app.test_data import externalize_test_cases, inline_test_cases
+from app.problem_cache import get_problem_cache
 
 router = APIRouter(prefix="/api/problems", tags=["problems"])
 
@@ -41,7 +44,10 @@ def create_problem(problem: ProblemCreate, creator_id: int, db: Session = Depend
     is_visible = problem.visible if problem.visible is not None else True
     
     # 处理test_cases（如果有）
-    test_cases_json = json.dumps(problem.test_cases) if problem.test_cases else None
+    test_cases_list = with_output_digests([tc.dict() for tc in problem.test_cases]) if problem.test_cases else []
+    # 输入和期望输出存入 test_blob，test_cases 中只保留哈希等元数据
+    test_cases_list = externalize_test_cases(db, test_cases_list)
+    test_cases_json = json.dumps(test_cases_list) if problem.test_cases else None
     
     if not is_visible:
         # 为比赛专用题目手动分配保留ID（1-9999）
@@ -50,11 +56,15 @@ def create_problem(problem: ProblemCreate, creator_id: int, db: Session = Depend
             INSERT INTO problem (
                 problem_id, title, description, input_format, output_format,
                 sample_input, sample_output, time_limit, memory_limit,
-                difficulty, tags, creator_id, test_cases, visible
+                difficulty, tags, creator_id, test_cases, visible, judge_mode,
+                checker_type, checker_epsilon, checker_language, checker_code,
+                test_data_version, test_data_hash
             ) VALUES (
                 :problem_id, :title, :description, :input_format, :output_format,
                 :sample_input, :sample_output, :time_limit, :memory_limit,
-                :difficulty, :tags, :creator_id, :test_cases, :visible
+                :difficulty, :tags, :creator_id, :test_cases, :visible, :judge_mode,
+                :checker_type, :checker_epsilon, :checker_language, :checker_code,
+                1, :test_data_hash
             )
         """
         problem_id = reserved_id
@@ -72,7 +82,13 @@ def create_problem(problem: ProblemCreate, creator_id: int, db: Session = Depend
             "tags": problem.tags,
             "creator_id": creator_id,
             "test_cases": test_cases_json,
-            "visible": False
+            "visible": False,
+            "judge_mode": problem.judge_mode,
+            "checker_type": problem.checker_type,
+            "checker_epsilon": problem.checker_epsilon,
+            "checker_language": problem.checker_language,
+            "checker_code": problem.checker_code,
+            "test_data_hash": test_data_digest(test_cases_list)
         })
     else:
         # 公开题目使用自动递增ID（>=10000）
@@ -80,11 +96,15 @@ def create_problem(problem: ProblemCreate, creator_id: int, db: Session = Depend
             INSERT INTO problem (
                 title, description, input_format, output_format,
                 sample_input, sample_output, time_limit, memory_limit,
-                difficulty, tags, creator_id, test_cases, visible
+                difficulty, tags, creator_id, test_cases, visible, judge_mode,
+                checker_type, checker_epsilon, checker_language, checker_code,
+                test_data_version, test_data_hash
             ) VALUES (
                 :title, :description, :input_format, :output_format,
                 :sample_input, :sample_output, :time_limit, :memory_limit,
-                :difficulty, :tags, :creator_id, :test_cases, :visible
+                :difficulty, :tags, :creator_id, :test_cases, :visible, :judge_mode,
+                :checker_type, :checker_epsilon, :checker_language, :checker_code,
+                1, :test_data_hash
             )
         """
         problem_id = execute_insert(db, insert_sql, {
@@ -100,7 +120,13 @@ def create_problem(problem: ProblemCreate, creator_id: int, db: Session = Depend
             "tags": problem.tags,
             "creator_id": creator_id,
             "test_cases": test_cases_json,
-            "visible": True
+            "visible": True,
+            "judge_mode": problem.judge_mode,
+            "checker_type": problem.checker_type,
+            "checker_epsilon": problem.checker_epsilon,
+            "checker_language": problem.checker_language,
+            "checker_code": problem.checker_code,
+            "test_data_hash": test_data_digest(test_cases_list)
         })
     
     # 记录活动日志（原生SQL）
@@ -144,6 +170,10 @@ def create_problem(problem: ProblemCreate, creator_id: int, db: Session = Depend
             except:
                 db_problem['test_cases'] = []
 
+    # 测试数据存入 test_blob 的测试点按哈希取出输入和期望输出
+    if isinstance(db_problem.get('test_cases'), list):
+        db_problem['test_cases'] = inline_test_cases(db, db_problem['test_cases'])
+
     return db_problem
 
 
@@ -159,7 +189,11 @@ def get_problems(
     user_id: Optional[int] = None,  # 用户ID，用于查询通过状态
     db: Session = Depends(get_db)
 ):
-    """获取题目列表（支持搜索、筛选、排序）"""
+    """获取题目列表（支持搜索、筛选、排序）
+
+    列表不返回 test_cases：测试数据存入 test_blob 后该列只有哈希等元数据，
+    需要测试点时通过 GET /problems/{problem_id} 获取（已取出输入和期望输出）。
+    """
     # 权限过滤：非管理员只能看到公开题库的题目（ID>=10000）
     is_admin = False
     if user_id:
@@ -214,6 +248,7 @@ def get_problems(
     result = []
     for problem in problems:
         problem_dict = dict(problem)
+        problem_dict.pop("test_cases", None)
         problem_dict["is_solved"] = False
         
         if user_id:
@@ -274,6 +309,10 @@ def get_problem(problem_id: int, db: Session = Depends(get_db)):
             except:
                 problem['test_cases'] = []
 
+    # 测试数据存入 test_blob 的测试点按哈希取出输入和期望输出
+    if isinstance(problem.get('test_cases'), list):
+        problem['test_cases'] = inline_test_cases(db, problem['test_cases'])
+
     return problem
 
 
@@ -297,12 +336,19 @@ def update_problem(
         return fetch_one(db, "SELECT * FROM problem WHERE problem_id = :problem_id", 
                         {"problem_id": problem_id})
     
-    # 处理test_cases
-    if 'test_cases' in update_data and update_data['test_cases'] is not None:
-        update_data['test_cases'] = json.dumps(update_data['test_cases'])
-    
     update_fields = []
     params = {"problem_id": problem_id}
+
+    # 处理test_cases
+    if 'test_cases' in update_data and update_data['test_cases'] is not None:
+        test_cases_list = externalize_test_cases(db, with_output_digests(update_data['test_cases']))
+        update_data['test_cases'] = json.dumps(test_cases_list)
+        # 测试数据或分数有变化时版本号加一（须在 test_data_hash 之前赋值：MySQL 按顺序求值 SET 子句）
+        update_fields.append(
+            "test_data_version = COALESCE(test_data_version, 0)"
+            " + CASE WHEN test_data_hash = :test_data_hash THEN 0 ELSE 1 END"
+        )
+        update_data['test_data_hash'] = test_data_digest(test_cases_list)
     
     for field, value in update_data.items():
         update_fields.append(f"{field} = :{field}")
@@ -311,6 +357,8 @@ def update_problem(
     if update_fields:
         update_sql = f"UPDATE problem SET {', '.join(update_fields)} WHERE problem_id = :problem_id"
         execute_update(db, update_sql, params)
+        # 本进程内的评测题目缓存立即失效（其他评测进程按测试数据版本判断）
+        get_problem_cache().invalidate(problem_id)
     
     # 获取更新后的题目标题用于日志
     updated_problem = fetch_one(db, "SELECT title FROM problem WHERE problem_id = :problem_id", 
@@ -353,6 +401,10 @@ def update_problem(
             except:
                 updated['test_cases'] = []
 
+    # 测试数据存入 test_blob 的测试点按哈希取出输入和期望输出
+    if isinstance(updated.get('test_cases'), list):
+        updated['test_cases'] = inline_test_cases(db, updated['test_cases'])
+
     return updated
 
 
@@ -408,6 +460,7 @@ def delete_problem(problem_id: int, user_id: int, db: Session = Depends(get_db))
     # 5. 删除题目本身
     delete_problem_sql = "DELETE FROM problem WHERE problem_id = :problem_id"
     execute_update(db, delete_problem_sql, {"problem_id": problem_id})
+    get_problem_cache().invalidate(problem_id)
     
     # 6. 记录活动日志
     log_sql = """
@@ -1,7 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, BackgroundTasks, Query, Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
+import asyncio
+import hashlib
 import json
 
 from app.database import get_db, execute_query, execute_insert, execute_update, fetch_one, SessionLocal
@@ -9,14 +13,23 @@ from app.schemas import (
     SubmissionCreate, SubmissionResponse, SubmissionUpdate, 
     SubmissionDetailResponse, JudgeResultResponse
 )
-from app.judge_worker import submit_submission_judge
+from app.judge_worker import check_admission, submit_submission_judge
+from app.judge_events import get_event_hub
 from app.judge_runner import run_submission_judge
+from app.test_data import get_test_data_store
 
 router = APIRouter(prefix="/api/submissions", tags=["submissions"])
 
 
+# 本进程是否已确认 problem_submission 表存在（避免每次提交都执行一次 DDL）
+_problem_submission_table_ready = False
+
+
 def ensure_problem_submission_table(db: Session):
     """确保 problem_submission 联系表存在。"""
+    global _problem_submission_table_ready
+    if _problem_submission_table_ready:
+        return
     create_sql = """
         CREATE TABLE IF NOT EXISTS problem_submission (
             problem_id INT NOT NULL,
@@ -31,6 +44,19 @@ def ensure_problem_submission_table(db: Session):
     """
     # 使用 execute_update 以便兼容 DDL（返回值可忽略）
     execute_update(db, create_sql, {})
+    _problem_submission_table_ready = True
+
+
+def ensure_judge_capacity(db: Session, user_id: int, count: int = 1):
+    """准入控制：评测队列积压或用户未完成的提交过多时返回 429，并给出建议的重试等待时间。"""
+    rejected = check_admission(db, user_id, count)
+    if rejected:
+        message, retry_after = rejected
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=message,
+            headers={"Retry-After": str(retry_after)}
+        )
 
 
 def link_problem_submission(db: Session, problem_id: int, submission_id: int):
@@ -77,6 +103,8 @@ def create_submission(
         raise HTTPException(status_code=404, detail="题目不存在")
     # 如果指定了同步提交的用户，先验证权限与约束
     sync_with = submission.sync_with or []
+    # 在写入任何数据之前做准入检查（同步提交不单独评测，只占用一个评测任务）
+    ensure_judge_capacity(db, user_id, 1)
     if sync_with:
         # 确保提交者和每个同步用户是已接受的好友关系
         for collab_id in sync_with:
@@ -103,9 +131,9 @@ def create_submission(
     # 创建初始提交记录（状态为 judging）
     insert_sql = """
         INSERT INTO submission (
-            problem_id, contest_id, code, language, status, exec_time, exec_memory, submitted_at
+            problem_id, contest_id, code, language, status, exec_time, exec_memory, submitted_at, sync_source_id
         ) VALUES (
-            :problem_id, :contest_id, :code, :language, :status, :exec_time, :exec_memory, :submitted_at
+            :problem_id, :contest_id, :code, :language, :status, :exec_time, :exec_memory, :submitted_at, :sync_source_id
         )
     """
     submission_id = execute_insert(db, insert_sql, {
@@ -116,7 +144,8 @@ def create_submission(
         "status": 'judging',
         "exec_time": 0,
         "exec_memory": 0,
-        "submitted_at": datetime.utcnow()
+        "submitted_at": datetime.utcnow(),
+        "sync_source_id": None
     })
 
     # 记录题目-提交关系
@@ -144,7 +173,9 @@ def create_submission(
                 "status": 'judging',
                 "exec_time": 0,
                 "exec_memory": 0,
-                "submitted_at": datetime.utcnow()
+                "submitted_at": datetime.utcnow(),
+                # 同步提交与发起者的代码相同，只评测发起者的提交，结果一并写入
+                "sync_source_id": submission_id
             })
             execute_insert(db, user_sub_sql, {
                 "user_id": collab_id,
@@ -153,20 +184,16 @@ def create_submission(
             link_problem_submission(db, submission.problem_id, collab_sub_id)
             created_collab_submissions.append((collab_id, collab_sub_id))
     
-    # 开始评测：先评测发起者提交，再评测同步的提交（如果有）
+    # 开始评测：只评测发起者的提交，同步的提交在评测完成时一并写入相同结果
     try:
         # 将主提交也改为异步：提交到线程池并立即返回（submission.status 已为 'judging'）
         background_tasks.add_task(_background_judge, submission_id)
-        # 将协作用户的评测异步化，减少 HTTP 响应延迟
-        for collab_id, collab_sub_id in created_collab_submissions:
-            # 使用 BackgroundTasks 触发将任务提交到线程池（非阻塞）
-            background_tasks.add_task(_background_judge, collab_sub_id)
     except Exception as e:
         # 评测失败，更新状态
         update_sql = """
             UPDATE submission 
             SET status = :status, exec_time = :exec_time, exec_memory = :exec_memory
-            WHERE submission_id = :submission_id
+            WHERE submission_id = :submission_id OR sync_source_id = :submission_id
         """
         execute_update(db, update_sql, {
             "status": 'system_error',
@@ -256,6 +283,8 @@ async def create_submission_from_file(
             raise ValueError()
     except Exception:
         raise HTTPException(status_code=400, detail="sync_with 参数格式不正确，应为 JSON 数组")
+    # 在写入任何数据之前做准入检查（同步提交不单独评测，只占用一个评测任务）
+    ensure_judge_capacity(db, user_id, 1)
     # 验证好友关系和比赛报名（和 create_submission 中相同的约束）
     if sync_list:
         for collab_id in sync_list:
@@ -280,9 +309,9 @@ async def create_submission_from_file(
     # 创建提交记录
     insert_sql = """
         INSERT INTO submission (
-            problem_id, contest_id, code, language, status, exec_time, exec_memory, submitted_at
+            problem_id, contest_id, code, language, status, exec_time, exec_memory, submitted_at, sync_source_id
         ) VALUES (
-            :problem_id, :contest_id, :code, :language, :status, :exec_time, :exec_memory, :submitted_at
+            :problem_id, :contest_id, :code, :language, :status, :exec_time, :exec_memory, :submitted_at, :sync_source_id
         )
     """
     submission_id = execute_insert(db, insert_sql, {
@@ -293,7 +322,8 @@ async def create_submission_from_file(
         "status": 'judging',
         "exec_time": 0,
         "exec_memory": 0,
-        "submitted_at": datetime.utcnow()
+        "submitted_at": datetime.utcnow(),
+        "sync_source_id": None
     })
 
     # 记录题目-提交关系
@@ -321,7 +351,9 @@ async def create_submission_from_file(
                 "status": 'judging',
                 "exec_time": 0,
                 "exec_memory": 0,
-                "submitted_at": datetime.utcnow()
+                "submitted_at": datetime.utcnow(),
+                # 同步提交与发起者的代码相同，只评测发起者的提交，结果一并写入
+                "sync_source_id": submission_id
             })
             execute_insert(db, user_sub_sql, {
                 "user_id": collab_id,
@@ -330,7 +362,7 @@ async def create_submission_from_file(
             link_problem_submission(db, problem_id, collab_sub_id)
             created_collab_submissions.append((collab_id, collab_sub_id))
     
-    # 开始评测
+    # 开始评测：只评测发起者的提交，同步的提交在评测完成时一并写入相同结果
     try:
         # 将主提交改为异步：提交到线程池并立即返回
         if background_tasks is not None:
@@ -338,23 +370,12 @@ async def create_submission_from_file(
         else:
             # 兼容没有 BackgroundTasks 的调用方式，直接提交到线程池
             submit_submission_judge(submission_id)
-
-        # 协作提交异步评测
-        if background_tasks is not None:
-            for collab_id, collab_sub_id in created_collab_submissions:
-                background_tasks.add_task(_background_judge, collab_sub_id)
-        else:
-            for collab_id, collab_sub_id in created_collab_submissions:
-                try:
-                    submit_submission_judge(collab_sub_id)
-                except Exception as e:
-                    print(f"协作用户 {collab_id} 的评测任务提交失败: {e}")
     except Exception as e:
         # 评测失败，更新状态
         update_sql = """
             UPDATE submission 
             SET status = :status, exec_time = :exec_time, exec_memory = :exec_memory
-            WHERE submission_id = :submission_id
+            WHERE submission_id = :submission_id OR sync_source_id = :submission_id
         """
         execute_update(db, update_sql, {
             "status": 'system_error',
@@ -391,13 +412,14 @@ async def create_submission_from_file(
     return {"submission": db_submission, "task_id": submission_id}
 
 
-def judge_submission(submission_id: int, db: Session):
+def judge_submission(submission_id: int, db: Session, force: bool = False):
     """
     评测提交
     
     Args:
         submission_id: 提交ID
         db: 数据库会话
+        force: 不复用已有评测结果，强制重新运行
     """
     # 获取提交记录（原生SQL）
     sub_sql = "SELECT * FROM submission WHERE submission_id = :submission_id"
@@ -430,19 +452,19 @@ def judge_submission(submission_id: int, db: Session):
         return
     
     # 调用共享的评测 runner（使用当前请求提供的 db 会话同步运行）
-    run_submission_judge(submission_id, db=db)
+    run_submission_judge(submission_id, db=db, force=force)
 
 
-def _background_judge(submission_id: int):
+def _background_judge(submission_id: int, rejudge: bool = False, force: bool = False, incremental: bool = False):
     """Background wrapper used with FastAPI BackgroundTasks.
 
     This function will enqueue the actual judging work into the global thread pool so
     multiple submissions can be judged concurrently. It returns immediately after
     scheduling the task. Any exceptions inside worker threads are captured by the
-    ThreadPoolExecutor and printed there.
+    judge pool and printed there.
     """
     try:
-        future = submit_submission_judge(submission_id)
+        future = submit_submission_judge(submission_id, rejudge=rejudge, force=force, incremental=incremental)
         # Optionally attach a callback to log exceptions
         def _cb(f):
             try:
@@ -456,7 +478,7 @@ def _background_judge(submission_id: int):
 
 @router.get('/worker_stats', response_model=dict)
 def get_worker_stats():
-    """Return statistics about the judge thread pool (running/pending/max_workers)."""
+    """Return judge pool statistics (running/pending/max_workers, queue depth per priority class) and compile cache."""
     try:
         from app.judge_worker import get_stats
         return get_stats()
@@ -464,6 +486,158 @@ def get_worker_stats():
         return {"error": str(e)}
 
 
+# 批量查询状态时一次最多的提交数
+STATUS_BATCH_LIMIT = 200
+
+
+def _fill_legacy_scores(db: Session, rows: List[dict]):
+    """为 score 列新增前已评测完成的提交从 judge_results 计算总分，只用于本次响应，不写回数据库
+
+    轮询接口调用频繁，不在这里逐行 UPDATE 并提交；这类旧提交只在重测时写入 score。
+    """
+    legacy = [row for row in rows if row['score'] is None and row['status'] != 'judging']
+    if not legacy:
+        return
+    placeholders = ', '.join(f':id{i}' for i in range(len(legacy)))
+    results = execute_query(db, f"""
+        SELECT submission_id, judge_results FROM submission WHERE submission_id IN ({placeholders})
+    """, {f'id{i}': row['submission_id'] for i, row in enumerate(legacy)})
+    scores = {}
+    for result in results:
+        judge_results = result['judge_results']
+        if isinstance(judge_results, str):
+            judge_results = json.loads(judge_results)
+        scores[result['submission_id']] = sum(r.get('score', 0) for r in judge_results or [])
+    for row in legacy:
+        row['score'] = scores.get(row['submission_id'], 0)
+
+
+@router.get('/status')
+def get_submission_statuses(
+    request: Request,
+    submission_id: List[int] = Query(...),
+    db: Session = Depends(get_db)
+):
+    """批量查询提交状态（轮询用）
+
+    只返回 submission_id、status、exec_time、exec_memory、score（评测中为 null），
+    通过一次主键 IN 查询完成。响应带 ETag，请求携带 If-None-Match 且状态未变化时返回 304。
+    不存在的提交不出现在结果中。
+    """
+    submission_ids = list(dict.fromkeys(submission_id))
+    if len(submission_ids) > STATUS_BATCH_LIMIT:
+        raise HTTPException(status_code=400, detail=f"一次最多查询 {STATUS_BATCH_LIMIT} 个提交")
+
+    placeholders = ', '.join(f':id{i}' for i in range(len(submission_ids)))
+    rows = execute_query(db, f"""
+        SELECT submission_id, status, exec_time, exec_memory, score
+        FROM submission WHERE submission_id IN ({placeholders})
+        ORDER BY submission_id
+    """, {f'id{i}': sid for i, sid in enumerate(submission_ids)})
+    _fill_legacy_scores(db, rows)
+
+    body = json.dumps(rows, separators=(',', ':'))
+    etag = '"' + hashlib.md5(body.encode()).hexdigest() + '"'
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if etag in [tag.strip() for tag in request.headers.get('if-none-match', '').split(',')]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type='application/json', headers=headers)
+
+
+# SSE 连接空闲时发送心跳的间隔（秒），避免被代理断开
+EVENTS_KEEPALIVE_SECONDS = 15
+
+
+def _submission_snapshots(submission_ids: List[int]) -> List[dict]:
+    """读取提交的当前状态（订阅建立后发送一次，避免订阅前已出结果的提交等不到事件）"""
+    if not submission_ids:
+        return []
+    db = SessionLocal()
+    try:
+        placeholders = ', '.join(f':id{i}' for i in range(len(submission_ids)))
+        rows = execute_query(db, f"""
+            SELECT submission_id, contest_id, status, exec_time, exec_memory
+            FROM submission WHERE submission_id IN ({placeholders})
+        """, {f'id{i}': sid for i, sid in enumerate(submission_ids)})
+    finally:
+        db.close()
+    return [dict(row, type='status') for row in rows]
+
+
+def _sse(event: dict) -> str:
+    return f"event: {event.get('type', 'message')}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+@router.get('/events')
+async def submission_events(
+    request: Request,
+    submission_id: Optional[List[int]] = Query(None),
+    user_id: Optional[int] = None,
+    contest_id: Optional[int] = None
+):
+    """订阅评测结果（Server-Sent Events）
+
+    可同时订阅若干提交（submission_id 可重复）、某用户或某比赛的全部提交。
+    建立连接后先为每个指定的提交发送一次当前状态（status 事件），评测过程中按
+    JUDGE_PROGRESS_INTERVAL_SECONDS 发送合并后的进度（progress 事件），每出一个结果发送一条 verdict 事件。
+    只订阅了提交且这些提交都已出结果时连接自动结束。
+    空闲超过 EVENTS_KEEPALIVE_SECONDS 时重新读取仍在等待的提交状态，已出结果的补发一次 status 事件，
+    即使 verdict 事件丢失，等待中的连接也能结束。
+    """
+    submission_ids = list(dict.fromkeys(submission_id or []))
+    channels = [f'submission:{sid}' for sid in submission_ids]
+    if user_id is not None:
+        channels.append(f'user:{user_id}')
+    if contest_id is not None:
+        channels.append(f'contest:{contest_id}')
+    if not channels:
+        raise HTTPException(status_code=400, detail="至少需要指定 submission_id、user_id 或 contest_id 之一")
+
+    hub = get_event_hub()
+    subscription = hub.subscribe(channels, asyncio.get_running_loop())
+    # 只订阅提交时，全部出结果后结束连接
+    close_when_done = user_id is None and contest_id is None
+    pending = set(submission_ids)
+
+    async def stream():
+        try:
+            snapshots = await run_in_threadpool(_submission_snapshots, submission_ids)
+            # 不存在的提交不会再有事件
+            pending.intersection_update(snapshot['submission_id'] for snapshot in snapshots)
+            for snapshot in snapshots:
+                yield _sse(snapshot)
+                if snapshot['status'] != 'judging':
+                    pending.discard(snapshot['submission_id'])
+                else:
+                    # 评测已在本进程进行中时补发最近一次进度
+                    progress = hub.get_progress(snapshot['submission_id'])
+                    if progress is not None:
+                        yield _sse(progress)
+            while not (close_when_done and not pending):
+                if await request.is_disconnected():
+                    break
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    if pending:
+                        for snapshot in await run_in_threadpool(_submission_snapshots, list(pending)):
+                            if snapshot['status'] != 'judging':
+                                yield _sse(snapshot)
+                                pending.discard(snapshot['submission_id'])
+                    continue
+                yield _sse(event)
+                if event.get('type') == 'verdict':
+                    pending.discard(event['submission_id'])
+        finally:
+            hub.unsubscribe(subscription)
+
+    return StreamingResponse(stream(), media_type='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
 @router.get("/", response_model=List[dict])
 def get_submissions(
     skip: int = 0,
@@ -616,6 +790,45 @@ def get_submission(submission_id: int, db: Session = Depends(get_db)):
     return submission
 
 
+@router.get("/{submission_id}/progress", response_model=dict)
+def get_submission_progress(submission_id: int, db: Session = Depends(get_db)):
+    """获取评测进度
+
+    返回 completed/total（已完成/总测试点数）和 worst_status（当前编号最小的未通过测试点结果）。
+    进度只保存在内存和最近的评测事件中，评测尚未开始或已结束时 completed/total 为 None。
+    """
+    submission = fetch_one(db, "SELECT submission_id, status FROM submission WHERE submission_id = :submission_id",
+                           {"submission_id": submission_id})
+    if not submission:
+        raise HTTPException(status_code=404, detail="提交记录不存在")
+
+    result = {
+        "submission_id": submission_id,
+        "status": submission['status'],
+        "completed": None,
+        "total": None,
+        "worst_status": None
+    }
+    if submission['status'] != 'judging':
+        return result
+
+    progress = get_event_hub().get_progress(submission_id)
+    if progress is None:
+        # 评测在其他进程中进行：读取其最近发布的进度（最近一条是 verdict 说明是上一次评测的进度）
+        row = fetch_one(db, """
+            SELECT event_type, payload FROM judge_event
+            WHERE submission_id = :submission_id AND event_type IN ('progress', 'verdict')
+            ORDER BY event_id DESC LIMIT 1
+        """, {"submission_id": submission_id})
+        if row and row['event_type'] == 'progress':
+            payload = row['payload']
+            progress = json.loads(payload) if isinstance(payload, str) else payload
+    if progress is not None:
+        result.update(completed=progress.get('completed'), total=progress.get('total'),
+                      worst_status=progress.get('worst_status'))
+    return result
+
+
 @router.get("/{submission_id}/detail", response_model=dict)
 def get_submission_detail(
     submission_id: int, 
@@ -657,6 +870,19 @@ def get_submission_detail(
         current_user_sql = "SELECT role FROM user WHERE user_id = :user_id"
         current_user = fetch_one(db, current_user_sql, {"user_id": user_id})
         is_admin = current_user and current_user['role'] == 'admin'
+
+    if is_admin:
+        # 测试数据存入 test_blob 后评测结果中只记录哈希，按哈希取出输入和期望输出
+        store = get_test_data_store()
+        for jr in judge_results:
+            try:
+                if jr.get('input_hash') and not jr.get('input_data'):
+                    jr['input_data'] = store.read_text(db, jr['input_hash'])
+                if jr.get('output_hash') and not jr.get('expected_output'):
+                    jr['expected_output'] = store.read_text(db, jr['output_hash'])
+            except ValueError:
+                # 题目测试数据已修改，旧数据已被清除
+                pass
     
     # 构造响应
     result = {
@@ -689,6 +915,7 @@ def get_submission_detail(
                 "test_case_index": jr.get('test_case_index'),
                 "status": jr.get('status'),
                 "time_used": jr.get('time_used'),
+                "wall_time": jr.get('wall_time'),
                 "memory_used": jr.get('memory_used'),
                 "score": jr.get('score'),
                 "error_message": jr.get('error_message'),
@@ -705,8 +932,11 @@ def get_submission_detail(
 
 
 @router.post("/{submission_id}/rejudge", response_model=dict)
-def rejudge_submission(submission_id: int, user_id: int, db: Session = Depends(get_db)):
-    """重新评测提交（仅管理员）"""
+def rejudge_submission(submission_id: int, user_id: int, force: bool = False, db: Session = Depends(get_db)):
+    """重新评测提交（仅管理员）
+
+    代码和题目评测配置都没有变化时复用已有评测结果；force=true 时强制重新运行。
+    """
     # 检查管理员权限
     user_sql = "SELECT role FROM user WHERE user_id = :user_id"
     user = fetch_one(db, user_sql, {"user_id": user_id})
@@ -722,7 +952,7 @@ def rejudge_submission(submission_id: int, user_id: int, db: Session = Depends(g
     # 清空旧的评测结果并更新状态
     clear_sql = """
         UPDATE submission 
-        SET judge_results = NULL, status = :status
+        SET judge_results = NULL, score = NULL, status = :status
         WHERE submission_id = :submission_id
     """
     execute_update(db, clear_sql, {
@@ -731,7 +961,7 @@ def rejudge_submission(submission_id: int, user_id: int, db: Session = Depends(g
     })
     
     try:
-        judge_submission(submission_id, db)
+        judge_submission(submission_id, db, force=force)
     except Exception as e:
         error_sql = "UPDATE submission SET status = :status WHERE submission_id = :submission_id"
         execute_update(db, error_sql, {
@@ -749,10 +979,12 @@ def rejudge_submission(submission_id: int, user_id: int, db: Session = Depends(g
 
 
 @router.post("/rejudge_bulk", response_model=dict)
-def rejudge_bulk(submission_ids: dict, user_id: int, background_tasks: BackgroundTasks = None, db: Session = Depends(get_db)):
+def rejudge_bulk(submission_ids: dict, user_id: int, force: bool = False, background_tasks: BackgroundTasks = None,
+                 db: Session = Depends(get_db)):
     """批量重测提交（仅管理员）
 
     请求体示例: {"submission_ids": [1,2,3]}
+    代码和题目评测配置都没有变化的提交直接复用已有评测结果；force=true 时全部重新运行。
     """
     # 校验管理员权限
     user_sql = "SELECT role FROM user WHERE user_id = :user_id"
@@ -774,16 +1006,16 @@ def rejudge_bulk(submission_ids: dict, user_id: int, background_tasks: Backgroun
         # 清空旧的评测结果并标记为 judging
         clear_sql = """
             UPDATE submission
-            SET judge_results = NULL, status = :status
+            SET judge_results = NULL, score = NULL, status = :status
             WHERE submission_id = :submission_id
         """
         execute_update(db, clear_sql, {"status": 'judging', "submission_id": sid})
         # 若有 background_tasks，则异步评测；否则同步评测
         if background_tasks is not None:
-            background_tasks.add_task(_background_judge, sid)
+            background_tasks.add_task(_background_judge, sid, True, force)
         else:
             try:
-                judge_submission(sid, db)
+                judge_submission(sid, db, force=force)
             except Exception as e:
                 # 将状态置为 system_error
                 execute_update(db, "UPDATE submission SET status = :status WHERE submission_id = :submission_id", {
@@ -794,6 +1026,53 @@ def rejudge_bulk(submission_ids: dict, user_id: int, background_tasks: Backgroun
     return {"processed_count": len(processed), "processed_ids": processed}
 
 
+# 增量重测时每条 UPDATE 标记的提交数
+INCREMENTAL_REJUDGE_CHUNK = 500
+
+
+@router.post("/rejudge_incremental", response_model=dict)
+def rejudge_incremental(problem_id: int, user_id: int, background_tasks: BackgroundTasks,
+                        db: Session = Depends(get_db)):
+    """增量重测某题目的全部提交（仅管理员）
+
+    修改测试点后使用：只处理按旧版本测试数据（test_data_version）评测的提交，每个提交保留
+    数据未变化的测试点结果，只运行新增或修改过的测试点，合并后重新计算状态和分数。
+    编译错误与测试数据无关，这类提交不重测。
+    通过 sync_with 同步创建的提交不单独入队：与其来源一起标记为评测中，由 save_verdict 写入来源的结果。
+    """
+    user = fetch_one(db, "SELECT role FROM user WHERE user_id = :user_id", {"user_id": user_id})
+    if not user or user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="权限不足，仅管理员可以重测提交")
+    problem = fetch_one(db, "SELECT problem_id, test_data_version FROM problem WHERE problem_id = :problem_id",
+                        {"problem_id": problem_id})
+    if not problem:
+        raise HTTPException(status_code=404, detail="题目不存在")
+
+    # 只重测按旧版本测试数据评测的提交（没有版本记录的视为旧版本）
+    rows = execute_query(db, """
+        SELECT submission_id FROM submission
+        WHERE problem_id = :problem_id AND status NOT IN ('judging', 'compile_error')
+            AND (test_data_version IS NULL OR test_data_version <> :version)
+            AND sync_source_id IS NULL
+        ORDER BY submission_id
+    """, {"problem_id": problem_id, "version": problem.get('test_data_version') or 0})
+    ids = [row['submission_id'] for row in rows]
+    # 保留 judge_results 供评测时复用，只标记为 judging；同步副本一并标记，评测来源时写入相同结果
+    for start in range(0, len(ids), INCREMENTAL_REJUDGE_CHUNK):
+        chunk = ids[start:start + INCREMENTAL_REJUDGE_CHUNK]
+        placeholders = ', '.join(f':id{i}' for i in range(len(chunk)))
+        params = {f'id{i}': sid for i, sid in enumerate(chunk)}
+        execute_update(db, f"""
+            UPDATE submission SET status = :status, score = NULL
+            WHERE submission_id IN ({placeholders})
+                OR (sync_source_id IN ({placeholders}) AND status NOT IN ('judging', 'compile_error'))
+        """, dict(params, status='judging'))
+    for sid in ids:
+        background_tasks.add_task(_background_judge, sid, True, False, True)
+
+    return {"processed_count": len(ids), "processed_ids": ids}
+
+
 @router.put("/{submission_id}", response_model=dict)
 def update_submission(
     submission_id: int,
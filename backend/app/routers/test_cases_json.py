@@ -14,6 +14,9 @@ import uuid
 import logging
 from app.auth import get_current_user
 from app.models import User
+from app.judge_checker import test_data_digest, with_output_digests
+from app.test_data import externalize_test_cases, inline_test_cases
+from app.problem_cache import get_problem_cache
 
 router = APIRouter(prefix="/api/test-cases", tags=["test-cases"])
 
@@ -34,6 +37,8 @@ def _load_problem_test_cases_json(db, problem_id: int):
             tcs = []
     if not isinstance(tcs, list):
         tcs = []
+    # 测试数据存入 test_blob 的测试点按哈希取出输入和期望输出
+    tcs = inline_test_cases(db, tcs)
     normalized = []
     for idx, tc in enumerate(tcs):
         if not isinstance(tc, dict):
@@ -65,8 +70,25 @@ def _save_problem_test_cases_json(db, problem_id: int, tcs: list):
             'is_sample': int(tc.get('is_sample', 0)),
             'order': int(tc.get('order', 0))
         })
-    update_sql = "UPDATE problem SET test_cases = :test_cases WHERE problem_id = :problem_id"
-    execute_update(db, update_sql, {"test_cases": _json.dumps(simple), "problem_id": problem_id})
+    # 预先计算规范化后的期望输出摘要，评测通过的提交只需对实际输出做一遍哈希
+    with_output_digests(simple)
+    # 输入和期望输出存入 test_blob，test_cases 中只保留哈希等元数据
+    simple = externalize_test_cases(db, simple)
+    # 测试数据或分数有变化时版本号加一（版本号须在 test_data_hash 之前赋值：MySQL 按顺序求值 SET 子句）
+    update_sql = """
+        UPDATE problem SET
+            test_data_version = COALESCE(test_data_version, 0)
+                + CASE WHEN test_data_hash = :test_data_hash THEN 0 ELSE 1 END,
+            test_data_hash = :test_data_hash,
+            test_cases = :test_cases
+        WHERE problem_id = :problem_id
+    """
+    execute_update(db, update_sql, {
+        "test_cases": _json.dumps(simple),
+        "test_data_hash": test_data_digest(simple),
+        "problem_id": problem_id
+    })
+    get_problem_cache().invalidate(problem_id)
     logger.debug("_save_problem_test_cases_json: saved test_cases for problem_id=%s", problem_id)
 
 
@@ -47,6 +47,11 @@ class ProblemBase(BaseModel):
     difficulty: str
     tags: Optional[str] = None
     visible: Optional[bool] = True  # 是否对普通用户可见
+    judge_mode: Optional[str] = None  # 'oi' 或 'acm'，为空时按 'oi'
+    checker_type: Optional[str] = None  # 'line'、'exact'、'token'、'float' 或 'custom'，为空时按 'line'
+    checker_epsilon: Optional[float] = None  # float 检查方式允许的误差
+    checker_language: Optional[str] = None  # custom 检查器的语言
+    checker_code: Optional[str] = None  # custom 检查器源代码
 
 
 class ProblemCreate(ProblemBase):
@@ -65,6 +70,11 @@ class ProblemUpdate(BaseModel):
     difficulty: Optional[str] = None
     tags: Optional[str] = None
     visible: Optional[bool] = None
+    judge_mode: Optional[str] = None
+    checker_type: Optional[str] = None
+    checker_epsilon: Optional[float] = None
+    checker_language: Optional[str] = None
+    checker_code: Optional[str] = None
     test_cases: Optional[List['TestCaseData']] = None
 
 
@@ -95,6 +105,7 @@ class ContestBase(BaseModel):
     description: str
     start_time: datetime
     end_time: datetime
+    judge_mode: Optional[str] = None  # 'oi' 或 'acm'，设置后覆盖比赛内题目的评测模式
 
 
 class ContestCreate(ContestBase):
@@ -106,6 +117,7 @@ class ContestUpdate(BaseModel):
     description: Optional[str] = None
     start_time: Optional[datetime] = None
     end_time: Optional[datetime] = None
+    judge_mode: Optional[str] = None
 
 
 class ContestResponse(ContestBase):
@@ -251,7 +263,8 @@ class TestCaseResponse(BaseModel):
 class JudgeResultResponse(BaseModel):
     test_case_index: int  # 测试点索引
     status: str
-    time_used: Optional[int]
+    time_used: Optional[int]  # CPU 时间（毫秒）
+    wall_time: Optional[int] = None  # 墙钟时间（毫秒）
     memory_used: Optional[int]
     score: int
     error_message: Optional[str]
@@ -0,0 +1,342 @@
+"""
+测试数据存储
+
+测试点的输入和期望输出按内容（SHA-256）寻址，存放在 test_blob 表中，相同内容只存一份；
+problem.test_cases 中只保留元数据：input_hash/output_hash、大小、output_digest、data_hash、分数等。
+读取题目时不再需要把全部测试数据随 JSON 一起取出和解析。
+
+评测进程在 JUDGE_TEST_DATA_DIR 下按哈希缓存测试数据文件（首次使用时从 test_blob 取出，原子写入），
+输入文件直接作为程序的 stdin，期望输出以 mmap 方式只读映射，不再经过 Python 字符串。
+缓存文件以内容哈希命名、内容不会变化，多个评测进程可以共享同一目录。
+本地缓存总大小不超过 JUDGE_TEST_DATA_CACHE_MAX_MB：写入新文件后在文件锁下扫描目录，
+按 mtime（每次使用时更新）淘汰最久未使用的文件，最近使用过的文件不淘汰，避免删掉正要打开的文件。
+
+不再被任何题目引用的 test_blob 由 collect_garbage 标记清除（评测进程的维护线程每
+JUDGE_TEST_DATA_GC_INTERVAL_SECONDS 执行一次，也可以手工运行 python -m app.test_data）。
+
+尚未迁移的题目（测试点中仍内联 input_data/output_data）照常评测，保存测试点时自动迁移；
+也可以运行 python -m app.test_data 一次性迁移全部题目。
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from functools import lru_cache
+from threading import Lock
+from typing import List, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # 非 POSIX 平台只做进程内互斥
+    fcntl = None
+
+from sqlalchemy.exc import IntegrityError
+
+from app.config import get_settings
+from app.database import execute_query, execute_update, fetch_one
+from app.judge_checker import with_output_digests
+
+# 本地缓存目录中的跨进程锁文件
+LOCK_FILE_NAME = '.lock'
+# 最近这段时间内使用过的本地缓存文件不淘汰（秒）：评测可能刚拿到路径、还没有打开
+EVICT_MIN_IDLE_SECONDS = 600
+# 超过该时间的临时文件视为异常退出遗留的半成品（秒）
+STALE_TMP_SECONDS = 3600
+# 新写入（或重新写入）不满这段时间的 test_blob 不清除（秒）：保存题目时先写数据再更新 test_cases
+BLOB_GC_GRACE_SECONDS = 3600
+# 每条 DELETE 语句清除的 test_blob 数
+BLOB_GC_BATCH_SIZE = 200
+
+
+def blob_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def is_external(test_case: dict) -> bool:
+    """测试点数据是否已存入 test_blob（只有元数据）"""
+    return 'input_hash' in test_case and 'input_data' not in test_case
+
+
+class TestDataStore:
+    """按内容哈希存放测试数据的本地文件缓存，数据源为 test_blob 表"""
+
+    def __init__(self, root: str, max_bytes: int = 0):
+        """
+        Args:
+            root: 本地缓存目录
+            max_bytes: 本地缓存总大小上限（字节），<= 0 表示不限制
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def path_for(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    def put(self, db, data: bytes) -> str:
+        """
+        存入一份测试数据（已存在时不重复写入）
+
+        Returns:
+            内容哈希
+        """
+        digest = blob_hash(data)
+        exists = fetch_one(db, "SELECT 1 AS found FROM test_blob WHERE blob_hash = :blob_hash", {"blob_hash": digest})
+        if exists:
+            # 刷新时间，collect_garbage 不会在题目引用它之前把它当作无引用数据清除
+            execute_update(db, "UPDATE test_blob SET created_at = :now WHERE blob_hash = :blob_hash",
+                           {"blob_hash": digest, "now": datetime.utcnow()})
+        else:
+            try:
+                execute_update(db, """
+                    INSERT INTO test_blob (blob_hash, data, size, created_at)
+                    VALUES (:blob_hash, :data, :size, :now)
+                """, {"blob_hash": digest, "data": data, "size": len(data), "now": datetime.utcnow()})
+            except IntegrityError:
+                # 相同内容被并发写入
+                db.rollback()
+        self._write(digest, data)
+        return digest
+
+    def local_path(self, db, digest: str) -> str:
+        """测试数据的本地文件路径，本地没有缓存时从 test_blob 取出"""
+        path = self.path_for(digest)
+        try:
+            # 更新 mtime，淘汰时按 mtime 判断最近使用
+            os.utime(path)
+        except FileNotFoundError:
+            row = fetch_one(db, "SELECT data FROM test_blob WHERE blob_hash = :blob_hash", {"blob_hash": digest})
+            if row is None:
+                raise ValueError(f"测试数据不存在: {digest}")
+            self._write(digest, bytes(row['data']))
+        return path
+
+    def read_text(self, db, digest: str) -> str:
+        with open(self.local_path(db, digest), 'rb') as f:
+            return f.read().decode('utf-8', errors='replace')
+
+    def _write(self, digest: str, data: bytes):
+        path = self.path_for(digest)
+        if os.path.exists(path):
+            return
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # 先写临时文件再改名，其他进程不会读到写了一半的文件
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp_')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        if self.max_bytes > 0:
+            self._enforce_limit()
+
+    def _enforce_limit(self):
+        """在跨进程文件锁下扫描缓存目录，超出容量时按 mtime 淘汰最久未使用的文件"""
+        with self._lock, open(os.path.join(self.root, LOCK_FILE_NAME), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            files = self._scan()
+            total = sum(size for _, _, size in files)
+            idle_before = time.time() - EVICT_MIN_IDLE_SECONDS
+            for mtime, path, size in files:
+                if total <= self.max_bytes or mtime > idle_before:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+
+    def _scan(self) -> List[Tuple[float, str, int]]:
+        """
+        扫描缓存目录，顺带清理异常退出遗留的临时文件
+
+        Returns:
+            [(mtime, 路径, 大小)]，最久未使用的在前
+        """
+        files = []
+        now = time.time()
+        for directory in os.listdir(self.root):
+            directory = os.path.join(self.root, directory)
+            if not os.path.isdir(directory):
+                continue
+            try:
+                names = os.listdir(directory)
+            except OSError:
+                continue
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    # 扫描期间被其他进程淘汰
+                    continue
+                if name.startswith('.tmp_'):
+                    # 其他进程可能正在写入，只清理足够旧的
+                    if now - stat.st_mtime > STALE_TMP_SECONDS:
+                        try:
+                            os.remove(path)
+                        except OSError:
+                            pass
+                    continue
+                files.append((stat.st_mtime, path, stat.st_size))
+        files.sort()
+        return files
+
+
+@lru_cache()
+def get_test_data_store() -> TestDataStore:
+    settings = get_settings()
+    root = settings.JUDGE_TEST_DATA_DIR or os.path.join(
+        settings.JUDGE_TEMP_DIR or tempfile.gettempdir(), 'codefuse_test_data'
+    )
+    return TestDataStore(root, settings.JUDGE_TEST_DATA_CACHE_MAX_MB * 1024 * 1024)
+
+
+def externalize_test_cases(db, test_cases: List[dict]) -> List[dict]:
+    """
+    把测试点中内联的输入和期望输出存入 test_blob，替换为 input_hash/output_hash 等元数据
+
+    调用前应已通过 with_output_digests 计算好 output_digest 和 data_hash。
+
+    Returns:
+        只含元数据的测试点列表（新列表，不修改传入的测试点）
+    """
+    store = get_test_data_store()
+    result = []
+    for tc in test_cases:
+        if not isinstance(tc, dict) or is_external(tc):
+            result.append(tc)
+            continue
+        tc = dict(tc)
+        input_bytes = (tc.pop('input_data', '') or '').encode('utf-8')
+        output_bytes = (tc.pop('output_data', '') or '').encode('utf-8')
+        tc['input_hash'] = store.put(db, input_bytes)
+        tc['output_hash'] = store.put(db, output_bytes)
+        tc['input_size'] = len(input_bytes)
+        tc['output_size'] = len(output_bytes)
+        result.append(tc)
+    return result
+
+
+def inline_test_cases(db, test_cases: List[dict]) -> List[dict]:
+    """
+    为接口返回取出测试点的输入和期望输出（input_data/output_data），旧数据原样返回
+
+    Returns:
+        新的测试点列表（不修改传入的测试点）
+    """
+    store = get_test_data_store()
+    result = []
+    for tc in test_cases or []:
+        if isinstance(tc, dict) and is_external(tc):
+            tc = dict(tc, input_data=store.read_text(db, tc['input_hash']),
+                      output_data=store.read_text(db, tc['output_hash']))
+        result.append(tc)
+    return result
+
+
+def test_case_files(db, test_case: dict) -> Tuple[Optional[str], Optional[str]]:
+    """
+    评测时使用的本地测试数据文件
+
+    Returns:
+        (输入文件, 期望输出文件)；测试点数据仍内联在 JSON 中时为 (None, None)
+    """
+    if not is_external(test_case):
+        return None, None
+    store = get_test_data_store()
+    return store.local_path(db, test_case['input_hash']), store.local_path(db, test_case['output_hash'])
+
+
+def migrate_all(db) -> int:
+    """
+    把全部题目中内联的测试数据迁移到 test_blob（测试数据内容不变，test_data_hash 和版本号不变）
+
+    Returns:
+        迁移的题目数
+    """
+    migrated = 0
+    for row in execute_query(db, "SELECT problem_id FROM problem WHERE test_cases IS NOT NULL"):
+        problem = fetch_one(db, "SELECT test_cases FROM problem WHERE problem_id = :problem_id",
+                            {"problem_id": row['problem_id']})
+        test_cases = problem['test_cases']
+        if isinstance(test_cases, str):
+            try:
+                test_cases = json.loads(test_cases) if test_cases else []
+            except ValueError:
+                continue
+        if not isinstance(test_cases, list) or all(not isinstance(tc, dict) or is_external(tc) for tc in test_cases):
+            continue
+        for tc in test_cases:
+            if isinstance(tc, dict) and not is_external(tc) and not (tc.get('output_digest') and tc.get('data_hash')):
+                with_output_digests([tc])
+        execute_update(db, "UPDATE problem SET test_cases = :test_cases WHERE problem_id = :problem_id", {
+            "test_cases": json.dumps(externalize_test_cases(db, test_cases)),
+            "problem_id": row['problem_id']
+        })
+        migrated += 1
+    return migrated
+
+
+def _referenced_blobs(db) -> Set[str]:
+    """所有题目测试点引用的数据哈希"""
+    referenced = set()
+    for row in execute_query(db, "SELECT problem_id FROM problem WHERE test_cases IS NOT NULL"):
+        problem = fetch_one(db, "SELECT test_cases FROM problem WHERE problem_id = :problem_id",
+                            {"problem_id": row['problem_id']})
+        test_cases = problem['test_cases'] if problem else None
+        if isinstance(test_cases, str):
+            try:
+                test_cases = json.loads(test_cases) if test_cases else []
+            except ValueError:
+                continue
+        for tc in test_cases or []:
+            if isinstance(tc, dict) and is_external(tc):
+                referenced.update(tc[key] for key in ('input_hash', 'output_hash') if tc.get(key))
+    return referenced
+
+
+def collect_garbage(db, grace_seconds: int = BLOB_GC_GRACE_SECONDS) -> int:
+    """
+    清除不再被任何题目引用的 test_blob（标记清除）
+
+    最近 grace_seconds 内写入的数据不清除：保存题目时先写入数据、再更新 test_cases。
+    旧评测结果中记录的哈希不算引用，数据清除后提交详情中不再显示对应测试点的输入和期望输出。
+    各评测主机本地缓存中的对应文件由容量淘汰清理。
+
+    Returns:
+        清除的 test_blob 数
+    """
+    referenced = _referenced_blobs(db)
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    garbage = [row['blob_hash'] for row in execute_query(
+        db, "SELECT blob_hash FROM test_blob WHERE created_at < :cutoff", {"cutoff": cutoff}
+    ) if row['blob_hash'] not in referenced]
+    for start in range(0, len(garbage), BLOB_GC_BATCH_SIZE):
+        batch = garbage[start:start + BLOB_GC_BATCH_SIZE]
+        placeholders = ', '.join(f':h{i}' for i in range(len(batch)))
+        # 条件里再检查一次时间：扫描期间被重新写入的数据保留
+        execute_update(db, f"DELETE FROM test_blob WHERE blob_hash IN ({placeholders}) AND created_at < :cutoff",
+                       dict({f'h{i}': digest for i, digest in enumerate(batch)}, cutoff=cutoff))
+    return len(garbage)
+
+
+if __name__ == '__main__':
+    from app.database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        print(f"已迁移 {migrate_all(session)} 道题目的测试数据")
+        print(f"已清除 {collect_garbage(session)} 份不再使用的测试数据")
+    finally:
+        session.close()
@@ -0,0 +1,94 @@
+/**
+ * 评测结果推送工具函数
+ * 通过 SSE（GET /api/submissions/events）接收评测进度和结果，替代逐个轮询提交详情
+ */
+
+import api from '../api'
+
+/**
+ * 订阅评测事件
+ * @param {Object} params - 订阅范围：{ submissionIds, userId, contestId }，至少指定一项
+ * @param {Function} onEvent - 收到 status/progress/verdict 事件时的回调，参数为事件对象（type 区分事件类型）
+ * @param {Function} onError - 连接失败时的回调（浏览器不支持 EventSource 时立即调用）
+ * @returns {Function} 取消订阅的函数
+ */
+export const subscribeJudgeEvents = ({ submissionIds = [], userId, contestId } = {}, onEvent, onError) => {
+  if (typeof window === 'undefined' || !window.EventSource) {
+    onError && onError(new Error('EventSource not supported'))
+    return () => {}
+  }
+  const query = new URLSearchParams()
+  submissionIds.forEach(id => query.append('submission_id', id))
+  if (userId !== undefined && userId !== null) query.append('user_id', userId)
+  if (contestId !== undefined && contestId !== null) query.append('contest_id', contestId)
+
+  const source = new EventSource(`${api.defaults.baseURL}/submissions/events?${query.toString()}`)
+  const handle = (e) => {
+    try {
+      onEvent && onEvent(JSON.parse(e.data))
+    } catch (err) {
+      console.warn('judge event parse error', err)
+    }
+  }
+  source.addEventListener('status', handle)
+  source.addEventListener('progress', handle)
+  source.addEventListener('verdict', handle)
+  source.onerror = () => {
+    // 服务端在订阅的提交全部出结果后主动结束连接，此时不再自动重连
+    source.close()
+    onError && onError(new Error('judge events connection closed'))
+  }
+  return () => source.close()
+}
+
+/**
+ * 等待一组提交全部出结果
+ * @param {Array<number>} ids - 提交 ID 列表
+ * @param {Function} onUpdate - 每个提交状态或评测进度更新时的回调
+ * @param {number} timeoutMs - 超时时间
+ * @returns {Promise<boolean>} 全部出结果为 true；超时或连接失败为 false（调用方可退回轮询）
+ */
+export const waitForVerdicts = (ids, onUpdate, timeoutMs = 120000) => {
+  return new Promise(resolve => {
+    const pending = new Set(ids)
+    let done = false
+    let unsubscribe = () => {}
+    const finish = (result) => {
+      if (done) return
+      done = true
+      clearTimeout(timer)
+      unsubscribe()
+      resolve(result)
+    }
+    const timer = setTimeout(() => finish(false), timeoutMs)
+    unsubscribe = subscribeJudgeEvents(
+      { submissionIds: ids },
+      (event) => {
+        onUpdate && onUpdate(event)
+        if (event.status && event.status !== 'judging') pending.delete(event.submission_id)
+        if (pending.size === 0) finish(true)
+      },
+      () => finish(pending.size === 0)
+    )
+  })
+}
+
+// 批量状态查询一次最多的提交数（与后端 STATUS_BATCH_LIMIT 一致）
+const STATUS_BATCH_LIMIT = 200
+
+/**
+ * 批量查询提交状态（GET /api/submissions/status）
+ * 只返回 status/exec_time/exec_memory/score；服务端带 ETag，未变化时浏览器按 304 复用缓存
+ * @param {Array<number>} ids - 提交 ID 列表
+ * @returns {Promise<Array<Object>>} 存在的提交的状态列表
+ */
+export const fetchSubmissionStatuses = async (ids) => {
+  const results = []
+  for (let i = 0; i < ids.length; i += STATUS_BATCH_LIMIT) {
+    const query = new URLSearchParams()
+    ids.slice(i, i + STATUS_BATCH_LIMIT).forEach(id => query.append('submission_id', id))
+    const response = await api.get(`/submissions/status?${query.toString()}`)
+    results.push(...response.data)
+  }
+  return results
+}